@@ -0,0 +1,107 @@
+# مقارنة محرك التصدير المباشر من مؤشر sqlite3 (CSV و XLSX) بمسار pandas السابق
+# من حيث الزمن وذروة الذاكرة عند 1000 و 10000 و 100000 صف.
+#
+# الاستعمال (من جذر المشروع):
+#     python benchmarks/bench_export.py
+#     python benchmarks/bench_export.py --rows 1000 10000 --json export_bench.json
+#
+# كل حالة تنفذ في عملية مستقلة حتى لا تتأثر ذروة الذاكرة بالحالات السابقة.
+# مسار pandas يحتاج pandas مثبتا (لم يعد من متطلبات التطبيق).
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from generators import fill_database
+
+CASES = ['native_xlsx', 'native_csv', 'pandas_xlsx', 'pandas_csv']
+
+def pandas_xlsx(conn, path):
+    # المسار السابق لـ export_to_excel
+    import pandas as pd
+    df = pd.read_sql_query(main.EXPORT_QUERY, conn)
+    df = df.rename(columns=main.ARABIC_COLUMNS)
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='البيانات')
+        writer.sheets['البيانات'].sheet_view.rightToLeft = True
+
+def pandas_csv(conn, path):
+    import pandas as pd
+    df = pd.read_sql_query(main.EXPORT_QUERY, conn)
+    df.rename(columns=main.ARABIC_COLUMNS).to_csv(path, index=False, encoding='utf-8-sig')
+
+def run_case(case, db_path, folder):
+    import sqlite3
+    export = {
+        'native_xlsx': main.stream_export_xlsx,
+        'native_csv': main.stream_export_csv,
+        'pandas_xlsx': pandas_xlsx,
+        'pandas_csv': pandas_csv,
+    }[case]
+    path = os.path.join(folder, case + ('.csv' if case.endswith('csv') else '.xlsx'))
+    # استيراد الوحدات المستعملة مسبقا حتى لا يحسب زمن الاستيراد
+    if case.startswith('pandas'):
+        import pandas
+    import openpyxl
+
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    export(conn, path)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    export(conn, path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    conn.close()
+    return {'seconds': round(seconds, 3), 'peak_mb': round(peak / 2 ** 20, 2),
+            'file_kb': round(os.path.getsize(path) / 1024, 1)}
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="مقارنة التصدير المباشر بمسار pandas")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES)
+    parser.add_argument('--json', help="ملف لحفظ النتائج")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # عملية فرعية: حالة واحدة
+        print(json.dumps(run_case(args.case, args.db, os.path.dirname(args.db))))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in args.rows:
+            db_path = os.path.join(folder, f"bench_{rows}.db")
+            fill_database(db_path, rows, seed=rows).conn.close()
+            for case in args.cases:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--case', case, '--db', db_path],
+                    capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    result = {'error': completed.stderr.strip().splitlines()[-1]}
+                else:
+                    result = json.loads(completed.stdout.strip().splitlines()[-1])
+                result.update(rows=rows, case=case)
+                results.append(result)
+                print(f"{rows:>7} {case:<12} " + (
+                    f"{result['seconds']:>8.3f} s {result['peak_mb']:>8.2f} MB {result['file_kb']:>10.1f} KB"
+                    if 'error' not in result else result['error']
+                ))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump(results, output, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main_cli()
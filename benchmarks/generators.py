@@ -0,0 +1,73 @@
+# مولدات بيانات اصطناعية للمتمدرسين: أسماء عربية واقعية وقوائم الدوائر الحقيقية من main.py
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+LAST_NAMES = [
+    "بن علي", "بوزيد", "مسعودي", "حمادي", "بلقاسم", "عيساوي", "زروال", "سعيدي", "بن عيسى", "قاسمي",
+    "بوعلام", "شريف", "بن يحيى", "مرابط", "بوخالفة", "لعمامرة", "دراجي", "خليفي", "بن الشيخ", "عثماني",
+    "بوشارب", "رحماني", "مزياني", "بن عمار", "طالبي", "بوقرة", "حداد", "منصوري", "عبدلي", "فرحات",
+]
+MALE_NAMES = [
+    "محمد", "أحمد", "عبد الحق", "يوسف", "إبراهيم", "عبد القادر", "مصطفى", "علي", "الطاهر", "رابح",
+    "السعيد", "عمار", "صالح", "مسعود", "عبد الرحمن", "الهادي", "لخضر", "بلقاسم", "إسماعيل", "موسى",
+]
+FEMALE_NAMES = [
+    "فاطمة", "خديجة", "مريم", "زينب", "عائشة", "حليمة", "يمينة", "الزهرة", "سعاد", "نادية",
+    "فتيحة", "مليكة", "صليحة", "رقية", "حورية", "جميلة", "وردة", "نعيمة", "الطاوس", "زهية",
+]
+PLACES = ["باتنة", "آريس", "بريكة", "نقاوس", "مروانة", "عين التوتة", "تازولت", "تيمقاد", "الشمرة", "منعة"]
+
+def spelling_variant(name, rng):
+    # كتابة أخرى لنفس الاسم كما تحدث عند التسجيل المكرر (همزة، تاء مربوطة، تطويل)
+    variants = [
+        name.replace('أ', 'ا').replace('إ', 'ا'),
+        name.replace('ة', 'ه'),
+        name.replace('ي', 'ى') if name.endswith('ي') else name + 'ـ',
+        name.replace(' ', ''),
+    ]
+    return rng.choice(variants)
+
+def learner_rows(count, seed=0, group_size=20, duplicate_ratio=0.0, start_contract=1):
+    # صفوف بترتيب STUDENT_COLUMNS؛ بيانات المعلم والمؤسسة ثابتة لكل فوج كما في الإدخال الفعلي
+    # duplicate_ratio: نسبة المتمدرسين المعاد تسجيلهم بكتابة مختلفة للأسماء
+    rng = random.Random(seed)
+    context = None
+    previous = []
+    for index in range(count):
+        if index % group_size == 0:
+            district = rng.choice(main.DISTRICTS)
+            context = (
+                f"{rng.choice(MALE_NAMES)} {rng.choice(LAST_NAMES)}",
+                rng.choice(LAST_NAMES), rng.choice(MALE_NAMES + FEMALE_NAMES),
+                district, district.replace('ـ', '').strip(), f"مدرسة {rng.choice(LAST_NAMES)} {rng.randint(1, 30)}",
+                rng.choice(main.CHAPTERS), rng.choice(main.GROUPS), rng.choice(main.LEVELS),
+            )
+        if previous and rng.random() < duplicate_ratio:
+            original = rng.choice(previous)
+            last_name = spelling_variant(original[0], rng)
+            first_name = spelling_variant(original[1], rng)
+            father_name, birth_date, gender = original[2], original[3], original[4]
+        else:
+            gender = rng.choice(main.GENDERS)
+            last_name = rng.choice(LAST_NAMES)
+            first_name = rng.choice(MALE_NAMES if gender == main.GENDERS[0] else FEMALE_NAMES)
+            father_name = rng.choice(MALE_NAMES)
+            year = rng.randint(1950, 2008)
+            birth_date = str(year) if rng.random() < 0.3 else f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            if len(previous) < 10000:
+                previous.append((last_name, first_name, father_name, birth_date, gender))
+        yield context + (
+            last_name, first_name, birth_date, rng.choice(PLACES), str(start_contract + index),
+            father_name, rng.choice(LAST_NAMES), rng.choice(FEMALE_NAMES), gender,
+            main.calculate_age(birth_date),
+        )
+
+def fill_database(path, rows, seed=0, duplicate_ratio=0.0):
+    db = main.Database(path)
+    db.insert_students(learner_rows(rows, seed=seed, duplicate_ratio=duplicate_ratio))
+    return db
@@ -0,0 +1,202 @@
+# مجموعة قياس أداء دون واجهة Flet: الإدراج، التصدير، الإحصائيات، البحث، وبناء مرفق البريد
+# عند أحجام متزايدة لقاعدة البيانات، مع حفظ النتائج في ملف JSON للمقارنة بين التشغيلات.
+#
+# الاستعمال (من جذر المشروع):
+#     python benchmarks/run_benchmarks.py
+#     python benchmarks/run_benchmarks.py --sizes 1000 10000 --output before.json
+#     python benchmarks/run_benchmarks.py --compare before.json
+import os
+import sys
+import json
+import time
+import sqlite3
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from generators import learner_rows
+
+class FakeSMTP:
+    # خادم SMTP وهمي: يستقبل الرسالة (كاملة أو متدفقة بعد DATA) دون شبكة
+    def __init__(self, host=None, port=None, timeout=None):
+        self.received = 0
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def noop(self):
+        return (250, b'OK')
+
+    def sendmail(self, sender, recipients, message):
+        self.received += len(message)
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, sender):
+        return (250, b'OK')
+
+    def rcpt(self, recipient):
+        return (250, b'OK')
+
+    def putcmd(self, command):
+        # DATA: الرد 354 قبل نص الرسالة ثم 250 بعد نهايته
+        self.replies = [(354, b'Go ahead'), (250, b'OK')]
+
+    def getreply(self):
+        return self.replies.pop(0)
+
+    def send(self, data):
+        self.received += len(data)
+
+    def rset(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+def measure(func):
+    # الزمن في استدعاء عادي، ثم ذروة الذاكرة في استدعاء ثان تحت tracemalloc (الذي يبطئ التنفيذ)
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {'seconds': round(seconds, 4), 'peak_mb': round(peak / 2 ** 20, 2)}
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+def bench_size(folder, size, save_sample):
+    results = {}
+    db = main.Database(os.path.join(folder, f"bench_{size}.db"))
+
+    # الإدراج المجمع (الاستيراد)
+    _, seconds = timed(lambda: db.insert_students(learner_rows(size, seed=size, duplicate_ratio=0.02)))
+    results['bulk_insert'] = {'seconds': round(seconds, 4), 'rows_per_second': round(size / seconds)}
+
+    # الحفظ فردا فردا كما في save_student (معاملة لكل متمدرس)
+    sample = list(learner_rows(save_sample, seed=size + 1, start_contract=size + 1))
+    _, seconds = timed(lambda: [db.insert_student(values) for values in sample])
+    results['single_save'] = {'seconds': round(seconds, 4), 'rows_per_second': round(save_sample / seconds),
+                              'ms_per_save': round(seconds / save_sample * 1000, 3)}
+    total = size + save_sample
+
+    reader = db.open_reader()
+    try:
+        for name, export in [
+            ('export_xlsx', lambda: main.stream_export_xlsx(reader, os.path.join(folder, 'export.xlsx'))),
+            ('export_csv', lambda: main.stream_export_csv(reader, os.path.join(folder, 'export.csv'))),
+            ('export_delta_zip', lambda: main.stream_export_csv_zip(
+                reader, os.path.join(folder, 'delta.zip'), 'delta.csv')),
+        ]:
+            count, metrics = measure(export)
+            metrics['rows'] = count
+            results[name] = metrics
+
+        # بناء المرفق والرسالة وإرسالها إلى خادم وهمي (دون واجهة)
+        service = main.MailService('bench@example.com', 'x', smtp_class=FakeSMTP)
+        until = reader.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+
+        def attachment():
+            current = os.getcwd()
+            os.chdir(folder)
+            try:
+                attachment, filename, count = main.build_attachment(reader, False, 0, until)
+                try:
+                    msg = main.build_message('bench@example.com', ['to@example.com'], attachment, filename,
+                                             count, False)
+                    service.send(msg, ['to@example.com'])
+                    return attachment.seek(0, os.SEEK_END)
+                finally:
+                    attachment.close()
+            finally:
+                os.chdir(current)
+
+        size_bytes, metrics = measure(attachment)
+        metrics['attachment_kb'] = round(size_bytes / 1024, 1)
+        results['email_attachment'] = metrics
+    finally:
+        reader.close()
+
+    # الاستعلامات اليومية
+    _, seconds = timed(db.statistics, repeat=5)
+    results['statistics'] = {'seconds': round(seconds, 4)}
+    _, seconds = timed(lambda: db.page_students(total // 2, None, 50), repeat=20)
+    results['list_page'] = {'seconds': round(seconds, 6)}
+    _, seconds = timed(lambda: db.page_students(0, "بن", 50), repeat=20)
+    results['list_search'] = {'seconds': round(seconds, 6)}
+    _, seconds = timed(lambda: db.find_duplicates("بن علي", "محمد", "أحمد", "1970"), repeat=20)
+    results['duplicate_check'] = {'seconds': round(seconds, 6)}
+    _, seconds = timed(lambda: db.find_students(district=main.DISTRICTS[0], limit=50), repeat=20)
+    results['filtered_query'] = {'seconds': round(seconds, 6)}
+    _, seconds = timed(lambda: main.validator.report(db.conn), repeat=3)
+    results['validation_report'] = {'seconds': round(seconds, 4)}
+
+    db.conn.close()
+    return results
+
+def compare(previous, current):
+    # نسبة التغير في الزمن لكل مقياس مقارنة بتشغيل سابق
+    old = {(run['size'], name): metrics for run in previous['runs'] for name, metrics in run['results'].items()}
+    for run in current['runs']:
+        for name, metrics in run['results'].items():
+            before = old.get((run['size'], name))
+            if before and before.get('seconds'):
+                ratio = metrics['seconds'] / before['seconds']
+                flag = "  <-- أبطأ" if ratio > 1.2 else ""
+                print(f"{run['size']:>8} {name:<18} {before['seconds']:>10.4f} -> {metrics['seconds']:>10.4f} "
+                      f"({ratio:.2f}x){flag}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="قياس أداء مسارات الإدخال والتصدير")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--save-sample', type=int, default=200, help="عدد عمليات الحفظ الفردية المقيسة")
+    parser.add_argument('--output', help="ملف JSON للنتائج (افتراضيا benchmarks/results/<الوقت>.json)")
+    parser.add_argument('--compare', help="ملف نتائج سابق للمقارنة")
+    args = parser.parse_args()
+
+    report = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            results = bench_size(folder, size, args.save_sample)
+            report['runs'].append({'size': size, 'results': results})
+            for name, metrics in results.items():
+                print(f"{size:>8} {name:<18} " + " ".join(f"{key}={value}" for key, value in metrics.items()))
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, ensure_ascii=False, indent=2)
+    print(f"النتائج: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            compare(json.load(handle), report)
+
+if __name__ == '__main__':
+    main_cli()
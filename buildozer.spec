@@ -22,7 +22,7 @@ source.include_patterns = assets/*
 version = 1.0
 
 # (list) Application requirements
-requirements = python3,flet==0.10.0,pandas==2.0.0,openpyxl==3.0.0,kivy,pillow
+requirements = python3,flet==0.10.0,openpyxl==3.0.0,kivy,pillow
 
 # (str) Presplash of the application
 presplash.filename = logo.gif
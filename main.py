@@ -1,18 +1,944 @@
+import time
+# بداية قياس زمن الإقلاع، قبل أي استيراد آخر
+APP_START = time.perf_counter()
+
 import flet as ft
 import sqlite3
-import pandas as pd
-from datetime import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
-import asyncio
+from datetime import datetime, timedelta
+import io
+import os
+import re
+import csv
+import json
+import hashlib
+import hmac
+import secrets
+import zipfile
+import tempfile
+import threading
+from collections import deque
+from itertools import islice, chain, groupby
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+# نهاية استيراد الوحدات، تسجل في تقرير الإقلاع كمرحلة imports
+IMPORTS_DONE = time.perf_counter()
+# الوحدات الثقيلة (pandas، openpyxl، smtplib، email.mime) تستورد عند أول استعمال
+# لميزات التصدير والبريد فقط، حتى لا تبطئ فتح التطبيق
+
+# تعريف أسماء الأعمدة بالعربية
+ARABIC_COLUMNS = {
+    'coordinator': 'المنسق',
+    'teacher_name': 'لقب المعلم',
+    'teacher_first_name': 'اسم المعلم',
+    'district': 'الدائرة',
+    'municipality': 'البلدية',
+    'school': 'مؤسسة التدريس',
+    'chapter': 'الفصل',
+    'group_number': 'الفوج',
+    'level': 'المستوى',
+    'last_name': 'اللقب',
+    'first_name': 'الاسم',
+    'birth_date': 'تاريخ الميلاد',
+    'birth_place': 'مكان الميلاد',
+    'contract_number': 'رقم العقد',
+    'father_name': 'اسم الأب',
+    'mother_last_name': 'لقب الأم',
+    'mother_first_name': 'اسم الأم',
+    'gender': 'الجنس',
+    'age': 'العمر'
+}
+
+# القوائم المنسدلة
+DISTRICTS = ["عين جاســر", "عين التوتـة", "آريــس", "بريكـة", "باتنـة", "بوزينـة", "الشمــرة", 
+             "الجـزار", "المعــذر", "إشمـول", "منعـــة", "مروانـة", "نقـاوس", "أولاد سي سليمان", 
+             "رأس العيـون", "سقـانــة", "سريانــة", "تازولــت", "ثنيـة العـابـد", "تيمقــاد", "تكـوت"]
+CHAPTERS = ["حضري", "شبه حضري", "ريفي"]
+GROUPS = ["1", "2"]
+LEVELS = ["الأول", "الثاني", "الثالث"]
+GENDERS = ["ذكر", "أنثى"]
+
+# الجداول المرجعية: (النوع، العمود النصي في جدول المتمدرسين، النوع الأب في القوائم المتتالية)
+# الدائرة والفصل والفوج والمستوى والجنس تبدأ بالقوائم أعلاه، والبلديات والمؤسسات تتعلم من البيانات المدخلة
+# gender آخر نوع يحل، فعموده gender_id الفارغ يعني أن مفاتيح السجل لم تحسب بعد
+REFERENCE_KINDS = [
+    ('district', 'district', None),
+    ('municipality', 'municipality', 'district'),
+    ('school', 'school', 'municipality'),
+    ('chapter', 'chapter', None),
+    ('group', 'group_number', None),
+    ('level', 'level', None),
+    ('gender', 'gender', None),
+]
+REFERENCE_SEEDS = {
+    'district': DISTRICTS,
+    'chapter': CHAPTERS,
+    'group': GROUPS,
+    'level': LEVELS,
+    'gender': GENDERS,
+}
+
+# ترتيب أعمدة جدول المتمدرسين عند الإدراج
+STUDENT_COLUMNS = list(ARABIC_COLUMNS)
+
+# عدد الصفوف المقروءة من قاعدة البيانات في كل دفعة أثناء التصدير
+EXPORT_CHUNK_SIZE = 1000
+
+# أعمدة المزامنة بين الأجهزة: معرف عالمي ثابت لكل سجل، الجهاز الذي أنشأه، ووقت آخر تعديل
+SYNC_COLUMNS = {
+    'uuid': 'المعرف الموحد',
+    'device_id': 'معرف الجهاز',
+    'updated_at': 'آخر تعديل',
+}
+
+# عناوين كل الأعمدة في ملفات التصدير والاستيراد
+COLUMN_TITLES = {**ARABIC_COLUMNS, **SYNC_COLUMNS}
+
+# أعمدة ملفات التصدير
+EXPORT_COLUMNS = ['id'] + STUDENT_COLUMNS + list(SYNC_COLUMNS)
+
+# طابع زمني بدقة الميلي ثانية يستعمل لتتبع آخر تعديل على كل سجل
+NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+# رقم التغيير المحلي التالي: يزيد مع كل إدراج أو تعديل على هذا الجهاز، بما فيها الصفوف المدمجة
+# التي تحتفظ بـ updated_at جهازها الأصلي. العداد محفوظ في app_state ولا ينقص بحذف السجلات (الأرشفة)،
+# فلا تعود أرقام السجلات الجديدة تحت علامات الإرسال
+CHANGE_COUNTER_SQL = "(SELECT CAST(value AS INTEGER) FROM app_state WHERE key = 'change_seq')"
+
+# معرف عشوائي من 128 بت يولد داخل SQLite نفسه
+NEW_UUID_SQL = "lower(hex(randomblob(16)))"
+DEVICE_ID_SQL = "(SELECT value FROM app_state WHERE key = 'device_id')"
+
+# العمر محسوب عند الطلب من تاريخ الميلاد الموحد (birth_iso) في مرور واحد على الجدول،
+# فيبقى صحيحا دون إعادة كتابة الصفوف كل سنة؛ العمود age المخزن احتياط للتواريخ غير الصالحة
+AGE_SQL = '''CASE
+    WHEN length(birth_iso) = 4 THEN CAST(strftime('%Y', 'now', 'localtime') AS INTEGER) - CAST(birth_iso AS INTEGER)
+    WHEN length(birth_iso) = 10 THEN CAST(strftime('%Y', 'now', 'localtime') AS INTEGER)
+        - CAST(substr(birth_iso, 1, 4) AS INTEGER)
+        - (strftime('%m-%d', 'now', 'localtime') < substr(birth_iso, 6))
+    ELSE NULLIF(age, '')
+END'''
+
+EXPORT_FIELDS = ', '.join(f"{AGE_SQL} AS age" if column == 'age' else column for column in EXPORT_COLUMNS)
+EXPORT_QUERY = f"SELECT {EXPORT_FIELDS} FROM students"
+
+# الفئات العمرية في الإحصائيات
+AGE_BAND_SQL = '''CASE
+    WHEN age IS NULL OR age <= 0 THEN 'غير محدد'
+    WHEN age < 20 THEN 'أقل من 20'
+    WHEN age < 30 THEN '20 - 29'
+    WHEN age < 40 THEN '30 - 39'
+    WHEN age < 50 THEN '40 - 49'
+    WHEN age < 60 THEN '50 - 59'
+    ELSE '60 فأكثر'
+END'''
+
+# الحملة السنوية تبدأ في سبتمبر: حملة 2024 من سبتمبر 2024 إلى أوت 2025
+CAMPAIGN_START_MONTH = 9
+
+def campaign_sql(timestamp):
+    return f"CAST(strftime('%Y', {timestamp}, '-{CAMPAIGN_START_MONTH - 1} months') AS INTEGER)"
+
+def current_campaign():
+    today = datetime.now()
+    return today.year if today.month >= CAMPAIGN_START_MONTH else today.year - 1
+
+# أرشيف الحملات المنتهية: ملفات Parquet مقسمة حسب الحملة ثم الدائرة (campaign=2024/district_id=3/)
+ARCHIVE_DIR = 'archive'
+ARCHIVE_PARTITIONS = ['campaign', 'district_id']
+ARCHIVE_INTEGER_COLUMNS = {'id', 'age', 'district_id', 'campaign'}
+ARCHIVE_COLUMNS = EXPORT_COLUMNS + ARCHIVE_PARTITIONS
+# العمر والفئة العمرية يجمدان كما كانا عند الأرشفة
+ARCHIVE_QUERY = "SELECT *, {} AS age_band FROM (SELECT {} FROM students WHERE campaign = ? AND id <= ?)".format(
+    AGE_BAND_SQL, ', '.join(f"CAST({AGE_SQL} AS INTEGER) AS age" if column == 'age' else column
+                            for column in ARCHIVE_COLUMNS)
+)
+
+# كلمات المرور: scrypt بملح عشوائي؛ معامل الكلفة n يعاير مرة لكل جهاز حتى يبقى التحقق في حدود
+# SCRYPT_TARGET ثانية، بين حد أدنى للأمان وحد أقصى للذاكرة (128 * n * r بايت) على الهواتف
+SCRYPT_TARGET = 0.15
+SCRYPT_MIN_N = 2 ** 14
+SCRYPT_MAX_N = 2 ** 16
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# مدة بقاء الجلسة على الجهاز قبل طلب كلمة المرور من جديد
+SESSION_TTL = timedelta(hours=12)
+
+# المستخدم الحالي على الجهاز، يسند إلى كل سجل جديد
+OPERATOR_ID_SQL = "(SELECT CAST(value AS INTEGER) FROM app_state WHERE key = 'operator_id')"
+
+# عدد الصفوف المدرجة في كل استدعاء executemany أثناء الاستيراد
+IMPORT_BATCH_SIZE = 5000
+
+# المرفقات تبنى في ملف مؤقت يبقى في الذاكرة حتى هذا الحجم ثم ينتقل إلى القرص
+ATTACHMENT_SPOOL_SIZE = 1024 * 1024
+
+# صندوق الصادر: أول تأخير لإعادة المحاولة بعد انقطاع الشبكة (يتضاعف مع كل محاولة) وحده الأقصى، بالثواني
+OUTBOX_BACKOFF = 30
+OUTBOX_MAX_DELAY = 30 * 60
+
+# النسخ الاحتياطي: مجلد النسخ المضغوطة، عدد النسخ المحتفظ بها، والفاصل بين نسختين تلقائيتين (بالثواني)
+BACKUP_DIR = 'backups'
+BACKUP_PREFIX = 'eleves-'
+BACKUP_KEEP = 10
+BACKUP_INTERVAL = 6 * 3600
+BACKUP_STARTUP_DELAY = 60
+
+# أقدم سنة ميلاد مقبولة
+MIN_BIRTH_YEAR = 1900
+
+# صيغ تاريخ الميلاد المقبولة في الإدخال والاستيراد، إضافة إلى السنة وحدها
+BIRTH_DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S']
+
+@lru_cache(maxsize=4096)
+def _parse_birth_text(text):
+    # تحليل الصيغة وحده، دون مقارنة بتاريخ اليوم حتى تبقى نتيجته المخزنة صالحة بعد تغير السنة؛
+    # التخزين المؤقت يجعل تكرار نفس التواريخ (الاستيراد، الحساب في SQL) دون كلفة تحليل
+    if len(text) == 4 and text.isdigit():
+        return text
+    for fmt in BIRTH_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+def parse_birth_date(birth_date):
+    # صيغة موحدة: 'YYYY' للسنة وحدها أو 'YYYY-MM-DD'، و None للقيمة الفارغة أو غير الصالحة
+    # (قبل MIN_BIRTH_YEAR أو بعد اليوم)
+    birth = _parse_birth_text(str(birth_date).strip() if birth_date is not None else '')
+    if birth is None or int(birth[:4]) < MIN_BIRTH_YEAR:
+        return None
+    # مقارنة نصية بنفس طول الصيغة: السنة بالسنة، والتاريخ الكامل بالتاريخ
+    return birth if birth <= datetime.now().strftime('%Y-%m-%d')[:len(birth)] else None
+
+def calculate_age(birth_date):
+    birth = parse_birth_date(birth_date)
+    if birth is None:
+        return None
+    today = datetime.now()
+    if len(birth) == 4:  # سنة فقط
+        return today.year - int(birth)
+    return today.year - int(birth[:4]) - (today.strftime('%m-%d') < birth[5:])
+
+def scrypt_digest(password, salt, n, r=SCRYPT_R, p=SCRYPT_P):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=32)
+
+def calibrate_scrypt(target=SCRYPT_TARGET):
+    # أكبر n (قوة 2) يبقى زمن حسابه على هذا الجهاز دون target
+    n = SCRYPT_MIN_N
+    while n < SCRYPT_MAX_N:
+        start = time.perf_counter()
+        scrypt_digest('calibration', b'0' * 16, n)
+        if (time.perf_counter() - start) * 2 > target:
+            break
+        n *= 2
+    return n
+
+def hash_password(password, n):
+    # الصيغة المخزنة: scrypt$n$r$p$salt$hash (بالست عشري)، فتبقى المعاملات مع كل كلمة مرور
+    salt = secrets.token_bytes(16)
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${scrypt_digest(password, salt, n).hex()}"
+
+@lru_cache(maxsize=None)
+def dummy_password_hash(n):
+    # بصمة لا تطابق أي كلمة مرور، يتحقق منها عند اسم مستخدم غير موجود حتى يستغرق الرفض نفس الزمن
+    return hash_password(secrets.token_hex(16), n)
+
+def verify_password(password, stored):
+    try:
+        scheme, n, r, p, salt, digest = stored.split('$')
+        n, r, p = int(n), int(r), int(p)
+    except (AttributeError, ValueError):
+        return False
+    if scheme != 'scrypt':
+        return False
+    return hmac.compare_digest(scrypt_digest(password, bytes.fromhex(salt), n, r, p).hex(), digest)
+
+# الحركات والتطويل، وتوحيد أشكال الحروف التي تكتب بطرق مختلفة في الأسماء
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u0640]')
+ARABIC_LETTER_FOLDS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه',
+})
+NON_LETTERS = re.compile(r'[\W_]+')
+BIRTH_YEAR = re.compile(r'(\d{4})')
+
+def normalize_arabic(text):
+    # صيغة موحدة للمقارنة: دون حركات أو تطويل أو مسافات، مع توحيد الهمزات والتاء المربوطة والألف المقصورة
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS.sub('', str(text)).translate(ARABIC_LETTER_FOLDS)
+    return NON_LETTERS.sub('', text).lower()
+
+def student_name_key(last_name, first_name, father_name, birth_date):
+    # مفتاح كشف التكرار: الأسماء الموحدة وسنة الميلاد
+    last_name = normalize_arabic(last_name)
+    first_name = normalize_arabic(first_name)
+    if not last_name and not first_name:
+        return None
+    year = BIRTH_YEAR.search(str(birth_date or ''))
+    return '|'.join([last_name, first_name, normalize_arabic(father_name), year.group(1) if year else ''])
+
+# قواعد التحقق من بيانات المتمدرسين: (العمود، نوع القاعدة، رسالة الخطأ)
+VALIDATION_RULES = [
+    ('district', 'required', "الدائرة إجبارية"),
+    ('level', 'required', "المستوى إجباري"),
+    ('last_name', 'required', "اللقب إجباري"),
+    ('last_name', 'name', "اللقب لا يحتوي على أرقام"),
+    ('first_name', 'required', "الاسم إجباري"),
+    ('first_name', 'name', "الاسم لا يحتوي على أرقام"),
+    ('birth_date', 'required', "تاريخ الميلاد إجباري"),
+    ('birth_date', 'date', "تاريخ الميلاد غير صالح، استعمل السنة أو الصيغة يوم/شهر/سنة"),
+    ('contract_number', 'digits', "رقم العقد يتكون من أرقام فقط"),
+    ('father_name', 'name', "اسم الأب لا يحتوي على أرقام"),
+    ('mother_last_name', 'name', "لقب الأم لا يحتوي على أرقام"),
+    ('mother_first_name', 'name', "اسم الأم لا يحتوي على أرقام"),
+    ('gender', 'required', "الجنس إجباري"),
+]
+
+DIGITS = re.compile(r'[0-9]+')
+HAS_DIGIT = re.compile(r'[0-9٠-٩]')
+
+# كل نوع قاعدة: دالة على القيمة المنظفة (للتحقق الفوري أثناء الكتابة) وشرط SQL يصف الخطأ في العمود
+# {column} (للتحقق الدفعي على كامل الجدول)؛ القيم الفارغة لا تفحصها إلا required.
+# الشروط مكتوبة بأقل عدد من الدوال لكل صف لأنها تقيم على كل الجدول.
+# TRIM يحذف نفس المسافات التي يحذفها str.strip في التحقق الفوري (الجدولة والأسطر والمسافة غير المنقسمة)
+TRIM_SQL = "TRIM({column}, char(32, 9, 10, 11, 12, 13, 160))"
+VALIDATION_KINDS = {
+    'required': (bool, f"COALESCE({TRIM_SQL}, '') = ''"),
+    'name': (lambda value: not HAS_DIGIT.search(value), "{column} GLOB '*[0-9٠-٩]*'"),
+    'digits': (DIGITS.fullmatch, f"{TRIM_SQL} GLOB '*[^0-9]*'"),
+    # يعتمد على العمود المشتق birth_iso (فارغ للتواريخ غير الصالحة) بدل إعادة التحليل لكل صف
+    'date': (parse_birth_date, f"birth_iso = '' AND {TRIM_SQL} != ''"),
+}
+
+class Validator:
+    # محرك تحقق تصريحي: القواعد تترجم مرة واحدة عند الإنشاء إلى دوال لكل حقل
+    # وإلى استعلام واحد يعد أخطاء كل القواعد في مرور واحد على الجدول
+    def __init__(self, rules=VALIDATION_RULES):
+        self.rules = list(rules)
+        self.checks = {}
+        self.conditions = []
+        for column, kind, message in self.rules:
+            check, condition = VALIDATION_KINDS[kind]
+            self.checks.setdefault(column, []).append((check, kind == 'required', message))
+            self.conditions.append(condition.format(column=column))
+        self.count_query = "SELECT {} FROM students".format(
+            ', '.join(f"COALESCE(SUM({condition}), 0)" for condition in self.conditions)
+        )
+
+    def check(self, column, value):
+        # رسالة أول قاعدة مخالفة أو None
+        value = '' if value is None else str(value).strip()
+        for check, required, message in self.checks.get(column, ()):
+            if (value or required) and not check(value):
+                return message
+        return None
+
+    def check_all(self, values):
+        errors = {}
+        for column in self.checks:
+            message = self.check(column, values.get(column))
+            if message:
+                errors[column] = message
+        return errors
+
+    def report(self, conn, samples=5):
+        # [(العمود، الرسالة، عدد الصفوف المخالفة، أمثلة من المعرفات)] للقواعد المخالفة فقط
+        counts = conn.execute(self.count_query).fetchone()
+        report = []
+        for (column, kind, message), condition, count in zip(self.rules, self.conditions, counts):
+            if count:
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM students WHERE {condition} ORDER BY id LIMIT ?", (samples,)
+                )]
+                report.append((column, message, count, ids))
+        return report
+
+    def errors(self, conn):
+        # كل مخالفة في صف مستقل لتقرير الأخطاء الكامل
+        for (column, kind, message), condition in zip(self.rules, self.conditions):
+            for student_id, last_name, first_name, value in conn.execute(
+                f"SELECT id, last_name, first_name, {column} FROM students WHERE {condition} ORDER BY id"
+            ):
+                yield student_id, last_name, first_name, COLUMN_TITLES[column], value, message
+
+validator = Validator()
+
+def write_validation_report(conn, path):
+    # تقرير الأخطاء بصيغة CSV يفتح في Excel
+    with open(path, 'w', newline='', encoding='utf-8-sig') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['id', 'اللقب', 'الاسم', 'الحقل', 'القيمة', 'الخطأ'])
+        count = 0
+        for row in validator.errors(conn):
+            writer.writerow(row)
+            count += 1
+    return count
+
+def _roster_value(value):
+    # توحيد قيم الخلايا المقروءة من Excel قبل تخزينها في أعمدة نصية
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    # الأرقام (رقم العقد، الفوج...) نصوص كما في ملفات CSV
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+def read_roster(path, columns=STUDENT_COLUMNS):
+    # قراءة قائمة متمدرسين من ملف Excel أو CSV (أو CSV داخل zip) بنفس عناوين التصدير العربية
+    # وإرجاع صفوف بترتيب columns دون تحميل الملف كاملا في الذاكرة
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            name = next((name for name in archive.namelist() if name.lower().endswith('.csv')), None)
+            if name is None:
+                raise ValueError("الأرشيف لا يحتوي على ملف CSV")
+            with io.TextIOWrapper(archive.open(name), encoding='utf-8-sig', newline='') as handle:
+                yield from _roster_rows(csv.reader(handle), columns)
+    elif path.lower().endswith('.csv'):
+        handle = open(path, newline='', encoding='utf-8-sig')
+        try:
+            sample = handle.read(4096)
+            handle.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            rows = csv.reader(handle, dialect)
+            yield from _roster_rows(rows, columns)
+        finally:
+            handle.close()
+    else:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook['البيانات'] if 'البيانات' in workbook.sheetnames else workbook.worksheets[0]
+            yield from _roster_rows(sheet.iter_rows(values_only=True), columns)
+        finally:
+            workbook.close()
+
+def _roster_rows(rows, columns):
+    header = next(rows, None)
+    if header is None:
+        return
+    by_header = {title: column for column, title in COLUMN_TITLES.items()}
+    positions = {}
+    for index, title in enumerate(header):
+        title = str(title).strip() if title is not None else ''
+        column = by_header.get(title, title)
+        if column in columns:
+            positions[column] = index
+    if not positions:
+        raise ValueError("الملف لا يحتوي على عناوين أعمدة معروفة")
+    age_index = columns.index('age')
+    birth_index = columns.index('birth_date')
+    for row in rows:
+        record = [None] * len(columns)
+        for position, column in enumerate(columns):
+            index = positions.get(column)
+            if index is not None and index < len(row):
+                record[position] = _roster_value(row[index])
+        if not any(record):
+            continue
+        # تاريخ الميلاد يخزن بالصيغة الموحدة كما في الإدخال اليدوي؛ غير الصالح يبقى كما هو ليظهر في تقرير الأخطاء
+        if record[birth_index]:
+            record[birth_index] = parse_birth_date(record[birth_index]) or record[birth_index]
+            if record[age_index] is None:
+                record[age_index] = calculate_age(record[birth_index])
+        yield tuple(record)
+
+def skip_known_rows(rows, known):
+    # الصفوف دون رقم عقد لا يحميها فهرس رقم العقد الفريد: تتجاهل إذا كان (name_key، تاريخ الميلاد)
+    # معروفا في القاعدة أو سبق في نفس الملف؛ known تضاف إليه المفاتيح الجديدة
+    contract_index = STUDENT_COLUMNS.index('contract_number')
+    birth_index = STUDENT_COLUMNS.index('birth_date')
+    names = [STUDENT_COLUMNS.index(column) for column in ('last_name', 'first_name', 'father_name', 'birth_date')]
+    for row in rows:
+        if not row[contract_index]:
+            key = student_name_key(*[row[index] for index in names])
+            if key is not None:
+                if (key, row[birth_index]) in known:
+                    continue
+                known.add((key, row[birth_index]))
+        yield row
+
+def stream_export_xlsx(conn, path, query=EXPORT_QUERY, params=(), chunk_size=EXPORT_CHUNK_SIZE,
+                       progress=None):
+    # تصدير متدفق: قراءة المؤشر على دفعات ثابتة الحجم وكتابتها مباشرة في مصنف للكتابة فقط
+    # حتى يبقى استهلاك الذاكرة ثابتا مهما كان عدد الصفوف
+    # progress: دالة اختيارية تستدعى بعد كل دفعة بعدد الصفوف المكتوبة
+    from openpyxl import Workbook
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('البيانات')
+    # تعيين اتجاه الورقة من اليمين إلى اليسار
+    sheet.sheet_view.rightToLeft = True
+    sheet.append([COLUMN_TITLES.get(column[0], column[0]) for column in cursor.description])
+    count = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            sheet.append(row)
+        count += len(rows)
+        if progress:
+            progress(count)
+    workbook.save(path)
+    return count
+
+def _write_csv(cursor, text, chunk_size, progress=None):
+    writer = csv.writer(text)
+    writer.writerow([COLUMN_TITLES.get(column[0], column[0]) for column in cursor.description])
+    count = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        writer.writerows(rows)
+        count += len(rows)
+        if progress:
+            progress(count)
+    return count
+
+def stream_export_csv(conn, path, query=EXPORT_QUERY, params=(), chunk_size=EXPORT_CHUNK_SIZE, progress=None):
+    # تصدير متدفق إلى CSV مباشرة من المؤشر، بترميز UTF-8 مع BOM ليعرض Excel العربية بشكل صحيح
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as text:
+        return _write_csv(cursor, text, chunk_size, progress)
+
+def stream_export_csv_zip(conn, path, arcname, query=EXPORT_QUERY, params=(), chunk_size=EXPORT_CHUNK_SIZE):
+    # نفس تصدير CSV مضغوطا داخل أرشيف zip
+    # ملف xlsx مضغوط أصلا، لذا تستعمل الإرساليات الجزئية CSV مضغوطا لأصغر حجم ممكن
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+        text = io.TextIOWrapper(archive.open(arcname, 'w'), encoding='utf-8-sig', newline='')
+        try:
+            return _write_csv(cursor, text, chunk_size)
+        finally:
+            text.close()
+
+# التصدير المقسم: أعمدة التجميع لكل نوع تقسيم (أنواع مرجعية، الترتيب والتجميع على مفاتيحها الصحيحة)
+SPLIT_KEYS = {
+    'district': ['district'],
+    'school': ['district', 'school'],
+}
+INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+def _group_title(key, used, limit):
+    # اسم ورقة/ملف صالح وفريد لكل مجموعة
+    title = INVALID_SHEET_CHARS.sub('-', ' - '.join(part or 'غير محدد' for part in key)).strip()[:limit]
+    base, number = title, 2
+    while title in used:
+        suffix = f" ({number})"
+        title = base[:limit - len(suffix)] + suffix
+        number += 1
+    used.add(title)
+    return title
+
+def _rtl_sheet(workbook, title, header):
+    sheet = workbook.create_sheet(title)
+    sheet.sheet_view.rightToLeft = True
+    sheet.append(header)
+    return sheet
+
+def write_group_workbook(path, title, header, rows):
+    # مصنف مجموعة واحدة؛ دالة على مستوى الوحدة حتى يمكن تنفيذها في عملية منفصلة
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = _rtl_sheet(workbook, title[:31], header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+def split_export(conn, path, by='district', mode='files', workers=1, chunk_size=EXPORT_CHUNK_SIZE):
+    # تصدير مقسم في مرور واحد على الجدول مرتبا حسب فهرس مفاتيح الدائرة/المؤسسة:
+    # mode='sheets' ورقة لكل مجموعة في مصنف واحد، mode='files' مصنف لكل مجموعة داخل أرشيف zip
+    # workers > 1 يكتب مصنفات المجموعات في عمليات متوازية (الحاسوب فقط)
+    keys = SPLIT_KEYS[by]
+    positions = [EXPORT_COLUMNS.index(key) for key in keys]
+    ids = ', '.join(f"{key}_id" for key in keys)
+    width = len(EXPORT_COLUMNS)
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {EXPORT_FIELDS}, {ids} FROM students ORDER BY {ids}, id")
+    header = [COLUMN_TITLES.get(column[0], column[0]) for column in cursor.description[:width]]
+    rows = chain.from_iterable(iter(lambda: cursor.fetchmany(chunk_size), []))
+
+    def grouped():
+        # المجموعة تحدد بالمفاتيح الملحقة بآخر الصف، وعنوانها من أسماء أول صف فيها
+        for _, group_rows in groupby(rows, key=lambda row: row[width:]):
+            first = next(group_rows)
+            yield (tuple(first[position] for position in positions),
+                   (row[:width] for row in chain([first], group_rows)))
+
+    groups = grouped()
+    used = set()
+    count = 0
+
+    if mode == 'sheets':
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        for key, group_rows in groups:
+            sheet = _rtl_sheet(workbook, _group_title(key, used, 31), header)
+            for row in group_rows:
+                sheet.append(row)
+            count += 1
+        if not count:
+            _rtl_sheet(workbook, 'البيانات', header)
+        workbook.save(path)
+        return count
+
+    # ملفات xlsx مضغوطة أصلا فتخزن في الأرشيف دون إعادة ضغط
+    with tempfile.TemporaryDirectory() as folder, \
+            zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        def store(part, arcname):
+            archive.write(part, arcname)
+            os.remove(part)
+
+        if workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for key, group_rows in groups:
+                    title = _group_title(key, used, 100)
+                    part = os.path.join(folder, f"{count}.xlsx")
+                    pending.append((executor.submit(write_group_workbook, part, title, header, list(group_rows)),
+                                    title + '.xlsx'))
+                    count += 1
+                    # حد للمجموعات المنتظرة حتى لا تتراكم في الذاكرة
+                    while len(pending) > workers * 2:
+                        future, arcname = pending.popleft()
+                        store(future.result(), arcname)
+                while pending:
+                    future, arcname = pending.popleft()
+                    store(future.result(), arcname)
+        else:
+            for key, group_rows in groups:
+                title = _group_title(key, used, 100)
+                store(write_group_workbook(os.path.join(folder, f"{count}.xlsx"), title, header, group_rows),
+                      title + '.xlsx')
+                count += 1
+    return count
+
+class StartupTimer:
+    # تقرير زمن الإقلاع: مراحل مقيسة من بداية تحميل الوحدة، يضاف سطر JSON لكل تشغيل
+    def __init__(self, path='startup_times.jsonl'):
+        self.path = path
+        self.marks = {}
+        self.reported = False
+        self.lock = threading.Lock()
+
+    def mark(self, name, at=None):
+        # at: لحظة (perf_counter) سابقة للمرحلة، وإلا فالآن
+        if at is None:
+            at = time.perf_counter()
+        with self.lock:
+            self.marks.setdefault(name, round((at - APP_START) * 1000, 1))
+
+    def report(self):
+        with self.lock:
+            if self.reported:
+                return
+            self.reported = True
+            entry = {'time': datetime.now().isoformat(timespec='seconds'), 'ms': self.marks}
+        try:
+            with open(self.path, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        except OSError:
+            pass
+
+class Metrics:
+    # قياس أزمنة العمليات الحساسة (الحفظ، التصدير، الإرسال، استعلامات القاعدة) وعداداتها:
+    # آخر SAMPLE_SIZE قياسا لكل عملية تبقى في الذاكرة لحساب النسب المئوية،
+    # ويضاف سطر JSON لكل قياس في سجل دوار يمكن استرجاعه من أجهزة الميدان
+    SAMPLE_SIZE = 500
+
+    def __init__(self, path='diagnostics.log', max_bytes=1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.samples = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.logger = None
+        # قائمة ملفات cProfile أثناء وضع التحليل، None عندما يكون معطلا
+        self.profiles = None
+
+    @contextmanager
+    def timed(self, name):
+        # يستعمل كـ with أو كمزخرف؛ في وضع التحليل تحلل العملية الخارجية فقط في كل خيط
+        depth = getattr(self.local, 'depth', 0)
+        profiler = None
+        start = time.perf_counter()
+        ok = True
+        try:
+            self.local.depth = depth + 1
+            if self.profiles is not None and depth == 0:
+                profiler = self.profiler()
+                start = time.perf_counter()
+            yield
+        except Exception:
+            ok = False
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.local.depth = depth
+            if profiler:
+                profiler.disable()
+                with self.lock:
+                    if self.profiles is not None:
+                        self.profiles.append(profiler)
+            self.record(name, elapsed, ok)
+
+    def profiler(self):
+        # منذ Python 3.12 يعمل cProfile عبر sys.monitoring على مستوى المفسر كله، فتفعيل محلل ثان
+        # في خيط آخر أثناء عمل الأول يفشل: تقاس العملية حينئذ بالزمن فقط
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            self.count('profile.skipped')
+            return None
+        return profiler
+
+    def record(self, name, ms, ok=True):
+        with self.lock:
+            self.samples.setdefault(name, deque(maxlen=self.SAMPLE_SIZE)).append(ms)
+            self.counters[name] = self.counters.get(name, 0) + 1
+            if not ok:
+                self.counters[f"{name}.errors"] = self.counters.get(f"{name}.errors", 0) + 1
+        self.log({'time': datetime.now().isoformat(timespec='milliseconds'), 'op': name,
+                  'ms': round(ms, 2), 'ok': ok})
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def log(self, entry):
+        if self.logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+            with self.lock:
+                if self.logger is None:
+                    logger = logging.getLogger('onaea.metrics')
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    logger.addHandler(RotatingFileHandler(self.path, maxBytes=self.max_bytes,
+                                                          backupCount=self.backups, encoding='utf-8', delay=True))
+                    self.logger = logger
+        self.logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def summary(self):
+        # (العملية، العدد، p50، p90، p99، الأقصى) بالميلي ثانية، ثم العدادات الأخرى
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+            counters = dict(self.counters)
+        rows = []
+        for name, values in sorted(samples.items()):
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            rows.append((name, counters.get(name, len(values)), pick(0.5), pick(0.9), pick(0.99), values[-1]))
+        return rows, {name: value for name, value in sorted(counters.items()) if name not in samples}
+
+    @property
+    def profiling(self):
+        return self.profiles is not None
+
+    def start_profile(self):
+        with self.lock:
+            if self.profiles is None:
+                self.profiles = []
+
+    def stop_profile(self, path=None):
+        # دمج تحليلات كل العمليات المسجلة منذ التفعيل في ملف pstats واحد
+        with self.lock:
+            profiles, self.profiles = self.profiles, None
+        if not profiles:
+            return None
+        import pstats
+        path = path or datetime.now().strftime('profile-%Y%m%d-%H%M%S.prof')
+        stats = pstats.Stats(profiles[0])
+        for profiler in profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return path
+
+metrics = Metrics()
+
+def show_snack_bar(page, message):
+    # شريط رسائل واحد في طبقة overlay يعاد استعماله ويحدث وحده دون تحديث الصفحة كاملة
+    snack_bar = next((control for control in page.overlay if isinstance(control, ft.SnackBar)), None)
+    if snack_bar is None:
+        page.open(ft.SnackBar(content=ft.Text(message)))
+        return
+    snack_bar.content.value = message
+    page.open(snack_bar)
+
+class ViewRouter:
+    # كل شاشة تبنى مرة واحدة عند أول فتح وتبقى في الصفحة مخفية؛ التنقل يبدل ظهور حاويتين
+    # ويحدثهما وحدهما بدل page.clean() وإعادة بناء الشاشة وتحديث الصفحة كاملة
+    # الشاشة يمكنها تعريف on_show لتحميل بياناتها بعد إضافتها إلى الصفحة (أول فتح) وعند العودة إليها،
+    # فلا تحدث عناصرها قبل أن تعرض، و on_drop لإيقاف مؤقتاتها وإزالة ما أضافته إلى page.overlay عند حذفها
+    def __init__(self, page):
+        self.page = page
+        self.views = {}
+        self.current = None
+
+    def show(self, name, factory):
+        with metrics.timed(f"view.{name}"):
+            previous = self.views.get(self.current)
+            view = self.views.get(name)
+            self.current = name
+            if previous is not None and previous is not view:
+                previous.container.visible = False
+                self.page.update(previous.container)
+            if view is None:
+                view = self.views[name] = factory()
+                view.container.visible = True
+                self.page.add(view.container)
+            else:
+                view.container.visible = True
+                self.page.update(view.container)
+            on_show = getattr(view, 'on_show', None)
+            if on_show:
+                on_show()
+            return view
+
+    def drop(self, *names):
+        # إزالة الشاشات التي لن تعرض ثانية (المقدمة وتسجيل الدخول)
+        views = [self.views.pop(name) for name in names if name in self.views]
+        for view in views:
+            on_drop = getattr(view, 'on_drop', None)
+            if on_drop:
+                on_drop()
+        if views:
+            self.page.remove(*[view.container for view in views])
+
+class BackgroundJobs:
+    # تنفيذ العمليات الطويلة (الحفظ، التصدير، الإرسال) في مجمع خيوط خارج خيط واجهة Flet
+    # مع منع تشغيل نفس العملية مرتين في آن واحد.
+    # الحفظ له خيطه الخاص: لا ينتظر خلف تصدير أو إرسال أو نسخ احتياطي طويل
+    DEDICATED = ('save',)
+
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='onaea-job')
+        self.dedicated = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'onaea-{name}')
+                          for name in self.DEDICATED}
+        self.lock = threading.Lock()
+        self.running = set()
+
+    def is_running(self, name):
+        with self.lock:
+            return name in self.running
+
+    def submit(self, name, func, on_done=None, on_error=None):
+        # تعيد False إذا كانت عملية بنفس الاسم قيد التنفيذ
+        with self.lock:
+            if name in self.running:
+                return False
+            self.running.add(name)
+
+        def finished(future):
+            with self.lock:
+                self.running.discard(name)
+            try:
+                result = future.result()
+            except Exception as ex:
+                if on_error:
+                    on_error(ex)
+            else:
+                if on_done:
+                    on_done(result)
+
+        self.dedicated.get(name, self.executor).submit(func).add_done_callback(finished)
+        return True
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        for executor in self.dedicated.values():
+            executor.shutdown(wait=False)
+
+class BackupScheduler:
+    # نسخ احتياطي دوري عبر BackgroundJobs: النسخ يتم من اتصال قراءة مستقل فلا يحجز حفظ المتمدرسين
+    def __init__(self, db, jobs, interval=BACKUP_INTERVAL):
+        self.db = db
+        self.jobs = jobs
+        self.interval = interval
+        self.timer = None
+
+    def start(self):
+        # الموعد الأول يحسب من آخر نسخة مسجلة حتى لا تتكرر النسخ عند كل فتح للتطبيق
+        last = self.db.get_state('last_backup')
+        elapsed = (datetime.now() - datetime.fromisoformat(last)).total_seconds() if last else self.interval
+        self.schedule(max(BACKUP_STARTUP_DELAY, self.interval - elapsed))
+
+    def schedule(self, delay):
+        self.timer = threading.Timer(delay, self.run)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def run(self):
+        reschedule = lambda _: self.schedule(self.interval)
+        if not self.jobs.submit('backup', self.db.backup, on_done=reschedule, on_error=reschedule):
+            self.schedule(BACKUP_STARTUP_DELAY)
+
+    def stop(self):
+        if self.timer:
+            self.timer.cancel()
+
+class ReferenceData:
+    # نسخة في الذاكرة من الجدول المرجعي تحمل مرة واحدة، للقوائم المنسدلة المتتالية دون استعلامات
+    def __init__(self, rows):
+        # rows: (id، النوع، id الأب، الاسم) مرتبة حسب الترتيب المعتمد ثم الاسم
+        self.ids = {}
+        self.children = {}
+        for id_, kind, parent_id, name in rows:
+            self.ids[(kind, parent_id, name)] = id_
+            self.children.setdefault((kind, parent_id), []).append(name)
+
+    def id(self, kind, name, parent_id=0):
+        return self.ids.get((kind, parent_id or 0, (name or '').strip()))
+
+    def names(self, kind, parent_id=0):
+        return self.children.get((kind, parent_id or 0), [])
 
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('eleves.db')
+    def __init__(self, path='eleves.db'):
+        self.path = path
+        # الاتصال مشترك بين خيط الواجهة وخيوط العمليات الخلفية، والقفل يضمن تسلسل الكتابة
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.conn.create_function('name_key', 4, student_name_key, deterministic=True)
+        self.conn.create_function('birth_iso', 1, parse_birth_date, deterministic=True)
+        self.reference_cache = None
+        # المستخدم الحالي، يحمل مرة واحدة عند الدخول أو استئناف الجلسة
+        self.user = None
+        self.configure()
         self.create_tables()
+
+    def configure(self):
+        # WAL: القراءة (التصدير) لا تحجز الكتابة، و synchronous=NORMAL يلغي fsync عند كل commit
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-8000")
+
+    def open_reader(self):
+        # اتصال مستقل للقراءة الطويلة (التصدير) حتى لا يحجز الاتصال الرئيسي
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False)
         
     def create_tables(self):
         cursor = self.conn.cursor()
@@ -39,114 +965,1907 @@ class Database:
             gender TEXT,
             age INTEGER
         )
-        ''')
-        self.conn.commit()
+        ''')
+        # حالة التطبيق (مثل علامة آخر إرسال لكل مستلم)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''')
+        # صندوق الصادر: إرساليات البريد المنتظرة والمرسلة (دون كلمات المرور)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            payload_hash TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            recipients TEXT NOT NULL,
+            delta INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT,
+            last_error TEXT,
+            rows INTEGER,
+            created_at TEXT,
+            sent_at TEXT
+        )
+        ''')
+        # مستخدمو الجهاز: كلمات المرور مخزنة بصيغة hash_password فقط
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'operator',
+            must_change_password INTEGER NOT NULL DEFAULT 0,
+            active INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT,
+            last_login_at TEXT
+        )
+        ''')
+        # سجل الحملات المؤرشفة (صفوفها نقلت من students إلى ملفات الأرشيف)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            campaign INTEGER PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            archived_at TEXT
+        )
+        ''')
+        # جدول مرجعي واحد لكل القوائم؛ parent_id يربط البلدية بدائرتها والمؤسسة ببلديتها (0 دون أب)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reference (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            parent_id INTEGER NOT NULL DEFAULT 0,
+            name TEXT NOT NULL,
+            position INTEGER,
+            UNIQUE (kind, parent_id, name)
+        )
+        ''')
+        for kind, names in REFERENCE_SEEDS.items():
+            cursor.executemany(
+                "INSERT OR IGNORE INTO reference (kind, name, position) VALUES (?, ?, ?)",
+                [(kind, name, position) for position, name in enumerate(names)]
+            )
+        self.migrate(cursor)
+        self.create_indexes(cursor)
+        self.conn.commit()
+
+    def add_column(self, cursor, table, column, declaration):
+        # إضافة عمود لقواعد البيانات المنشأة بإصدار سابق
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+            return True
+        return False
+
+    def migrate(self, cursor):
+        # وقت آخر تعديل لكل سجل، تملؤه القوادح تلقائيا عند الإدراج والتعديل
+        if self.add_column(cursor, 'students', 'updated_at', 'TEXT'):
+            cursor.execute(f"UPDATE students SET updated_at = {NOW_SQL} WHERE updated_at IS NULL")
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_inserted AFTER INSERT ON students
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE students SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        # يقتصر على أعمدة البيانات حتى لا تعد تحديثات الأعمدة الداخلية (name_key) تعديلا للسجل
+        cursor.execute("DROP TRIGGER IF EXISTS trg_students_updated")
+        cursor.execute(f'''
+        CREATE TRIGGER trg_students_updated AFTER UPDATE OF {', '.join(STUDENT_COLUMNS)} ON students
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE students SET updated_at = {NOW_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        # المفاتيح المرجعية الصحيحة (0 للقيمة الفارغة)، تضاف قبل أول حساب للأعمدة المشتقة
+        references_added = False
+        for kind, column, parent in REFERENCE_KINDS:
+            references_added = self.add_column(cursor, 'students', f"{kind}_id", 'INTEGER') or references_added
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_reference_changed
+        AFTER UPDATE OF {', '.join(column for kind, column, parent in REFERENCE_KINDS)} ON students
+        BEGIN
+            UPDATE students SET {', '.join(f"{kind}_id = NULL" for kind, column, parent in REFERENCE_KINDS)}
+            WHERE id = NEW.id;
+        END
+        ''')
+        # مفتاح الأسماء الموحدة لكشف التكرار ('' للسجلات دون اسم)، يعاد حسابه عند تغير الأسماء أو تاريخ الميلاد
+        # وتاريخ الميلاد الموحد الذي يحسب منه العمر ('' للتواريخ غير الصالحة)
+        added = self.add_column(cursor, 'students', 'name_key', 'TEXT')
+        if self.add_column(cursor, 'students', 'birth_iso', 'TEXT') or added:
+            self.fill_derived(cursor, everything=True)
+        elif references_added:
+            self.fill_references(cursor)
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_name_changed
+        AFTER UPDATE OF last_name, first_name, father_name, birth_date ON students
+        BEGIN
+            UPDATE students SET name_key = NULL WHERE id = NEW.id;
+        END
+        ''')
+        cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_students_birth_changed AFTER UPDATE OF birth_date ON students
+        BEGIN
+            UPDATE students SET birth_iso = NULL WHERE id = NEW.id;
+        END
+        ''')
+        # معرفات المزامنة: معرف ثابت للجهاز، ومعرف عالمي لكل سجل لا يتغير عند الدمج
+        cursor.execute(f"INSERT OR IGNORE INTO app_state (key, value) VALUES ('device_id', {NEW_UUID_SQL})")
+        self.add_column(cursor, 'students', 'uuid', 'TEXT')
+        self.add_column(cursor, 'students', 'device_id', 'TEXT')
+        cursor.execute(f"UPDATE students SET uuid = {NEW_UUID_SQL}, device_id = {DEVICE_ID_SQL} WHERE uuid IS NULL")
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_sync_ids AFTER INSERT ON students
+        WHEN NEW.uuid IS NULL
+        BEGIN
+            UPDATE students SET uuid = {NEW_UUID_SQL}, device_id = {DEVICE_ID_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        # ترتيب التغييرات المحلية لعلامات الإرسال الجزئي، بدل updated_at الذي يحتفظ بوقت الجهاز الأصلي
+        if self.add_column(cursor, 'students', 'change_seq', 'INTEGER'):
+            cursor.execute('''
+            CREATE TEMP TABLE change_order AS
+            SELECT id, ROW_NUMBER() OVER (ORDER BY updated_at, id) AS seq FROM students
+            ''')
+            cursor.execute("UPDATE students SET change_seq = (SELECT seq FROM temp.change_order AS o WHERE o.id = students.id)")
+            cursor.execute("DROP TABLE temp.change_order")
+            # علامات الإرسال السابقة (أوقات) تصبح أرقام تغيير
+            for key, watermark in cursor.execute(
+                "SELECT key, value FROM app_state WHERE key LIKE 'email_watermark:%'"
+            ).fetchall():
+                sequence = cursor.execute(
+                    "SELECT COALESCE(MAX(change_seq), 0) FROM students WHERE updated_at <= ?", (watermark,)
+                ).fetchone()[0]
+                cursor.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)",
+                               ('email_sequence:' + key.split(':', 1)[1], str(sequence)))
+            cursor.execute("DELETE FROM app_state WHERE key LIKE 'email_watermark:%'")
+        # العداد يبدأ من أكبر رقم مستعمل، في الجدول أو في علامات الإرسال (قاعدة أرشفت قبل إضافته)
+        cursor.execute('''
+        INSERT OR IGNORE INTO app_state (key, value) SELECT 'change_seq', MAX(
+            (SELECT COALESCE(MAX(change_seq), 0) FROM students),
+            (SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) FROM app_state WHERE key LIKE 'email_sequence:%')
+        )
+        ''')
+        # المشغلات السابقة كانت تحسب MAX(change_seq) + 1، فيعود الرقم إلى الوراء بعد حذف أحدث السجلات
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'trg_students_change_inserted' "
+                              "AND sql LIKE '%app_state%'").fetchone():
+            cursor.execute("DROP TRIGGER IF EXISTS trg_students_change_inserted")
+            cursor.execute("DROP TRIGGER IF EXISTS trg_students_change_updated")
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_change_inserted AFTER INSERT ON students
+        BEGIN
+            UPDATE app_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'change_seq';
+            UPDATE students SET change_seq = {CHANGE_COUNTER_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_change_updated
+        AFTER UPDATE OF {', '.join(STUDENT_COLUMNS)}, updated_at ON students
+        BEGIN
+            UPDATE app_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'change_seq';
+            UPDATE students SET change_seq = {CHANGE_COUNTER_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        # المستخدم الذي أدخل السجل (NULL للسجلات السابقة، 0 للسجلات المدمجة من أجهزة أخرى)
+        self.add_column(cursor, 'students', 'operator_id', 'INTEGER')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_operator AFTER INSERT ON students
+        WHEN NEW.operator_id IS NULL
+        BEGIN
+            UPDATE students SET operator_id = {OPERATOR_ID_SQL} WHERE id = NEW.id;
+        END
+        ''')
+        # الحملة تحدد مرة واحدة عند الإدراج (أو من وقت آخر تعديل للسجلات المدمجة). السجلات الموجودة قبل
+        # إضافة العمود تبقى دون حملة: updated_at القديم هو وقت الترحيل لا وقت الإدخال، ونافذة الأرشفة تعينها
+        self.add_column(cursor, 'students', 'campaign', 'INTEGER')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_students_campaign AFTER INSERT ON students
+        WHEN NEW.campaign IS NULL
+        BEGIN
+            UPDATE students SET campaign = {campaign_sql(f'COALESCE(NEW.updated_at, {NOW_SQL})')} WHERE id = NEW.id;
+        END
+        ''')
+
+    def fill_derived(self, cursor, everything=False):
+        # حساب الأعمدة المشتقة (name_key و birth_iso) للصفوف الجديدة أو المعدلة بعد كل إدراج
+        # الدالتان مسجلتان على الاتصال الرئيسي؛ NULL يعني "لم يحسب بعد" فالقيمة المفقودة تخزن ''
+        where = "" if everything else " WHERE name_key IS NULL"
+        cursor.execute(f"UPDATE students SET name_key = COALESCE(name_key(last_name, first_name, father_name, birth_date), ''){where}")
+        where = "" if everything else " WHERE birth_iso IS NULL"
+        cursor.execute(f"UPDATE students SET birth_iso = COALESCE(birth_iso(birth_date), ''){where}")
+        self.fill_references(cursor)
+
+    def fill_references(self, cursor):
+        # حل القيم النصية للسجلات الجديدة أو المعدلة إلى مفاتيح مرجعية، نوعا بعد نوع من الأب إلى الابن:
+        # تسجيل القيم الجديدة في الجدول المرجعي ثم تحديث المفتاح، على السجلات المعلقة فقط (gender_id فارغ)
+        pending = "gender_id IS NULL"
+        added = 0
+        for kind, column, parent in REFERENCE_KINDS:
+            parent_id = f"COALESCE({parent}_id, 0)" if parent else "0"
+            added += cursor.execute(f'''
+            INSERT OR IGNORE INTO reference (kind, parent_id, name)
+            SELECT DISTINCT '{kind}', {parent_id}, TRIM({column}) FROM students
+            WHERE {pending} AND TRIM(COALESCE({column}, '')) != ''
+            ''').rowcount
+            cursor.execute(f'''
+            UPDATE students SET {kind}_id = COALESCE((
+                SELECT r.id FROM reference AS r
+                WHERE r.kind = '{kind}' AND r.parent_id = {parent_id} AND r.name = TRIM(students.{column})
+            ), 0)
+            WHERE {pending}
+            ''')
+        if added:
+            self.reference_cache = None
+
+    def references(self):
+        # الجدول المرجعي محمل مرة واحدة، ويعاد تحميله فقط بعد إضافة قيم جديدة
+        with self.lock:
+            if self.reference_cache is None:
+                self.reference_cache = ReferenceData(self.conn.execute(
+                    "SELECT id, kind, parent_id, name FROM reference ORDER BY kind, parent_id, position IS NULL, position, name"
+                ).fetchall())
+            return self.reference_cache
+
+    def scrypt_n(self):
+        # المعايرة تتم مرة واحدة لكل جهاز وتحفظ
+        n = self.get_state('scrypt_n')
+        if n is None:
+            n = calibrate_scrypt()
+            self.set_state('scrypt_n', str(n))
+        return int(n)
+
+    def bootstrap_admin(self):
+        # أول تشغيل: حساب admin/admin يطلب تغيير كلمة مروره بعد الدخول
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return False
+        self.create_user('admin', 'admin', role='admin', must_change_password=True)
+        return True
+
+    def create_user(self, username, password, role='operator', must_change_password=False):
+        password_hash = hash_password(password, self.scrypt_n())
+        with self.transaction() as conn:
+            return conn.execute(
+                f'''INSERT INTO users (username, password_hash, role, must_change_password, created_at)
+                VALUES (?, ?, ?, ?, {NOW_SQL})''',
+                (username.strip(), password_hash, role, int(must_change_password))
+            ).lastrowid
+
+    def set_password(self, user_id, password):
+        password_hash = hash_password(password, self.scrypt_n())
+        with self.transaction() as conn:
+            conn.execute("UPDATE users SET password_hash = ?, must_change_password = 0 WHERE id = ?",
+                         (password_hash, user_id))
+
+    def check_password(self, user_id, password):
+        # كلمة المرور الحالية تطلب قبل تغييرها، حتى لا يغيرها من وجد الجلسة مفتوحة
+        with self.lock:
+            row = self.conn.execute("SELECT password_hash FROM users WHERE id = ? AND active = 1", (user_id,)).fetchone()
+        return row is not None and verify_password(password or '', row[0])
+
+    def set_user_active(self, user_id, active):
+        # المستخدم المعطل لا يدخل، وجلسته المحفوظة لا تستأنف (get_user يشترط active)
+        with self.transaction() as conn:
+            conn.execute("UPDATE users SET active = ? WHERE id = ?", (int(active), user_id))
+
+    def list_users(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, username, role, active, last_login_at FROM users ORDER BY username"
+            ).fetchall()
+
+    def get_user(self, user_id):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            row = cursor.execute(
+                "SELECT id, username, role, must_change_password FROM users WHERE id = ? AND active = 1", (user_id,)
+            ).fetchone()
+            return dict(row) if row else None
+
+    @metrics.timed('db.authenticate')
+    def authenticate(self, username, password):
+        # التحقق المكلف (scrypt) يتم هنا فقط، عند الدخول؛ بعده تكفي الجلسة المخزنة
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, password_hash FROM users WHERE username = ? AND active = 1", ((username or '').strip(),)
+            ).fetchone()
+        valid = verify_password(password or '', row[1] if row else dummy_password_hash(self.scrypt_n()))
+        if row is None or not valid:
+            return None
+        with self.transaction() as conn:
+            conn.execute(f"UPDATE users SET last_login_at = {NOW_SQL} WHERE id = ?", (row[0],))
+        # كلمة مرور مشفرة بمعاملات جهاز آخر أو معايرة سابقة: إعادة تشفيرها بمعاملات هذا الجهاز
+        if row[1].split('$')[1] != str(self.scrypt_n()):
+            with self.transaction() as conn:
+                conn.execute("UPDATE users SET password_hash = ? WHERE id = ?",
+                             (hash_password(password, self.scrypt_n()), row[0]))
+        return self.get_user(row[0])
+
+    def start_session(self, user):
+        # الجلسة تحفظ على الجهاز حتى لا يعاد التحقق المكلف عند كل تنقل أو إعادة فتح التطبيق
+        expires_at = (datetime.now() + SESSION_TTL).isoformat(timespec='seconds')
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES ('session', ?)",
+                         (json.dumps({'user_id': user['id'], 'expires_at': expires_at}),))
+            conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES ('operator_id', ?)",
+                         (str(user['id']),))
+        self.user = user
+
+    def resume_session(self):
+        try:
+            session = json.loads(self.get_state('session') or 'null')
+        except ValueError:
+            session = None
+        if not session or session.get('expires_at', '') < datetime.now().isoformat(timespec='seconds'):
+            self.end_session()
+            return None
+        user = self.get_user(session['user_id'])
+        if user is None:
+            self.end_session()
+            return None
+        self.user = user
+        return user
+
+    def end_session(self):
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM app_state WHERE key IN ('session', 'operator_id')")
+        self.user = None
+
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM app_state WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self.transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO app_state (key, value) VALUES (?, ?)", (key, value))
+
+    def create_indexes(self, cursor):
+        # البحث والتجميع حسب الدائرة والمؤسسة والمستوى على المفاتيح المرجعية الصحيحة بدل النصوص العربية،
+        # فالفهارس النصية القديمة تحذف (كل فهرس إضافي يبطئ الإدراج)
+        for name in ('district', 'school', 'level', 'district_school', 'chapter', 'gender'):
+            cursor.execute(f"DROP INDEX IF EXISTS idx_students_{name}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_teacher ON students (teacher_name, teacher_first_name)")
+        # فهارس تغطي تجميعات الإحصائيات (GROUP BY) دون قراءة الجدول، والبحث بالمستوى والمؤسسة
+        for kind in ('district', 'municipality', 'school', 'chapter', 'level', 'gender'):
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_students_{kind}_id ON students ({kind}_id)")
+        # إرسالية معلقة واحدة لكل محتوى، وترتيب الإرساليات المستحقة
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_outbox_pending ON outbox (payload_hash) WHERE status = 'pending'")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+        # السجلات التي لم تحل مفاتيحها المرجعية بعد
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_references_pending ON students (id) WHERE gender_id IS NULL")
+        # فهرس يغطي حساب العمر (birth_iso مع age الاحتياطي)
+        cursor.execute("DROP INDEX IF EXISTS idx_students_age")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_birth_age ON students (birth_iso, age)")
+        # "سجلاتي": سجلات المستخدم الحالي بترتيب التصفح
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_operator ON students (operator_id, id)")
+        # اختيار صفوف حملة للأرشفة
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_campaign ON students (campaign)")
+        # ترتيب التصدير المقسم حسب الدائرة ثم المؤسسة
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_district_school_id ON students (district_id, school_id)")
+        # فهرس كشف التكرار
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_name_key ON students (name_key)")
+        # فهارس البحث بالبادئة في قائمة المتمدرسين
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_last_name ON students (last_name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_first_name ON students (first_name)")
+        # فهرس الإرسال الجزئي للسجلات الجديدة/المعدلة، ويجعل حساب رقم التغيير التالي فوريا
+        cursor.execute("DROP INDEX IF EXISTS idx_students_updated_at")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_change_seq ON students (change_seq)")
+        # هدف ON CONFLICT عند الدمج
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS uq_students_uuid ON students (uuid)")
+        # رقم العقد فريد متى كان مدخلا
+        try:
+            cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_students_contract_number ON students (contract_number)
+            WHERE contract_number IS NOT NULL AND contract_number != ''
+            ''')
+        except sqlite3.IntegrityError:
+            # قاعدة بيانات قديمة تحتوي على أرقام عقود مكررة: فهرس عادي إلى أن تصحح
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_students_contract_number ON students (contract_number)")
+
+    def _where(self, filters):
+        # القيم المرجعية تقارن بمفاتيحها المفهرسة: كل مفاتيح الاسم في نوعه، تحت أي أب
+        kinds = {column: kind for kind, column, parent in REFERENCE_KINDS}
+        conditions = []
+        params = []
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column in kinds:
+                conditions.append(f"{kinds[column]}_id IN (SELECT id FROM reference WHERE kind = ? AND name = ?)")
+                params += [kinds[column], str(value).strip()]
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    @metrics.timed('db.find_students')
+    def find_students(self, district=None, municipality=None, school=None, teacher_name=None, level=None,
+                      limit=50, offset=0):
+        # البحث المفلتر مع التصفح على صفحات، يستعمل الفهارس أعلاه
+        where, params = self._where({
+            'district': district, 'municipality': municipality, 'school': school,
+            'teacher_name': teacher_name, 'level': level
+        })
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute(f"SELECT * FROM students{where} ORDER BY id LIMIT ? OFFSET ?", params + [limit, offset])
+            return [dict(row) for row in cursor.fetchall()]
+
+    @metrics.timed('db.count_students')
+    def count_students(self, district=None, municipality=None, school=None, teacher_name=None, level=None):
+        where, params = self._where({
+            'district': district, 'municipality': municipality, 'school': school,
+            'teacher_name': teacher_name, 'level': level
+        })
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM students{where}", params).fetchone()[0]
+
+    def find_by_district(self, district, limit=50, offset=0):
+        return self.find_students(district=district, limit=limit, offset=offset)
+
+    def find_by_school(self, school, limit=50, offset=0):
+        return self.find_students(school=school, limit=limit, offset=offset)
+
+    def find_by_teacher(self, teacher_name, limit=50, offset=0):
+        return self.find_students(teacher_name=teacher_name, limit=limit, offset=offset)
+
+    def find_by_level(self, level, limit=50, offset=0):
+        return self.find_students(level=level, limit=limit, offset=offset)
+
+    @metrics.timed('db.page_students')
+    def page_students(self, after_id=0, search=None, limit=50, operator_id=None):
+        # تصفح بالمفتاح (keyset): الصفحة التالية تبدأ بعد آخر id معروض بدل OFFSET
+        # operator_id: سجلات مستخدم واحد فقط عبر الفهرس (operator_id, id)
+        conditions = "id > ?" + (" AND operator_id = ?" if operator_id is not None else "")
+        params = [after_id] + ([operator_id] if operator_id is not None else [])
+        if not search:
+            with self.lock:
+                return self.conn.execute(
+                    f'''SELECT id, last_name, first_name, contract_number, school, district
+                    FROM students WHERE {conditions} ORDER BY id LIMIT ?''',
+                    params + [limit]
+                ).fetchall()
+        # البحث بالبادئة: استعلام على فهرس كل مجال (اللقب، الاسم، رقم العقد، مفتاح المؤسسة) يأخذ أول limit
+        # سجل منه، ثم يجمعها UNION؛ شرط OR واحد مع ORDER BY id كان يخطط كمسح لكامل الجدول بترتيب id.
+        # INDEXED BY لأن المخطط، مع إحصائيات ANALYZE وحدود بادئة مجهولة، يفضل أيضا المسح بترتيب id
+        upper = search + '\U0010ffff'
+        matches = [
+            ("students INDEXED BY idx_students_last_name", "last_name >= ? AND last_name < ?"),
+            ("students INDEXED BY idx_students_first_name", "first_name >= ? AND first_name < ?"),
+            ("students", "contract_number != '' AND contract_number >= ? AND contract_number < ?"),
+            ("students INDEXED BY idx_students_school_id",
+             "school_id IN (SELECT id FROM reference WHERE kind = 'school' AND name >= ? AND name < ?)"),
+        ]
+        branches = []
+        branch_params = []
+        for source, match in matches:
+            branches.append(f"SELECT id FROM (SELECT id FROM {source} WHERE {match} AND {conditions} ORDER BY id LIMIT ?)")
+            branch_params += [search, upper] + params + [limit]
+        with self.lock:
+            return self.conn.execute(
+                f'''SELECT id, last_name, first_name, contract_number, school, district
+                FROM students WHERE id IN ({' UNION '.join(branches)}) ORDER BY id LIMIT ?''',
+                branch_params + [limit]
+            ).fetchall()
+
+    @metrics.timed('db.find_duplicates')
+    def find_duplicates(self, last_name, first_name, father_name, birth_date, limit=5):
+        # المتمدرسون المسجلون بنفس الأسماء الموحدة وسنة الميلاد (بحث في فهرس name_key)
+        key = student_name_key(last_name, first_name, father_name, birth_date)
+        if key is None:
+            return []
+        with self.lock:
+            return self.conn.execute(
+                '''SELECT id, last_name, first_name, father_name, birth_date, school
+                FROM students WHERE name_key = ? ORDER BY id LIMIT ?''',
+                (key, limit)
+            ).fetchall()
+
+    @metrics.timed('db.export_duplicate_report')
+    def export_duplicate_report(self, path):
+        # تقرير التكرارات على كامل الجدول: تجميع واحد على فهرس name_key بدل المقارنة الثنائية
+        reader = self.open_reader()
+        try:
+            return stream_export_xlsx(
+                reader, path,
+                EXPORT_QUERY + ''' WHERE name_key IN (
+                    SELECT name_key FROM students WHERE name_key != ''
+                    GROUP BY name_key HAVING COUNT(*) > 1
+                ) ORDER BY name_key, id'''
+            )
+        finally:
+            reader.close()
+
+    def group_counts(self, expression, source='students'):
+        # عدد المتمدرسين لكل قيمة، محسوب في SQL بواسطة GROUP BY على عمود مفهرس
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT {expression} AS value, COUNT(*) FROM {source} GROUP BY value ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+    def reference_counts(self, kind):
+        # التجميع على المفتاح الصحيح المفهرس، ثم ربط الأسماء من الجدول المرجعي للمجموعات فقط
+        with self.lock:
+            return self.conn.execute(f'''
+            SELECT r.name, counts.total FROM (
+                SELECT {kind}_id AS ref, COUNT(*) AS total FROM students GROUP BY {kind}_id
+            ) AS counts LEFT JOIN reference AS r ON r.id = counts.ref
+            ORDER BY counts.total DESC
+            ''').fetchall()
+
+    @metrics.timed('db.statistics')
+    def statistics(self):
+        return {
+            'total': self.count_students(),
+            'district': self.reference_counts('district'),
+            'chapter': self.reference_counts('chapter'),
+            'level': self.reference_counts('level'),
+            'gender': self.reference_counts('gender'),
+            'age': self.group_counts(AGE_BAND_SQL, f"(SELECT {AGE_SQL} AS age FROM students)"),
+        }
+
+    def get_by_contract(self, contract_number):
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.row_factory = sqlite3.Row
+            cursor.execute("SELECT * FROM students WHERE contract_number = ?", (contract_number,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    @contextmanager
+    def transaction(self):
+        # تجميع عدة عمليات كتابة في معاملة واحدة (commit واحد)
+        with self.lock:
+            try:
+                yield self.conn
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+
+    def reference_ids(self, conn, record):
+        # مفاتيح السجل المرجعية من الجدول المرجعي المحمل في الذاكرة، من الأب إلى الابن؛
+        # القيمة الجديدة تسجل في الجدول المرجعي ويعاد تحميله عند الطلب التالي
+        references = self.references()
+        ids = {}
+        for kind, column, parent in REFERENCE_KINDS:
+            name = str(record[column] or '').strip()
+            parent_id = ids[parent] if parent else 0
+            ids[kind] = references.id(kind, name, parent_id) if name else 0
+            if ids[kind] is None:
+                conn.execute("INSERT OR IGNORE INTO reference (kind, parent_id, name) VALUES (?, ?, ?)",
+                             (kind, parent_id, name))
+                ids[kind] = conn.execute("SELECT id FROM reference WHERE kind = ? AND parent_id = ? AND name = ?",
+                                         (kind, parent_id, name)).fetchone()[0]
+                self.reference_cache = None
+        return [ids[kind] for kind, column, parent in REFERENCE_KINDS]
+
+    @metrics.timed('db.insert_student')
+    def insert_student(self, values):
+        # values: قيم الأعمدة بترتيب STUDENT_COLUMNS
+        # الأعمدة المشتقة والمفاتيح المرجعية تحسب هنا للسجل الواحد، دون المرور على السجلات المعلقة
+        record = dict(zip(STUDENT_COLUMNS, values))
+        derived = [
+            student_name_key(record['last_name'], record['first_name'], record['father_name'], record['birth_date']) or '',
+            parse_birth_date(record['birth_date']) or '',
+        ]
+        columns = STUDENT_COLUMNS + [f"{kind}_id" for kind, column, parent in REFERENCE_KINDS] + ['name_key', 'birth_iso']
+        with self.transaction() as conn:
+            conn.execute(
+                f"INSERT INTO students ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                list(values) + self.reference_ids(conn, record) + derived
+            )
+
+    @metrics.timed('db.insert_students')
+    def insert_students(self, rows, batch_size=IMPORT_BATCH_SIZE, skip_duplicates=True):
+        # إدراج مجمع: دفعات executemany داخل معاملة واحدة، ويعيد عدد الصفوف المدرجة
+        verb = "INSERT OR IGNORE" if skip_duplicates else "INSERT"
+        sql = (f"{verb} INTO students ({', '.join(STUDENT_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(STUDENT_COLUMNS))})")
+        rows = iter(rows)
+        inserted = 0
+        with self.transaction() as conn:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                inserted += conn.executemany(sql, batch).rowcount
+            self.fill_derived(conn)
+        return inserted
+
+    def import_roster(self, path, batch_size=IMPORT_BATCH_SIZE):
+        # استيراد قائمة Excel/CSV موجودة، مع تجاهل أرقام العقود المسجلة مسبقا، والسجلات دون رقم عقد
+        # المسجلة مسبقا بنفس الأسماء الموحدة وتاريخ الميلاد (إعادة استيراد نفس القائمة)
+        with self.lock:
+            known = set(self.conn.execute(
+                "SELECT name_key, birth_date FROM students WHERE contract_number IS NULL OR contract_number = ''"
+            ).fetchall())
+        return self.insert_students(skip_known_rows(read_roster(path), known), batch_size=batch_size)
+
+    @metrics.timed('db.backup')
+    def backup(self, directory=BACKUP_DIR, keep=BACKUP_KEEP, protect=()):
+        # لقطة متسقة بواجهة backup في SQLite من اتصال قراءة مستقل (WAL: الكتابة لا تتوقف)،
+        # ثم VACUUM للنسخة وضغطها gzip، وحذف ما زاد عن keep من النسخ الأقدم
+        # protect: نسخ لا تحذف في هذا التدوير (النسخة المختارة للاسترجاع)
+        import gzip
+        import shutil
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, datetime.now().strftime(f"{BACKUP_PREFIX}%Y%m%d-%H%M%S.db.gz"))
+        handle, temp = tempfile.mkstemp(suffix='.db', dir=directory)
+        os.close(handle)
+        try:
+            reader = self.open_reader()
+            target = sqlite3.connect(temp)
+            try:
+                reader.backup(target)
+                target.execute("VACUUM")
+            finally:
+                target.close()
+                reader.close()
+            with open(temp, 'rb') as source, gzip.open(path + '.part', 'wb', compresslevel=6) as output:
+                shutil.copyfileobj(source, output, 1024 * 1024)
+            os.replace(path + '.part', path)
+        finally:
+            os.remove(temp)
+        self.set_state('last_backup', datetime.now().isoformat(timespec='seconds'))
+        protect = {os.path.abspath(kept) for kept in protect}
+        for old in self.list_backups(directory)[keep:]:
+            if os.path.abspath(old) not in protect:
+                os.remove(old)
+        return path
+
+    def list_backups(self, directory=BACKUP_DIR):
+        # النسخ المتوفرة من الأحدث إلى الأقدم
+        if not os.path.isdir(directory):
+            return []
+        names = [name for name in os.listdir(directory)
+                 if name.startswith(BACKUP_PREFIX) and name.endswith('.db.gz')]
+        return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+    @metrics.timed('db.restore')
+    def restore(self, path):
+        # فك ضغط النسخة في ملف مؤقت ثم نسخها فوق القاعدة الحية بواجهة backup، وترحيل مخططها إن كانت أقدم
+        import gzip
+        import shutil
+        handle, temp = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(handle)
+        try:
+            with gzip.open(path, 'rb') as source, open(temp, 'wb') as output:
+                shutil.copyfileobj(source, output, 1024 * 1024)
+            snapshot = sqlite3.connect(temp)
+            try:
+                with self.lock:
+                    # المستخدمون والجلسة وعداد التغييرات حالة هذا الجهاز الآن، لا حالة النسخة: تعطيل مستخدم
+                    # أو تغيير كلمة مروره لا يلغيه الاسترجاع، والسجلات الجديدة تنسب إلى المستخدم الحالي
+                    columns = [row[1] for row in self.conn.execute("PRAGMA table_info(users)")]
+                    users = self.conn.execute(f"SELECT {', '.join(columns)} FROM users").fetchall()
+                    state = self.conn.execute(
+                        "SELECT key, value FROM app_state WHERE key IN ('session', 'operator_id', 'scrypt_n')"
+                    ).fetchall()
+                    change_seq = self.get_state('change_seq')
+                    snapshot.backup(self.conn)
+                    self.reference_cache = None
+                    self.create_tables()
+                    with self.transaction() as conn:
+                        conn.execute("DELETE FROM users")
+                        conn.executemany(
+                            f"INSERT INTO users ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", users)
+                        conn.execute("DELETE FROM app_state WHERE key IN ('session', 'operator_id', 'scrypt_n')")
+                        conn.executemany("INSERT INTO app_state (key, value) VALUES (?, ?)", state)
+                        conn.execute("UPDATE app_state SET value = MAX(CAST(value AS INTEGER), ?) WHERE key = 'change_seq'",
+                                     (int(change_seq or 0),))
+            finally:
+                snapshot.close()
+        finally:
+            os.remove(temp)
+        return self.count_students()
+
+    def queue_outbox(self, sender, recipients, delta):
+        # إرسالية معلقة واحدة لكل (مرسل، مستلمين، نوع): تكرار الإرسال دون شبكة لا يضاعف الرسائل
+        payload = json.dumps([sender, sorted(recipients), bool(delta)], ensure_ascii=False)
+        payload_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        with self.transaction() as conn:
+            return conn.execute(
+                f'''INSERT OR IGNORE INTO outbox (payload_hash, sender, recipients, delta, created_at, next_attempt_at)
+                VALUES (?, ?, ?, ?, {NOW_SQL}, {NOW_SQL})''',
+                (payload_hash, sender, ', '.join(recipients), int(bool(delta)))
+            ).rowcount > 0
+
+    def due_outbox(self):
+        with self.lock:
+            return self.conn.execute(
+                f'''SELECT id, sender, recipients, delta, attempts FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= {NOW_SQL} ORDER BY id'''
+            ).fetchall()
+
+    def finish_outbox(self, outbox_id, rows, error=None):
+        # error: المستلمون الذين رفضهم الخادم بينما قبل غيرهم
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE outbox SET status = 'sent', rows = ?, sent_at = {NOW_SQL}, attempts = attempts + 1, "
+                "last_error = ? WHERE id = ?",
+                (rows, error, outbox_id)
+            )
+
+    def retry_outbox(self, outbox_id, error, delay):
+        with self.transaction() as conn:
+            conn.execute(
+                f'''UPDATE outbox SET attempts = attempts + 1, last_error = ?,
+                next_attempt_at = strftime('%Y-%m-%d %H:%M:%f', 'now', '+{int(delay)} seconds') WHERE id = ?''',
+                (error, outbox_id)
+            )
+
+    def fail_outbox(self, outbox_id, error):
+        with self.transaction() as conn:
+            conn.execute("UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                         (error, outbox_id))
+
+    def retry_outbox_now(self):
+        # الإرساليات الفاشلة تعود إلى الانتظار، وكل المنتظرة تصبح مستحقة فورا
+        with self.transaction() as conn:
+            conn.execute("UPDATE OR IGNORE outbox SET status = 'pending' WHERE status = 'failed'")
+            conn.execute(f"UPDATE outbox SET next_attempt_at = {NOW_SQL} WHERE status = 'pending'")
+
+    def outbox_status(self):
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            pending = self.conn.execute(
+                "SELECT MIN(next_attempt_at), GROUP_CONCAT(DISTINCT sender) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+            error = self.conn.execute(
+                "SELECT last_error FROM outbox WHERE status != 'sent' AND last_error IS NOT NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        return {
+            'pending': counts.get('pending', 0),
+            'failed': counts.get('failed', 0),
+            'sent': counts.get('sent', 0),
+            'next_attempt_at': pending[0],
+            'senders': pending[1].split(',') if pending[1] else [],
+            'last_error': error[0] if error else None,
+        }
+
+    def outbox_delay(self):
+        # الثواني المتبقية قبل أقرب محاولة منتظرة، أو None إن كان الصندوق فارغا
+        with self.lock:
+            return self.conn.execute(
+                "SELECT (julianday(MIN(next_attempt_at)) - julianday('now')) * 86400 FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    @property
+    def device_id(self):
+        return self.get_state('device_id')
+
+    def merge_from(self, conn, source):
+        # دمج كل صفوف source في عبارة INSERT ... SELECT واحدة:
+        # - سجل جديد (uuid غير معروف) يدرج كما هو مع معرفه ومعرف جهازه
+        # - سجل معروف يحدث فقط إن كان updated_at المصدر أحدث
+        # - سجل برقم عقد مسجل لسجل آخر يتجاهل (التكرار بين الأجهزة)
+        # ويعيد عدد الصفوف المدرجة أو المحدثة
+        # operator_id = 0: مدخل السجل مستخدم على جهاز آخر
+        columns = STUDENT_COLUMNS + list(SYNC_COLUMNS) + ['operator_id']
+        updates = ', '.join(f"{column} = excluded.{column}"
+                            for column in STUDENT_COLUMNS + ['device_id', 'updated_at'])
+        cursor = conn.execute(f'''
+        INSERT OR IGNORE INTO main.students ({', '.join(columns)})
+        SELECT {', '.join('COALESCE(birth_iso(s.birth_date), s.birth_date)' if column == 'birth_date' else f's.{column}'
+                          for column in STUDENT_COLUMNS)},
+               COALESCE(s.uuid, {NEW_UUID_SQL}), s.device_id, COALESCE(s.updated_at, {NOW_SQL}), 0
+        FROM {source} AS s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM main.students AS m
+            WHERE m.contract_number = s.contract_number AND m.contract_number != ''
+              AND m.uuid IS NOT s.uuid
+        )
+        -- سجلات الحملات المؤرشفة لا تعود إلى الجدول الحي، إلا إذا عدلت بعد انتهاء حملتها
+        AND {campaign_sql(f'COALESCE(s.updated_at, {NOW_SQL})')} NOT IN (SELECT campaign FROM main.archives)
+        ON CONFLICT (uuid) DO UPDATE SET {updates}
+        WHERE excluded.updated_at > students.updated_at
+        ''')
+        return max(cursor.rowcount, 0)
+
+    def campaigns(self):
+        # الحملات الموجودة في الجدول الحي مع عدد سجلاتها
+        with self.lock:
+            return self.conn.execute(
+                "SELECT campaign, COUNT(*) FROM students GROUP BY campaign ORDER BY campaign"
+            ).fetchall()
+
+    def assign_campaign(self, campaign):
+        # تعيين حملة للسجلات المسجلة قبل إضافة عمود الحملة، ويعيد عددها
+        with self.transaction() as conn:
+            return conn.execute("UPDATE students SET campaign = ? WHERE campaign IS NULL", (campaign,)).rowcount
+
+    def archived_campaigns(self):
+        with self.lock:
+            return self.conn.execute("SELECT campaign, rows FROM archives ORDER BY campaign").fetchall()
+
+    @metrics.timed('db.archive_campaign')
+    def archive_campaign(self, campaign, archive):
+        # نقل حملة منتهية إلى الأرشيف: كتابة الملفات أولا ثم حذف صفوفها من الجدول الحي في معاملة واحدة
+        # (الصفوف المحذوفة محددة بأكبر معرف مكتوب، فما أضيف أثناء الكتابة يبقى)، ثم VACUUM لتصغير الملف
+        if campaign >= current_campaign():
+            raise ValueError("لا يمكن أرشفة الحملة الجارية")
+        with self.lock:
+            last_id = self.conn.execute("SELECT MAX(id) FROM students WHERE campaign = ?", (campaign,)).fetchone()[0]
+        if last_id is None:
+            return 0
+        reader = self.open_reader()
+        try:
+            archive.write(reader.execute(ARCHIVE_QUERY, (campaign, last_id)), campaign, last_id)
+        finally:
+            reader.close()
+        with self.transaction() as conn:
+            removed = conn.execute("DELETE FROM students WHERE campaign = ? AND id <= ?", (campaign, last_id)).rowcount
+            conn.execute(f'''
+            INSERT INTO archives (campaign, rows, archived_at) VALUES (?, ?, {NOW_SQL})
+            ON CONFLICT (campaign) DO UPDATE SET rows = rows + excluded.rows, archived_at = excluded.archived_at
+            ''', (campaign, removed))
+        with self.lock:
+            self.conn.execute("VACUUM")
+        return removed
+
+    def merge_database(self, path):
+        # دمج قاعدة eleves.db لجهاز آخر؛ الملف المختار لا يعدل: ينسخ بواجهة backup إلى ملف مؤقت،
+        # وفتح النسخة بـ Database يرحّل مخططها القديم ويمنح صفوفها معرفات
+        handle, temp = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(self.path)))
+        os.close(handle)
+        try:
+            source = sqlite3.connect(path)
+            target = sqlite3.connect(temp)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            Database(temp).conn.close()
+            with self.lock:
+                self.conn.execute("ATTACH DATABASE ? AS src", (temp,))
+                try:
+                    with self.transaction() as conn:
+                        merged = self.merge_from(conn, 'src.students')
+                        self.fill_derived(conn)
+                finally:
+                    # DETACH غير ممكن داخل معاملة مفتوحة
+                    self.conn.execute("DETACH DATABASE src")
+        finally:
+            for leftover in (temp, temp + '-wal', temp + '-shm'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return merged
+
+    def merge_changeset(self, path):
+        # دمج ملف تغييرات مصدر (xlsx/csv/zip) بأعمدة المزامنة عبر جدول مؤقت
+        columns = STUDENT_COLUMNS + list(SYNC_COLUMNS)
+        rows = read_roster(path, columns)
+        with self.transaction() as conn:
+            conn.execute("DROP TABLE IF EXISTS temp.incoming")
+            conn.execute(f"CREATE TEMP TABLE incoming ({', '.join(columns)})")
+            while True:
+                batch = list(islice(rows, IMPORT_BATCH_SIZE))
+                if not batch:
+                    break
+                conn.executemany(
+                    f"INSERT INTO temp.incoming VALUES ({', '.join('?' * len(columns))})", batch
+                )
+            merged = self.merge_from(conn, 'temp.incoming')
+            conn.execute("DROP TABLE temp.incoming")
+            self.fill_derived(conn)
+        return merged
+
+    @metrics.timed('db.merge_files')
+    def merge_files(self, paths):
+        # دمج تدريجي لعدة أجهزة: كل ملف معاملة واحدة، ويعاد (عدد الصفوف المدمجة، عدد الملفات)
+        merged = 0
+        for path in paths:
+            if path.lower().endswith('.db'):
+                merged += self.merge_database(path)
+            else:
+                merged += self.merge_changeset(path)
+        return merged, len(paths)
+
+class Archive:
+    # أرشيف عمودي مضغوط (Parquet) للحملات المنتهية، مقسم حسب الحملة والدائرة.
+    # الاستعلامات تقرأ الأعمدة المطلوبة فقط من ملفات مفتوحة بـ mmap، وتتجاوز مجلدات الحملات غير المطلوبة.
+    # pyarrow اختياري: يستورد عند أول استعمال للأرشيف فقط
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def modules(self):
+        try:
+            import pyarrow
+            import pyarrow.dataset
+            import pyarrow.fs
+        except ImportError:
+            raise RuntimeError("الأرشيف يحتاج المكتبة pyarrow (pip install pyarrow)")
+        return pyarrow, pyarrow.dataset, pyarrow.fs
+
+    @staticmethod
+    def available():
+        # هل المكتبة pyarrow مثبتة، دون استيرادها
+        import importlib.util
+        return importlib.util.find_spec('pyarrow') is not None
+
+    def schema(self, pa):
+        return pa.schema(
+            [(column, pa.int64() if column in ARCHIVE_INTEGER_COLUMNS else pa.string()) for column in ARCHIVE_COLUMNS]
+            + [('age_band', pa.string())]
+        )
+
+    def batches(self, pa, schema, cursor, batch_size=IMPORT_BATCH_SIZE):
+        # تحويل صفوف المؤشر إلى دفعات عمودية دون تحميل الحملة كاملة في الذاكرة
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            arrays = []
+            for field, values in zip(schema, zip(*rows)):
+                if field.type == pa.string():
+                    values = [None if value is None else str(value) for value in values]
+                arrays.append(pa.array(values, type=field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def write(self, cursor, campaign, last_id):
+        # الكتابة في مجلد مؤقت مخفي ثم نقل الملفات إلى أماكنها؛ أسماء الملفات ثابتة لنفس (الحملة، آخر معرف)
+        # فإعادة أرشفة توقفت في منتصفها تستبدل الملفات بدل تكرار السجلات
+        import shutil
+        pa, ds, _ = self.modules()
+        schema = self.schema(pa)
+        staging = os.path.join(self.directory, f".staging-{campaign}")
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            parquet = ds.ParquetFileFormat()
+            ds.write_dataset(
+                self.batches(pa, schema, cursor), staging, schema=schema, format=parquet,
+                file_options=parquet.make_write_options(compression='zstd'),
+                partitioning=ARCHIVE_PARTITIONS, partitioning_flavor='hive',
+                basename_template=f"part-{campaign}-{last_id}-{{i}}.parquet",
+                existing_data_behavior='overwrite_or_ignore'
+            )
+            for folder, _, files in os.walk(staging):
+                target = os.path.join(self.directory, os.path.relpath(folder, staging))
+                for name in files:
+                    os.makedirs(target, exist_ok=True)
+                    os.replace(os.path.join(folder, name), os.path.join(target, name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def dataset(self):
+        pa, ds, fs = self.modules()
+        return ds.dataset(
+            self.directory, format='parquet', partitioning='hive',
+            filesystem=fs.LocalFileSystem(use_mmap=True)
+        )
+
+    def filter(self, campaign):
+        if campaign is None:
+            return None
+        _, ds, _ = self.modules()
+        return ds.field('campaign') == campaign
+
+    @metrics.timed('archive.counts')
+    def counts(self, columns, campaign=None):
+        # عدد المتمدرسين لكل تركيبة من الأعمدة (مثلا الدائرة والمستوى، أو الحملة والجنس)
+        # في حملة مؤرشفة أو في كل الحملات، مرتبة تنازليا
+        if not os.path.isdir(self.directory):
+            return []
+        table = self.dataset().to_table(columns=columns, filter=self.filter(campaign))
+        counts = table.group_by(columns).aggregate([([], 'count_all')])
+        rows = zip(*(counts[column].to_pylist() for column in columns + ['count_all']))
+        return sorted(rows, key=lambda row: -row[-1])
+
+    @metrics.timed('archive.statistics')
+    def statistics(self, campaign=None):
+        # نفس شكل Database.statistics حتى تعرضه صفحة الإحصائيات كما هو
+        total = self.dataset().count_rows(filter=self.filter(campaign)) if os.path.isdir(self.directory) else 0
+        stats = {'total': total}
+        for key, column in (('district', 'district'), ('chapter', 'chapter'), ('level', 'level'),
+                            ('gender', 'gender'), ('age', 'age_band')):
+            stats[key] = self.counts([column], campaign)
+        return stats
+
+class StreamedMessage:
+    # رسالة MIME مرفقها في ملف مؤقت: الرؤوس والنص تبنى بـ email.mime، والمرفق يرمز base64
+    # على دفعات أثناء الإرسال، فلا يوجد في الذاكرة إلا دفعة واحدة مهما كان حجم الملف
+    # 57 بايت من الملف = سطر base64 واحد من 76 حرفا
+    CHUNK_SIZE = 57 * 1024
+
+    def __init__(self, msg, part, source):
+        from email import policy
+        marker = f"@@attachment-{os.urandom(8).hex()}@@"
+        part.set_payload(marker)
+        part['Content-Transfer-Encoding'] = 'base64'
+        # نسخة SMTP من الرسالة (أسطر CRLF) مقسومة عند موضع المرفق؛ النقطة في بداية سطر تضاعف (RFC 5321)
+        head, tail = msg.as_bytes(policy=policy.compat32.clone(linesep='\r\n')).split(marker.encode('ascii'))
+        tail = tail.lstrip(b'\r\n')
+        self.head = re.sub(rb'(?m)^\.', b'..', head)
+        self.tail = re.sub(rb'(?m)^\.', b'..', tail if tail.endswith(b'\r\n') else tail + b'\r\n')
+        self.source = source
+
+    def chunks(self):
+        import base64
+        self.source.seek(0)
+        yield self.head
+        while True:
+            data = self.source.read(self.CHUNK_SIZE)
+            if not data:
+                break
+            yield base64.encodebytes(data).replace(b'\n', b'\r\n')
+        yield self.tail
+
+class MailService:
+    # اتصال SMTP واحد مصادق عليه يعاد استعماله لعدة رسائل، مع إعادة المحاولة عند الأعطال المؤقتة
+    # الخادم وفئة الاتصال قابلان للتغيير لتجربة الإرسال على خادم محلي دون شبكة
+    def __init__(self, sender, password, host='smtp.gmail.com', port=587, use_tls=True,
+                 retries=3, backoff=2.0, timeout=60, smtp_class=None, sleep=time.sleep):
+        # smtplib يستورد مرة واحدة عند إنشاء الخدمة، وتستعمل استثناءاته من self.smtplib
+        import smtplib
+        self.smtplib = smtplib
+        self.sender = sender
+        self.password = password
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.smtp_class = smtp_class or smtplib.SMTP
+        self.sleep = sleep
+        self.server = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        server = self.smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.password:
+                server.login(self.sender, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+
+    def connection(self):
+        # إعادة استعمال الاتصال الحالي إن كان ما يزال مفتوحا (NOOP)، وإلا فتح اتصال جديد
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] == 250:
+                    return self.server
+            except (self.smtplib.SMTPException, OSError):
+                pass
+            self.drop()
+        self.connect()
+        return self.server
+
+    def drop(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (self.smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+    def is_transient(self, ex):
+        # رموز 4xx وانقطاع الاتصال أو الشبكة أعطال مؤقتة، أما رفض المصادقة أو العنوان فنهائي
+        if isinstance(ex, self.smtplib.SMTPResponseException):
+            return 400 <= ex.smtp_code < 500
+        if isinstance(ex, self.smtplib.SMTPServerDisconnected):
+            return True
+        return isinstance(ex, OSError) and not isinstance(ex, self.smtplib.SMTPException)
+
+    @metrics.timed('smtp.send')
+    def send(self, msg, recipients):
+        # تعيد المستلمين الذين رفضهم الخادم ({العنوان: (الرمز، الرد)}) عندما يقبل بعضهم فقط
+        attempt = 0
+        while True:
+            try:
+                with self.lock:
+                    if isinstance(msg, StreamedMessage):
+                        return self.transmit(self.connection(), msg, recipients)
+                    return self.connection().sendmail(self.sender, recipients, msg.as_string())
+            except Exception as ex:
+                self.drop()
+                attempt += 1
+                if attempt > self.retries or not self.is_transient(ex):
+                    raise
+                metrics.count('smtp.retries')
+                self.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def transmit(self, server, msg, recipients):
+        # مثل sendmail، لكن نص الرسالة يكتب في المقبس دفعة بعد دفعة بعد أمر DATA
+        server.ehlo_or_helo_if_needed()
+        code, response = server.mail(self.sender)
+        if code != 250:
+            raise self.smtplib.SMTPSenderRefused(code, response, self.sender)
+        refused = {}
+        for recipient in recipients:
+            code, response = server.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            server.rset()
+            raise self.smtplib.SMTPRecipientsRefused(refused)
+        server.putcmd('data')
+        code, response = server.getreply()
+        if code != 354:
+            raise self.smtplib.SMTPDataError(code, response)
+        for chunk in msg.chunks():
+            server.send(chunk)
+        server.send(b'.\r\n')
+        code, response = server.getreply()
+        if code != 250:
+            raise self.smtplib.SMTPDataError(code, response)
+        return refused
+
+    def send_many(self, messages):
+        # messages: أزواج (رسالة، قائمة المستلمين) ترسل كلها عبر نفس الاتصال
+        for msg, recipients in messages:
+            self.send(msg, recipients)
+
+    def close(self):
+        with self.lock:
+            self.drop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def parse_recipients(text):
+    return [address.strip() for address in re.split(r'[,;\s]+', text or '') if address.strip()]
+
+def format_refused(refused):
+    # نص يحفظ في last_error: "العنوان: الرمز الرد" لكل مستلم مرفوض، أو None
+    if not refused:
+        return None
+    return '; '.join(f"{recipient}: {code} {response.decode('utf-8', 'replace') if isinstance(response, bytes) else response}"
+                     for recipient, (code, response) in sorted(refused.items()))
+
+def build_attachment(reader, delta, since, until):
+    # since و until أرقام تغيير (change_seq)
+    # التصدير يكتب في ملف مؤقت (في الذاكرة حتى ATTACHMENT_SPOOL_SIZE ثم على القرص) بدل مجلد العمل
+    attachment = tempfile.SpooledTemporaryFile(max_size=ATTACHMENT_SPOOL_SIZE)
+    try:
+        if delta:
+            filename = "bd_students_delta.zip"
+            count = stream_export_csv_zip(
+                reader, attachment, "bd_students_delta.csv",
+                EXPORT_QUERY + " WHERE change_seq > ? AND change_seq <= ? ORDER BY change_seq", (since, until)
+            )
+        else:
+            filename = "bd_students.xlsx"
+            count = stream_export_xlsx(reader, attachment, EXPORT_QUERY + " WHERE change_seq <= ?", (until,))
+    except Exception:
+        attachment.close()
+        raise
+    return attachment, filename, count
+
+def build_message(sender, recipients, attachment, filename, count, delta):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.base import MIMEBase
+    from email.mime.text import MIMEText
+    from email.header import Header
+    # إعداد البريد الإلكتروني
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = Header("بيانات المتمدرسين", 'utf-8')
+    
+    body = "مرفق ملف بيانات المتمدرسين"
+    if delta:
+        body += f" (السجلات الجديدة أو المعدلة منذ آخر إرسال: {count})"
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # المرفق يرمز ويرسل على دفعات من الملف المؤقت عند الإرسال
+    part = MIMEBase('application', 'zip' if delta else 'octet-stream')
+    part.add_header('Content-Disposition', 'attachment; filename= %s' % filename)
+    msg.attach(part)
+    return StreamedMessage(msg, part, attachment)
+
+class Outbox:
+    # صندوق الصادر: كل إرسال يسجل أولا في جدول outbox ثم يرسله خيط خلفي، مع إعادة المحاولة بتأخير
+    # متزايد عند انقطاع الشبكة. المرفق يبنى عند الإرسال الفعلي فيحمل آخر البيانات،
+    # وكلمة مرور البريد تبقى في الذاكرة فقط ولا تكتب في القاعدة
+    def __init__(self, db, jobs, mail_factory=None, backoff=OUTBOX_BACKOFF, max_delay=OUTBOX_MAX_DELAY):
+        self.db = db
+        self.jobs = jobs
+        # إعادة المحاولة يتولاها الصندوق نفسه، فلا ينتظر MailService بين المحاولات
+        self.mail_factory = mail_factory or (lambda sender, password: MailService(sender, password, retries=0))
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.passwords = {}
+        self.services = {}
+        self.listeners = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def enqueue(self, sender, password, recipients, delta):
+        # علامة آخر إرسال (رقم آخر تغيير محلي مرسل) تحفظ لكل مستلم حتى يستقبل كل منهم ما فاته فقط،
+        # والمستلمون الذين لهم نفس العلامة يتشاركون نفس المرفق ونفس الرسالة
+        self.passwords[sender] = password
+        groups = {}
+        for recipient in recipients:
+            since = self.watermark(recipient) if delta else 0
+            groups.setdefault(since, []).append(recipient)
+        queued = sum(self.db.queue_outbox(sender, group, delta) for group in groups.values())
+        self.wake()
+        return queued
+
+    def watermark(self, recipient):
+        return int(self.db.get_state(f"email_sequence:{recipient}", 0))
+
+    def unlock(self, sender, password):
+        # كلمة مرور مرسل له إرساليات معلقة من جلسة سابقة: الإفراغ يبدأ فور إدخالها
+        self.passwords[sender] = password
+        self.wake()
+
+    def retry_now(self):
+        self.db.retry_outbox_now()
+        self.wake()
+
+    def wake(self, delay=0):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(delay, self.run)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def run(self):
+        if not self.jobs.submit('email', self.drain, on_done=self.on_drained, on_error=self.on_drained):
+            # إفراغ جار: إعادة الفحص بعد انتهائه حتى لا تبقى إرسالية أضيفت أثناءه
+            self.wake(1)
+            return
+        self.notify()
+
+    @metrics.timed('send_email')
+    def drain(self):
+        # إرسال كل المستحق ممن كلمة مروره معروفة، ويعيد عدد السجلات المرسلة
+        sent = 0
+        while True:
+            items = [item for item in self.db.due_outbox() if item[1] in self.passwords]
+            if not items:
+                return sent
+            for item in items:
+                sent += self.deliver(*item)
+                self.notify()
+
+    def deliver(self, outbox_id, sender, recipients, delta, attempts):
+        # كلمة المرور قد تنسى أثناء الإفراغ (الخروج): الإرسالية تبقى معلقة حتى تدخل من جديد
+        password = self.passwords.get(sender)
+        if password is None:
+            return 0
+        recipients = parse_recipients(recipients)
+        since = self.watermark(recipients[0]) if delta else 0
+        reader = self.db.open_reader()
+        try:
+            # لقطة واحدة: العلامة الجديدة وصفوف المرفق من نفس حالة الجدول
+            reader.execute("BEGIN")
+            until = reader.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+            if until is None or until <= since:
+                self.db.finish_outbox(outbox_id, 0)
+                return 0
+            with metrics.timed('email.attachment'):
+                attachment, filename, count = build_attachment(reader, delta, since, until)
+            try:
+                msg = build_message(sender, recipients, attachment, filename, count, delta)
+                refused = self.service(sender, password).send(msg, recipients)
+            finally:
+                attachment.close()
+        except Exception as ex:
+            service = self.services.pop(sender, None)
+            if service is not None:
+                service.close()
+            if service is not None and service.is_transient(ex):
+                # انقطاع الشبكة أو عطل مؤقت في الخادم: محاولة لاحقة بتأخير مضاعف
+                self.db.retry_outbox(outbox_id, str(ex), min(self.backoff * 2 ** attempts, self.max_delay))
+                metrics.count('outbox.retries')
+            else:
+                # رفض المصادقة أو العناوين: لا فائدة من الإعادة، وكلمة المرور تطلب من جديد
+                self.db.fail_outbox(outbox_id, str(ex))
+                self.passwords.pop(sender, None)
+            return 0
+        finally:
+            reader.close()
+        # تحديث العلامة بعد نجاح الإرسال فقط، ولمن قبلهم الخادم فقط: المرفوض تصله السجلات كلها في الإرسال التالي
+        for recipient in recipients:
+            if recipient not in refused:
+                self.db.set_state(f"email_sequence:{recipient}", str(until))
+        self.db.finish_outbox(outbox_id, count, format_refused(refused))
+        metrics.count('email.rows', count)
+        return count
+
+    def service(self, sender, password):
+        # اتصال البريد يبقى مفتوحا بين الإرساليات ما دامت بيانات الحساب نفسها
+        service = self.services.get(sender)
+        if service is None or service.password != password:
+            if service is not None:
+                service.close()
+            service = self.services[sender] = self.mail_factory(sender, password)
+        return service
+
+    def forget(self):
+        # عند الخروج: كلمات المرور واتصالات البريد والمستمعون لا تبقى للمستخدم التالي؛
+        # الإرساليات المعلقة تبقى في القاعدة وتنتظر كلمة مرور مرسلها من جديد
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+        self.passwords.clear()
+        self.listeners.clear()
+        for service in list(self.services.values()):
+            service.close()
+        self.services.clear()
+
+    def on_drained(self, result):
+        delay = self.db.outbox_delay()
+        if delay is None:
+            for service in list(self.services.values()):
+                service.close()
+            self.services.clear()
+        elif any(sender in self.passwords for sender in self.db.outbox_status()['senders']):
+            self.wake(max(delay, 1))
+        self.notify()
+
+    def status(self):
+        status = self.db.outbox_status()
+        status['running'] = self.jobs.is_running('email')
+        status['waiting_password'] = [sender for sender in status['senders'] if sender not in self.passwords]
+        return status
+
+    def notify(self):
+        status = self.status()
+        for listener in self.listeners:
+            listener(status)
+
+class EmailPage:
+    def __init__(self, page: ft.Page, db, jobs, on_back, outbox=None):
+        self.page = page
+        self.db = db
+        self.jobs = jobs
+        self.on_back = on_back
+        self.outbox = outbox or Outbox(db, jobs)
+        self.init_fields()
+        self.container = self.build()
+        self.listening = False
+    
+    def init_fields(self):
+        self.sender_email = ft.TextField(
+            label="البريد الإلكتروني للمرسل (Gmail)",
+            text_align="right",
+            width=350,
+            border_color=ft.Colors.GREEN,
+            focused_border_color=ft.Colors.GREEN_900,
+            prefix_icon=ft.Icons.EMAIL,
+            helper_text="أدخل بريدك الإلكتروني على Gmail"
+        )
+        self.recipient_email = ft.TextField(
+            label="البريد الإلكتروني للمستلم",
+            text_align="right",
+            width=350,
+            border_color=ft.Colors.GREEN,
+            focused_border_color=ft.Colors.GREEN_900,
+            prefix_icon=ft.Icons.FORWARD_TO_INBOX,
+            helper_text="يمكن إدخال عدة عناوين مفصولة بفاصلة"
+        )
+        self.password = ft.TextField(
+            label="كلمة المرور",
+            password=True,
+            text_align="right",
+            width=350,
+            border_color=ft.Colors.GREEN,
+            focused_border_color=ft.Colors.GREEN_900,
+            prefix_icon=ft.Icons.LOCK,
+            helper_text="أدخل كلمة مرور حساب Gmail الخاص بك"
+        )
+        self.delta_only = ft.Checkbox(
+            label="إرسال السجلات الجديدة أو المعدلة فقط منذ آخر إرسال",
+            value=True,
+            width=350
+        )
+        # مؤشر التقدم ورسالة الحالة أثناء الإرسال في الخلفية
+        self.progress = ft.ProgressBar(width=350, visible=False, color=ft.Colors.GREEN)
+        self.status = ft.Text("", size=14, color=ft.Colors.GREY_700, text_align="right")
+        # حالة صندوق الصادر
+        self.queue_status = ft.Text("", size=14, color=ft.Colors.BLUE_GREY_700, text_align="right")
+    
+    def send_email(self, e):
+        if not self.sender_email.value or not self.recipient_email.value or not self.password.value:
+            show_snack_bar(self.page, "الرجاء إدخال جميع البيانات المطلوبة")
+            return
+
+        recipients = parse_recipients(self.recipient_email.value)
+        queued = self.outbox.enqueue(self.sender_email.value, self.password.value, recipients, self.delta_only.value)
+        if queued:
+            show_snack_bar(self.page, "تمت إضافة الإرسال إلى صندوق الصادر، وسيرسل فور توفر الاتصال")
+        else:
+            show_snack_bar(self.page, "هذا الإرسال موجود في صندوق الصادر وينتظر دوره")
+
+    def retry_now(self, e):
+        # كلمة المرور المدخلة تفتح إرساليات مرسلها المعلقة قبل إعادة المحاولة
+        if self.sender_email.value and self.password.value:
+            self.outbox.unlock(self.sender_email.value, self.password.value)
+        self.outbox.retry_now()
+
+    def show_queue_status(self, status):
+        # يستدعى من خيط الإرسال بعد كل إرسالية، ويحدث عناصر الحالة وحدها
+        lines = [f"في صندوق الصادر: {status['pending']}", f"مرسلة: {status['sent']}"]
+        if status['failed']:
+            lines.append(f"فاشلة: {status['failed']}")
+        if status['pending'] and status['next_attempt_at'] and not status['running']:
+            lines.append(f"المحاولة التالية: {status['next_attempt_at'][11:16]} (UTC)")
+        if status['waiting_password']:
+            lines.append("بانتظار كلمة المرور: " + ', '.join(status['waiting_password']))
+        if status['last_error'] and (status['pending'] or status['failed']):
+            lines.append(f"آخر خطأ: {status['last_error']}")
+        self.queue_status.value = ' | '.join(lines)
+        self.set_busy(status['running'], "جاري تصدير البيانات وإرسالها..." if status['running'] else "")
+
+    def on_show(self):
+        # الاستماع لصندوق الصادر يبدأ بعد إضافة الشاشة إلى الصفحة
+        if not self.listening:
+            self.listening = True
+            self.outbox.listeners.append(self.show_queue_status)
+        self.show_queue_status(self.outbox.status())
+
+    def set_busy(self, busy, message=""):
+        self.progress.visible = busy
+        self.status.value = message
+        self.page.update(self.progress, self.status, self.queue_status)
+
+    def go_back(self, e):
+        self.on_back()
+    
+    def build(self):
+        # إنشاء زر الإرسال
+        self.send_button = ft.ElevatedButton(
+            "إرسال",
+            on_click=self.send_email,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.GREEN,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        retry_button = ft.TextButton(
+            "إعادة المحاولة الآن",
+            icon=ft.Icons.REFRESH,
+            on_click=self.retry_now
+        )
+        
+        # إنشاء زر العودة
+        back_button = ft.ElevatedButton(
+            "العودة",
+            on_click=self.go_back,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.RED,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+
+        # تنظيم العناصر في عمود
+        return ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Text(
+                        "إرسال البيانات عبر البريد الإلكتروني",
+                        size=24,
+                        weight=ft.FontWeight.BOLD,
+                        color=ft.Colors.GREEN_900,
+                        text_align="right"
+                    ),
+                    ft.Text(
+                        "يرجى استخدام حساب Gmail لإرسال البيانات",
+                        size=16,
+                        color=ft.Colors.GREY_700,
+                        text_align="right"
+                    ),
+                    self.sender_email,
+                    self.recipient_email,
+                    self.password,
+                    self.delta_only,
+                    self.progress,
+                    self.status,
+                    self.queue_status,
+                    retry_button,
+                    ft.Column([
+                        self.send_button,
+                        back_button
+                    ], alignment=ft.MainAxisAlignment.CENTER, spacing=20)
+                ],
+                spacing=20,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            padding=30,
+            border_radius=10,
+            bgcolor=ft.Colors.WHITE,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.Colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0)
+            )
+        )
+
+class StatsPage:
+    def __init__(self, page: ft.Page, db, jobs, on_back, archive=None):
+        self.page = page
+        self.db = db
+        self.jobs = jobs
+        self.on_back = on_back
+        self.archive = archive or Archive()
+        # مصدر الإحصائيات: الجدول الحي، أو حملة مؤرشفة، أو كل الحملات المؤرشفة
+        self.source = ft.Dropdown(label="الحملة", width=350, value='live', on_change=self.refresh)
+        self.update_sources()
+        self.sections = ft.Column(spacing=20, horizontal_alignment=ft.CrossAxisAlignment.STRETCH)
+        self.progress = ft.ProgressBar(width=350, color=ft.Colors.GREEN)
+        self.container = self.build()
+
+    def update_sources(self):
+        archived = self.db.archived_campaigns()
+        self.source.options = [ft.dropdown.Option('live', "الحملة الحالية")] + [
+            ft.dropdown.Option(str(campaign), f"حملة {campaign}/{campaign + 1} (أرشيف)") for campaign, _ in archived
+        ] + ([ft.dropdown.Option('all', "كل الحملات المؤرشفة")] if archived else [])
+        if self.source.value not in [option.key for option in self.source.options]:
+            self.source.value = 'live'
+
+    def refresh(self, e=None):
+        source = self.source.value
+        if source == 'live':
+            work = self.db.statistics
+        else:
+            work = lambda: self.archive.statistics(None if source == 'all' else int(source))
+        if self.jobs.submit('stats', work, on_done=self.show_statistics, on_error=self.on_failed):
+            self.progress.visible = True
+            if e is not None:
+                self.page.update(self.progress)
+
+    def on_show(self):
+        self.update_sources()
+        self.refresh()
+        self.page.update(self.source, self.progress)
+
+    def on_failed(self, ex):
+        self.progress.visible = False
+        show_snack_bar(self.page, f"خطأ في حساب الإحصائيات: {str(ex)}")
+
+    def breakdown(self, title, rows, total):
+        lines = [ft.Text(title, size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_900)]
+        for value, count in rows:
+            lines.append(ft.Row([
+                ft.Text(value or "غير محدد", expand=True),
+                ft.Text(str(count), weight=ft.FontWeight.BOLD),
+            ]))
+            lines.append(ft.ProgressBar(value=count / total if total else 0, color=ft.Colors.GREEN,
+                                        bgcolor=ft.Colors.GREEN_50))
+        return ft.Column(lines, spacing=5)
+
+    def show_statistics(self, stats):
+        total = stats['total']
+        self.sections.controls = [
+            ft.Text(f"مجموع المسجلين: {total}", size=20, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_900),
+            self.breakdown("حسب الدائرة", stats['district'], total),
+            self.breakdown("حسب الفصل", stats['chapter'], total),
+            self.breakdown("حسب المستوى", stats['level'], total),
+            self.breakdown("حسب الجنس", stats['gender'], total),
+            self.breakdown("حسب الفئة العمرية", stats['age'], total),
+        ]
+        self.progress.visible = False
+        self.page.update(self.sections, self.progress)
+
+    def build(self):
+        refresh_button = ft.ElevatedButton(
+            "تحديث",
+            on_click=self.refresh,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.GREEN,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        back_button = ft.ElevatedButton(
+            "العودة",
+            on_click=lambda _: self.on_back(),
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.RED,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+
+        return ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Text(
+                        "إحصائيات التسجيل",
+                        size=24,
+                        weight=ft.FontWeight.BOLD,
+                        color=ft.Colors.GREEN_900,
+                        text_align="right"
+                    ),
+                    self.source,
+                    self.progress,
+                    self.sections,
+                    ft.Column([
+                        refresh_button,
+                        back_button
+                    ], alignment=ft.MainAxisAlignment.CENTER, spacing=20)
+                ],
+                spacing=20,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            padding=30,
+            border_radius=10,
+            bgcolor=ft.Colors.WHITE,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.Colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0)
+            )
+        )
+
+class DiagnosticsPage:
+    # أزمنة العمليات المقيسة (النسب المئوية بالميلي ثانية) والعدادات، مع تفعيل وضع التحليل cProfile للجلسة
+    def __init__(self, page: ft.Page, on_back):
+        self.page = page
+        self.on_back = on_back
+        self.sections = ft.Column(spacing=10, horizontal_alignment=ft.CrossAxisAlignment.STRETCH)
+        self.profile_switch = ft.Switch(label="وضع التحليل (cProfile)", value=metrics.profiling,
+                                        on_change=self.toggle_profile)
+        self.container = self.build()
+
+    def refresh(self, e=None):
+        rows, counters = metrics.summary()
+        header = ft.Row([
+            ft.Text("العملية", expand=True, weight=ft.FontWeight.BOLD),
+            *[ft.Text(title, width=48, weight=ft.FontWeight.BOLD) for title in ("العدد", "p50", "p90", "p99", "الأقصى")],
+        ])
+        lines = [header]
+        for name, count, p50, p90, p99, worst in rows:
+            lines.append(ft.Row([
+                ft.Text(name, expand=True),
+                ft.Text(str(count), width=48),
+                *[ft.Text(f"{value:.0f}", width=48) for value in (p50, p90, p99, worst)],
+            ]))
+        if not rows:
+            lines.append(ft.Text("لا توجد قياسات بعد", text_align="right"))
+        lines.append(ft.Divider())
+        for name, value in counters.items():
+            lines.append(ft.Row([ft.Text(name, expand=True), ft.Text(str(value), weight=ft.FontWeight.BOLD)]))
+        lines.append(ft.Text(f"السجل: {os.path.abspath(metrics.path)}", size=12, color=ft.Colors.GREY_700))
+        self.sections.controls = lines
+        self.page.update(self.sections)
+
+    def on_show(self):
+        self.profile_switch.value = metrics.profiling
+        self.refresh()
+
+    def toggle_profile(self, e):
+        if self.profile_switch.value:
+            metrics.start_profile()
+            show_snack_bar(self.page, "تم تفعيل وضع التحليل")
+            return
+        path = metrics.stop_profile()
+        show_snack_bar(self.page, f"تم حفظ التحليل في {path}" if path else "لم تسجل أي عملية أثناء التحليل")
+
+    def build(self):
+        refresh_button = ft.ElevatedButton(
+            "تحديث",
+            on_click=self.refresh,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.GREEN,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        back_button = ft.ElevatedButton(
+            "العودة",
+            on_click=lambda _: self.on_back(),
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.RED,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+
+        return ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Text(
+                        "التشخيص",
+                        size=24,
+                        weight=ft.FontWeight.BOLD,
+                        color=ft.Colors.GREEN_900,
+                        text_align="right"
+                    ),
+                    self.sections,
+                    self.profile_switch,
+                    ft.Column([
+                        refresh_button,
+                        back_button
+                    ], alignment=ft.MainAxisAlignment.CENTER, spacing=20)
+                ],
+                spacing=20,
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            padding=30,
+            border_radius=10,
+            bgcolor=ft.Colors.WHITE,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.Colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0)
+            )
+        )
 
-class EmailPage:
-    def __init__(self, page: ft.Page, db, on_back):
+class StudentListPage:
+    # قائمة المتمدرسين: تحمل الصفوف صفحة بصفحة عند الاقتراب من نهاية القائمة
+    PAGE_SIZE = 50
+
+    def __init__(self, page: ft.Page, db, jobs, on_back):
         self.page = page
         self.db = db
+        self.jobs = jobs
         self.on_back = on_back
+        self.last_id = 0
+        self.exhausted = False
+        self.reload_pending = False
+        self.search_timer = None
         self.init_fields()
         self.container = self.build()
-    
+
     def init_fields(self):
-        self.sender_email = ft.TextField(
-            label="البريد الإلكتروني للمرسل (Gmail)",
+        self.search = ft.TextField(
+            label="بحث بالاسم أو رقم العقد أو المؤسسة",
             text_align="right",
             width=350,
             border_color=ft.Colors.GREEN,
             focused_border_color=ft.Colors.GREEN_900,
-            prefix_icon=ft.Icons.EMAIL,
-            helper_text="أدخل بريدك الإلكتروني على Gmail"
-        )
-        self.recipient_email = ft.TextField(
-            label="البريد الإلكتروني للمستلم",
-            text_align="right",
-            width=350,
-            border_color=ft.Colors.GREEN,
-            focused_border_color=ft.Colors.GREEN_900,
-            prefix_icon=ft.Icons.FORWARD_TO_INBOX,
-            helper_text="أدخل البريد الإلكتروني الذي تريد إرسال البيانات إليه"
+            prefix_icon=ft.Icons.SEARCH,
+            on_change=self.on_search_changed,
+            on_submit=lambda _: self.reload()
         )
-        self.password = ft.TextField(
-            label="كلمة المرور",
-            password=True,
-            text_align="right",
-            width=350,
-            border_color=ft.Colors.GREEN,
-            focused_border_color=ft.Colors.GREEN_900,
-            prefix_icon=ft.Icons.LOCK,
-            helper_text="أدخل كلمة مرور حساب Gmail الخاص بك"
+        # item_extent ثابت يسمح لـ Flutter ببناء العناصر الظاهرة فقط
+        self.list_view = ft.ListView(
+            height=500,
+            item_extent=72,
+            on_scroll=self.on_scroll,
+            on_scroll_interval=100
         )
-    
-    def send_email(self, e):
-        if not self.sender_email.value or not self.recipient_email.value or not self.password.value:
-            self.page.snack_bar = ft.SnackBar(content=ft.Text("الرجاء إدخال جميع البيانات المطلوبة"))
-            self.page.snack_bar.open = True
-            self.page.update()
+        self.summary = ft.Text("", size=14, color=ft.Colors.GREY_700)
+        self.mine_only = ft.Checkbox(label="سجلاتي فقط", value=False, on_change=lambda _: self.reload())
+
+    def on_search_changed(self, e):
+        # تأخير البحث حتى يتوقف المستخدم عن الكتابة
+        if self.search_timer:
+            self.search_timer.cancel()
+        self.search_timer = threading.Timer(0.4, self.reload)
+        self.search_timer.start()
+
+    def on_show(self):
+        # أول عرض أو العودة إلى القائمة المخزنة: إعادة التحميل لإظهار السجلات المحفوظة منذ آخر عرض
+        self.reload()
+
+    def on_drop(self):
+        if self.search_timer:
+            self.search_timer.cancel()
+            self.search_timer = None
+
+    def reload(self):
+        self.last_id = 0
+        self.exhausted = False
+        self.list_view.controls.clear()
+        self.load_more()
+
+    def load_more(self):
+        if self.exhausted:
             return
+        search = (self.search.value or "").strip() or None
+        operator_id = self.db.user['id'] if self.mine_only.value and self.db.user else None
+        after_id = self.last_id
+        if not self.jobs.submit('student_list',
+                                lambda: self.db.page_students(after_id, search, self.PAGE_SIZE, operator_id),
+                                on_done=lambda rows: self.on_loaded(after_id, rows),
+                                on_error=self.on_failed):
+            # صفحة قيد التحميل: إعادة البحث بعد انتهائها إن تغير النص
+            if after_id == 0:
+                self.reload_pending = True
+
+    def on_loaded(self, after_id, rows):
+        if self.reload_pending:
+            self.reload_pending = False
+            self.reload()
+            return
+        if after_id != self.last_id:
+            return
+        self.list_view.controls.extend(self.build_row(row) for row in rows)
+        if rows:
+            self.last_id = rows[-1][0]
+        self.exhausted = len(rows) < self.PAGE_SIZE
+        self.summary.value = f"المعروض: {len(self.list_view.controls)}" + ("" if self.exhausted else " ...")
+        self.page.update(self.list_view, self.summary)
+
+    def on_failed(self, ex):
+        show_snack_bar(self.page, f"خطأ في تحميل القائمة: {str(ex)}")
+
+    def export_duplicates(self, e):
+        if not self.jobs.submit('duplicates', lambda: self.db.export_duplicate_report('duplicates.xlsx'),
+                                on_done=self.on_duplicates_exported, on_error=self.on_failed):
+            show_snack_bar(self.page, "عملية التقرير جارية، الرجاء الانتظار")
+
+    def on_duplicates_exported(self, count):
+        if count:
+            show_snack_bar(self.page, f"تم تصدير {count} سجل(ا) مكررا محتملا إلى duplicates.xlsx")
+        else:
+            show_snack_bar(self.page, "لا توجد سجلات مكررة")
+
+    def on_scroll(self, e: ft.OnScrollEvent):
+        if e.pixels >= e.max_scroll_extent - 300:
+            self.load_more()
+
+    def build_row(self, row):
+        student_id, last_name, first_name, contract_number, school, district = row
+        return ft.ListTile(
+            leading=ft.Icon(ft.Icons.PERSON, color=ft.Colors.GREEN),
+            title=ft.Text(f"{last_name or ''} {first_name or ''}", text_align="right"),
+            subtitle=ft.Text(
+                f"رقم العقد: {contract_number or '-'} | {school or '-'} | {district or '-'}",
+                size=12,
+                text_align="right"
+            ),
+        )
 
-        try:
-            # تصدير البيانات إلى Excel أولاً
-            df = pd.read_sql_query("SELECT * FROM students", self.db.conn)
-            df.to_excel("bd_students.xlsx", index=False)
-            
-            # إعداد البريد الإلكتروني
-            msg = MIMEMultipart()
-            msg['From'] = self.sender_email.value
-            msg['To'] = self.recipient_email.value
-            msg['Subject'] = "بيانات المتمدرسين"
-            
-            body = "مرفق ملف بيانات المتمدرسين"
-            msg.attach(MIMEText(body, 'plain'))
-            
-            # إضافة المرفق
-            attachment = open("bd_students.xlsx", "rb")
-            part = MIMEBase('application', 'octet-stream')
-            part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', 'attachment; filename= %s' % "bd_students.xlsx")
-            msg.attach(part)
-            
-            # إرسال البريد الإلكتروني
-            server = smtplib.SMTP('smtp.gmail.com', 587)
-            server.starttls()
-            server.login(self.sender_email.value, self.password.value)
-            text = msg.as_string()
-            server.sendmail(self.sender_email.value, self.recipient_email.value, text)
-            server.quit()
-            
-            self.page.snack_bar = ft.SnackBar(content=ft.Text("تم إرسال البيانات بنجاح"))
-            self.page.snack_bar.open = True
-            self.page.update()
-        except Exception as ex:
-            self.page.snack_bar = ft.SnackBar(content=ft.Text(f"خطأ في إرسال البريد: {str(ex)}"))
-            self.page.snack_bar.open = True
-            self.page.update()
-    
     def build(self):
-        # إنشاء زر الإرسال
-        send_button = ft.ElevatedButton(
-            "إرسال",
-            on_click=self.send_email,
+        back_button = ft.ElevatedButton(
+            "العودة",
+            on_click=lambda _: self.on_back(),
             style=ft.ButtonStyle(
                 color=ft.Colors.WHITE,
-                bgcolor=ft.Colors.GREEN,
+                bgcolor=ft.Colors.RED,
                 padding=15,
                 shape=ft.RoundedRectangleBorder(radius=10),
                 animation_duration=500
             ),
             width=350
         )
-        
-        # إنشاء زر العودة
-        back_button = ft.ElevatedButton(
-            "العودة",
-            on_click=lambda _: self.on_back(),
+
+        duplicates_button = ft.ElevatedButton(
+            "تقرير التكرارات المحتملة",
+            on_click=self.export_duplicates,
             style=ft.ButtonStyle(
                 color=ft.Colors.WHITE,
-                bgcolor=ft.Colors.RED,
+                bgcolor=ft.Colors.ORANGE,
                 padding=15,
                 shape=ft.RoundedRectangleBorder(radius=10),
                 animation_duration=500
@@ -154,198 +2873,782 @@ class EmailPage:
             width=350
         )
 
-        # تنظيم العناصر في عمود
         return ft.Container(
             content=ft.Column(
                 controls=[
                     ft.Text(
-                        "إرسال البيانات عبر البريد الإلكتروني",
+                        "قائمة المتمدرسين",
                         size=24,
                         weight=ft.FontWeight.BOLD,
                         color=ft.Colors.GREEN_900,
                         text_align="right"
                     ),
-                    ft.Text(
-                        "يرجى استخدام حساب Gmail لإرسال البيانات",
-                        size=16,
-                        color=ft.Colors.GREY_700,
-                        text_align="right"
-                    ),
-                    self.sender_email,
-                    self.recipient_email,
-                    self.password,
-                    ft.Column([
-                        send_button,
-                        back_button
-                    ], alignment=ft.MainAxisAlignment.CENTER, spacing=20)
+                    self.search,
+                    self.mine_only,
+                    self.summary,
+                    self.list_view,
+                    duplicates_button,
+                    back_button
                 ],
                 spacing=20,
                 horizontal_alignment=ft.CrossAxisAlignment.CENTER
             ),
-            padding=30,
-            border_radius=10,
-            bgcolor=ft.Colors.WHITE,
-            shadow=ft.BoxShadow(
-                spread_radius=1,
-                blur_radius=15,
-                color=ft.Colors.BLUE_GREY_100,
-                offset=ft.Offset(0, 0)
-            )
+            padding=30,
+            border_radius=10,
+            bgcolor=ft.Colors.WHITE,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.Colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0)
+            )
+        )
+
+class StudentManagement:
+    # حقول سياق الفوج (المنسق، المعلم، المؤسسة...) ثابتة لكل متمدرسي الفوج فتبقى بعد الحفظ
+    STICKY_FIELDS = ['coordinator', 'teacher_name', 'teacher_first_name', 'district', 'municipality', 'school',
+                     'chapter', 'group', 'level']
+    PERSONAL_FIELDS = ['last_name', 'first_name', 'birth_date', 'birth_place', 'contract_number', 'father_name',
+                       'mother_last_name', 'mother_first_name', 'gender']
+    # مهلة التوقف عن الكتابة قبل حفظ المسودة
+    DRAFT_DELAY = 1.5
+
+    def __init__(self, page: ft.Page, db, jobs, router=None, outbox=None, on_logout=None):
+        self.page = page
+        self.db = db
+        self.jobs = jobs
+        self.on_logout = on_logout
+        self.router = router or ViewRouter(page)
+        self.outbox = outbox or Outbox(db, jobs)
+        self.archive = Archive()
+        self.student_count = db.count_students()
+        self.draft_timer = None
+        self.saved_draft = None
+        self.init_fields()
+        self.restore_draft()
+        for name in self.STICKY_FIELDS + self.PERSONAL_FIELDS:
+            getattr(self, name).data = name
+            getattr(self, name).on_change = self.on_field_changed
+        self.district.on_change = self.on_district_changed
+        self.municipality.on_blur = self.on_municipality_changed
+        self.update_pickers()
+        self.container = self.build()
+        # منتقي الملفات لاستيراد قوائم المتمدرسين
+        self.file_picker = ft.FilePicker(on_result=self.on_roster_picked)
+        self.page.overlay.append(self.file_picker)
+        # منتقي قواعد بيانات/ملفات تغييرات الأجهزة الأخرى للدمج
+        self.merge_picker = ft.FilePicker(on_result=self.on_merge_picked)
+        self.page.overlay.append(self.merge_picker)
+    
+    def init_fields(self):
+        # القوائم المنسدلة من الجدول المرجعي المحمل في الذاكرة
+        references = self.db.references()
+        self.districts = references.names('district')
+        self.chapters = references.names('chapter')
+        self.groups = references.names('group')
+        self.levels = references.names('level')
+        self.genders = references.names('gender')
+        
+        # حقول الإدخال
+        self.coordinator = ft.TextField(label="المنسق", width=300)
+        self.teacher_name = ft.TextField(label="لقب المعلم", width=300)
+        self.teacher_first_name = ft.TextField(label="اسم المعلم", width=300)
+        self.district = ft.Dropdown(label="الدائرة", width=300, options=[ft.dropdown.Option(d) for d in self.districts])
+        self.municipality = ft.TextField(label="البلدية", width=300)
+        self.school = ft.TextField(label="مؤسسة التدريس", width=300)
+        # قوائم متتالية بالبلديات والمؤسسات المسجلة: اختيار الدائرة يحدد بلدياتها ثم مؤسساتها،
+        # ويبقى الحقل النصي لإدخال قيمة جديدة
+        self.municipality_picker = ft.Dropdown(label="بلدية مسجلة", width=300, on_change=self.on_municipality_picked)
+        self.school_picker = ft.Dropdown(label="مؤسسة مسجلة", width=300, on_change=self.on_school_picked)
+        self.chapter = ft.Dropdown(label="الفصل", width=300, options=[ft.dropdown.Option(c) for c in self.chapters])
+        self.group = ft.Dropdown(label="الفوج", width=300, options=[ft.dropdown.Option(g) for g in self.groups])
+        self.level = ft.Dropdown(label="المستوى", width=300, options=[ft.dropdown.Option(l) for l in self.levels])
+        self.last_name = ft.TextField(label="اللقب", width=300)
+        self.first_name = ft.TextField(label="الاسم", width=300)
+        self.birth_date = ft.TextField(label="تاريخ الميلاد", width=300)
+        self.birth_place = ft.TextField(label="مكان الميلاد", width=300)
+        self.contract_number = ft.TextField(label="رقم العقد", width=300)
+        self.father_name = ft.TextField(label="اسم الأب", width=300)
+        self.mother_last_name = ft.TextField(label="لقب الأم", width=300)
+        self.mother_first_name = ft.TextField(label="اسم الأم", width=300)
+        self.gender = ft.Dropdown(label="الجنس", width=300, options=[ft.dropdown.Option(g) for g in self.genders])
+        
+        # عداد الطلاب
+        self.counter = ft.Text(f"عدد المسجلين: {self.student_count}", size=20)
+        
+        # مؤشر التقدم ورسالة الحالة للعمليات الجارية في الخلفية
+        self.progress = ft.ProgressBar(width=350, visible=False, color=ft.Colors.GREEN)
+        self.status = ft.Text("", size=14, color=ft.Colors.GREY_700)
+    
+    def update_pickers(self):
+        # خيارات البلديات للدائرة المختارة، ومؤسسات البلدية المختارة، من الذاكرة دون استعلام
+        references = self.db.references()
+        district_id = references.id('district', self.district.value)
+        municipalities = references.names('municipality', district_id) if district_id else []
+        municipality_id = references.id('municipality', self.municipality.value, district_id) if district_id else None
+        schools = references.names('school', municipality_id) if municipality_id else []
+        for picker, names, value in ((self.municipality_picker, municipalities, self.municipality.value),
+                                     (self.school_picker, schools, self.school.value)):
+            picker.options = [ft.dropdown.Option(name) for name in names]
+            picker.value = value if value in names else None
+            picker.visible = bool(names)
+
+    def on_field_changed(self, e):
+        self.validate_field(e.control)
+        self.schedule_draft()
+
+    def validate_field(self, field):
+        # تحقق فوري بالقواعد المترجمة مسبقا، وتحديث الحقل وحده عند تغير رسالة الخطأ
+        message = validator.check(field.data, field.value)
+        if (message or '') != (field.error_text or ''):
+            field.error_text = message
+            self.page.update(field)
+
+    def on_district_changed(self, e):
+        self.validate_field(self.district)
+        self.schedule_draft()
+        self.update_pickers()
+        self.page.update(self.municipality_picker, self.school_picker)
+
+    def on_municipality_changed(self, e):
+        self.update_pickers()
+        self.page.update(self.school_picker)
+
+    def on_municipality_picked(self, e):
+        self.municipality.value = self.municipality_picker.value
+        self.school.value = ""
+        self.schedule_draft()
+        self.update_pickers()
+        self.page.update(self.municipality, self.school, self.school_picker)
+
+    def on_school_picked(self, e):
+        self.school.value = self.school_picker.value
+        self.schedule_draft()
+        self.page.update(self.school)
+
+    def calculate_age(self, birth_date):
+        return calculate_age(birth_date)
+    
+    def save_student(self, e):
+        errors = validator.check_all(self.form_values())
+        fields = [getattr(self, name) for name in self.STICKY_FIELDS + self.PERSONAL_FIELDS]
+        for field in fields:
+            field.error_text = errors.get(field.data)
+        if errors:
+            self.page.update(*fields)
+            show_snack_bar(self.page, next(iter(errors.values())))
+            return
+        # تاريخ الميلاد يخزن بصيغة موحدة، والعمر المخزن احتياط فقط (يحسب عند التصدير والإحصاء)
+        birth_date = parse_birth_date(self.birth_date.value)
+        age = self.calculate_age(birth_date)
+        values = (
+            self.coordinator.value, self.teacher_name.value, self.teacher_first_name.value, self.district.value,
+            self.municipality.value, self.school.value, self.chapter.value,
+            self.group.value, self.level.value, self.last_name.value,
+            self.first_name.value, birth_date, self.birth_place.value,
+            self.contract_number.value, self.father_name.value,
+            self.mother_last_name.value, self.mother_first_name.value,
+            self.gender.value, age
+        )
+        self.submit_save(values, check_duplicates=True)
+
+    def submit_save(self, values, check_duplicates):
+        @metrics.timed('save_student')
+        def work():
+            # التحقق من وجود متمدرس(ة) بنفس الأسماء قبل الحفظ، إلا إذا أكد المستخدم
+            if check_duplicates:
+                duplicates = self.db.find_duplicates(
+                    values[STUDENT_COLUMNS.index('last_name')], values[STUDENT_COLUMNS.index('first_name')],
+                    values[STUDENT_COLUMNS.index('father_name')], values[STUDENT_COLUMNS.index('birth_date')]
+                )
+                if duplicates:
+                    return duplicates
+            self.db.insert_student(values)
+            return None
+
+        if not self.jobs.submit('save', work,
+                                on_done=lambda duplicates: self.on_student_saved(values, duplicates),
+                                on_error=self.on_save_failed):
+            show_snack_bar(self.page, "عملية الحفظ جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.save_button, True, "جاري الحفظ...")
+
+    def confirm_duplicate(self, values, duplicates):
+        def close(save):
+            self.page.close(dialog)
+            if save:
+                self.submit_save(values, check_duplicates=False)
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("تكرار محتمل", text_align="right"),
+            content=ft.Column([
+                ft.Text("يوجد متمدرس(ة) مسجل(ة) بأسماء مشابهة:", text_align="right"),
+                *[ft.Text(f"{last or ''} {first or ''} بن {father or '-'} ({birth or '-'}) - {school or '-'}",
+                          text_align="right")
+                  for _, last, first, father, birth, school in duplicates]
+            ], tight=True),
+            actions=[
+                ft.TextButton("حفظ رغم ذلك", on_click=lambda _: close(True)),
+                ft.TextButton("إلغاء", on_click=lambda _: close(False)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
+
+    def on_student_saved(self, values, duplicates):
+        if duplicates:
+            self.set_busy(self.save_button, False)
+            self.confirm_duplicate(values, duplicates)
+            return
+        self.student_count += 1
+        self.counter.value = f"عدد المسجلين: {self.student_count}"
+        self.clear_fields()
+        self.save_draft()
+        self.update_pickers()
+        self.page.update(*(getattr(self, name) for name in self.PERSONAL_FIELDS),
+                         self.municipality_picker, self.school_picker)
+        self.set_busy(self.save_button, False)
+        show_snack_bar(self.page, "تم حفظ بيانات المتمدرس(ة) بنجاح")
+
+    def on_save_failed(self, ex):
+        self.set_busy(self.save_button, False)
+        if isinstance(ex, sqlite3.IntegrityError):
+            show_snack_bar(self.page, "رقم العقد مسجل مسبقا لمتمدرس(ة) آخر")
+        else:
+            show_snack_bar(self.page, f"خطأ في حفظ البيانات: {str(ex)}")
+
+    def set_busy(self, button, busy, message="", progress=None):
+        # progress: None لشريط غير محدد، أو نسبة بين 0 و 1
+        button.disabled = busy
+        self.progress.visible = busy
+        self.progress.value = progress
+        self.status.value = message
+        self.page.update(button, self.progress, self.status, self.counter)
+    
+    def clear_fields(self, keep_context=True):
+        # بعد الحفظ تمسح الحقول الشخصية فقط، ويبقى سياق الفوج للمتمدرس التالي
+        names = self.PERSONAL_FIELDS if keep_context else self.STICKY_FIELDS + self.PERSONAL_FIELDS
+        for name in names:
+            field = getattr(self, name)
+            field.value = None if isinstance(field, ft.Dropdown) else ""
+
+    def clear_context(self, e):
+        self.clear_fields(keep_context=False)
+        self.save_draft()
+        self.update_pickers()
+        self.page.update(*(getattr(self, name) for name in self.STICKY_FIELDS + self.PERSONAL_FIELDS),
+                         self.municipality_picker, self.school_picker)
+
+    def form_values(self):
+        return {name: getattr(self, name).value for name in self.STICKY_FIELDS + self.PERSONAL_FIELDS}
+
+    def on_drop(self):
+        # الخروج: لا مسودة تكتب بعد حذف الشاشة، ومنتقيا الملفات لا يتراكمان في overlay مع كل دخول
+        if self.draft_timer:
+            self.draft_timer.cancel()
+            self.draft_timer = None
+        for picker in (self.file_picker, self.merge_picker):
+            if picker in self.page.overlay:
+                self.page.overlay.remove(picker)
+        self.page.update()
+
+    def schedule_draft(self, e=None):
+        # حفظ المسودة بعد توقف الكتابة بدل الكتابة في قاعدة البيانات مع كل حرف
+        if self.draft_timer:
+            self.draft_timer.cancel()
+        self.draft_timer = threading.Timer(self.DRAFT_DELAY, self.save_draft)
+        self.draft_timer.daemon = True
+        self.draft_timer.start()
+
+    def save_draft(self):
+        if self.draft_timer:
+            self.draft_timer.cancel()
+            self.draft_timer = None
+        draft = json.dumps(self.form_values(), ensure_ascii=False)
+        if draft != self.saved_draft:
+            self.db.set_state('form_draft', draft)
+            self.saved_draft = draft
+
+    def restore_draft(self):
+        # استرجاع الاستمارة كما كانت عند إغلاق التطبيق أو توقفه
+        draft = self.db.get_state('form_draft')
+        if not draft:
+            return
+        try:
+            values = json.loads(draft)
+        except ValueError:
+            return
+        for name in self.STICKY_FIELDS + self.PERSONAL_FIELDS:
+            if values.get(name) is not None:
+                getattr(self, name).value = values[name]
+        self.saved_draft = draft
+    
+    def export_to_excel(self, e):
+        self.start_export(stream_export_xlsx, 'bd_students.xlsx')
+
+    def export_to_csv(self, e):
+        self.start_export(stream_export_csv, 'bd_students.csv')
+
+    def start_export(self, writer, path):
+        self.validate_before_export(lambda: self.submit_export(writer, path))
+
+    def validate_before_export(self, proceed):
+        # تقرير أخطاء كامل الجدول في مرور واحد قبل التصدير؛ التصدير يبدأ مباشرة إن لم توجد أخطاء
+        def work():
+            reader = self.db.open_reader()
+            try:
+                with metrics.timed('validate'):
+                    return validator.report(reader)
+            finally:
+                reader.close()
+
+        def done(report):
+            if not report:
+                proceed()
+                return
+            self.set_busy(self.export_button, False)
+            self.confirm_export(report, proceed)
+
+        if not self.jobs.submit('export', work, on_done=done, on_error=self.on_export_failed):
+            show_snack_bar(self.page, "عملية التصدير جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.export_button, True, "جاري التحقق من البيانات...")
+
+    def confirm_export(self, report, proceed):
+        def close(action):
+            self.page.close(dialog)
+            if action == 'export':
+                proceed()
+            elif action == 'report':
+                self.save_validation_report()
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("أخطاء في البيانات", text_align="right"),
+            content=ft.Column([
+                *[ft.Text(f"{COLUMN_TITLES[column]}: {message} - {count} سجل (مثلا: {', '.join(map(str, ids))})",
+                          text_align="right")
+                  for column, message, count, ids in report]
+            ], tight=True, scroll=ft.ScrollMode.AUTO),
+            actions=[
+                ft.TextButton("تصدير رغم ذلك", on_click=lambda _: close('export')),
+                ft.TextButton("حفظ تقرير الأخطاء", on_click=lambda _: close('report')),
+                ft.TextButton("إلغاء", on_click=lambda _: close(None)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
+
+    def save_validation_report(self):
+        path = 'validation_report.csv'
+
+        def work():
+            reader = self.db.open_reader()
+            try:
+                return write_validation_report(reader, path)
+            finally:
+                reader.close()
+
+        def done(count):
+            self.set_busy(self.export_button, False)
+            show_snack_bar(self.page, f"تم حفظ {count} خطأ في {path}")
+
+        if not self.jobs.submit('export', work, on_done=done, on_error=self.on_export_failed):
+            show_snack_bar(self.page, "عملية التصدير جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.export_button, True, "جاري حفظ تقرير الأخطاء...")
+
+    def submit_export(self, writer, path):
+        if not self.jobs.submit('export', lambda: self.run_export(writer, path),
+                                on_done=self.on_exported, on_error=self.on_export_failed):
+            show_snack_bar(self.page, "عملية التصدير جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.export_button, True, "جاري تصدير البيانات...", progress=0)
+
+    def run_export(self, writer, path):
+        # يعمل في خيط خلفي باتصال قراءة مستقل حتى يبقى الحفظ متاحا أثناء التصدير
+        reader = self.db.open_reader()
+        try:
+            with metrics.timed(f"export{os.path.splitext(path)[1]}"):
+                total = reader.execute("SELECT COUNT(*) FROM students").fetchone()[0]
+
+                def report(count):
+                    self.progress.value = count / total
+                    self.status.value = f"تم تصدير {count} من {total}"
+                    self.page.update(self.progress, self.status)
+
+                return writer(reader, path, progress=report)
+        finally:
+            reader.close()
+
+    def on_exported(self, count):
+        self.set_busy(self.export_button, False)
+        show_snack_bar(self.page, "تم تصدير البيانات بنجاح")
+
+    def on_export_failed(self, ex):
+        self.set_busy(self.export_button, False)
+        show_snack_bar(self.page, f"خطأ في تصدير البيانات: {str(ex)}")
+    
+    def open_split_export(self, e):
+        group_by = ft.RadioGroup(value='district', content=ft.Column([
+            ft.Radio(value='district', label="حسب الدائرة"),
+            ft.Radio(value='school', label="حسب مؤسسة التدريس"),
+        ]))
+        output = ft.RadioGroup(value='files', content=ft.Column([
+            ft.Radio(value='files', label="ملف لكل مجموعة (أرشيف zip)"),
+            ft.Radio(value='sheets', label="ورقة لكل مجموعة في ملف واحد"),
+        ]))
+
+        def close(start):
+            self.page.close(dialog)
+            if start:
+                by, mode = group_by.value, output.value
+                self.validate_before_export(lambda: self.split_export(by, mode))
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("تصدير مقسم", text_align="right"),
+            content=ft.Column([group_by, ft.Divider(), output], tight=True),
+            actions=[
+                ft.TextButton("تصدير", on_click=lambda _: close(True)),
+                ft.TextButton("إلغاء", on_click=lambda _: close(False)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
+
+    def split_export(self, by, mode):
+        path = f"bd_students_{by}." + ('zip' if mode == 'files' else 'xlsx')
+
+        def work():
+            reader = self.db.open_reader()
+            try:
+                return split_export(reader, path, by=by, mode=mode)
+            finally:
+                reader.close()
+
+        if not self.jobs.submit('export', work,
+                                on_done=lambda count: self.on_split_exported(path, count),
+                                on_error=self.on_export_failed):
+            show_snack_bar(self.page, "عملية التصدير جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.export_button, True, "جاري التصدير المقسم...")
+
+    def on_split_exported(self, path, count):
+        self.set_busy(self.export_button, False)
+        show_snack_bar(self.page, f"تم تصدير {count} مجموعة إلى {path}")
+
+    def import_roster(self, e):
+        if self.jobs.is_running('import'):
+            show_snack_bar(self.page, "عملية الاستيراد جارية، الرجاء الانتظار")
+            return
+        self.file_picker.pick_files(
+            dialog_title="اختيار ملف المتمدرسين",
+            allowed_extensions=['xlsx', 'csv'],
+            allow_multiple=False
+        )
+
+    def on_roster_picked(self, e):
+        if not e.files or not e.files[0].path:
+            return
+        path = e.files[0].path
+        if not self.jobs.submit('import', lambda: self.db.import_roster(path),
+                                on_done=self.on_roster_imported, on_error=self.on_import_failed):
+            show_snack_bar(self.page, "عملية الاستيراد جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.import_button, True, "جاري استيراد المتمدرسين...")
+
+    def on_roster_imported(self, inserted):
+        self.student_count += inserted
+        self.counter.value = f"عدد المسجلين: {self.student_count}"
+        self.set_busy(self.import_button, False)
+        show_snack_bar(self.page, f"تم استيراد {inserted} متمدرس(ة) بنجاح")
+
+    def on_import_failed(self, ex):
+        self.set_busy(self.import_button, False)
+        show_snack_bar(self.page, f"خطأ في استيراد البيانات: {str(ex)}")
+
+    def open_backups(self, e):
+        backups = self.db.list_backups()
+        snapshots = ft.RadioGroup(value=backups[0] if backups else None, content=ft.Column([
+            ft.Radio(value=path, label=os.path.basename(path)) for path in backups
+        ]))
+
+        def close(action):
+            self.page.close(dialog)
+            if action == 'backup':
+                self.run_backup()
+            elif action == 'restore' and snapshots.value:
+                self.restore_backup(snapshots.value)
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("النسخ الاحتياطية", text_align="right"),
+            content=ft.Column(
+                [snapshots] if backups else [ft.Text("لا توجد نسخ احتياطية بعد", text_align="right")],
+                tight=True, scroll=ft.ScrollMode.AUTO
+            ),
+            actions=[
+                ft.TextButton("نسخة الآن", on_click=lambda _: close('backup')),
+                ft.TextButton("استرجاع", on_click=lambda _: close('restore'), disabled=not backups),
+                ft.TextButton("إغلاق", on_click=lambda _: close(None)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
+
+    def run_backup(self):
+        if not self.jobs.submit('backup', self.db.backup,
+                                on_done=self.on_backup_done, on_error=self.on_backup_failed):
+            show_snack_bar(self.page, "عملية النسخ الاحتياطي جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.backup_button, True, "جاري إنشاء نسخة احتياطية...")
+
+    def on_backup_done(self, path):
+        self.set_busy(self.backup_button, False)
+        show_snack_bar(self.page, f"تم حفظ النسخة الاحتياطية {os.path.basename(path)}")
+
+    def on_backup_failed(self, ex):
+        self.set_busy(self.backup_button, False)
+        show_snack_bar(self.page, f"خطأ في النسخ الاحتياطي: {str(ex)}")
+
+    def restore_backup(self, path):
+        def work():
+            # نسخة من الحالة الحالية أولا حتى يمكن التراجع عن الاسترجاع، دون أن يحذف تدويرها النسخة المختارة
+            self.db.backup(protect=[path])
+            return self.db.restore(path)
+
+        if not self.jobs.submit('backup', work, on_done=self.on_restored, on_error=self.on_backup_failed):
+            show_snack_bar(self.page, "عملية النسخ الاحتياطي جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.backup_button, True, "جاري استرجاع النسخة الاحتياطية...")
+
+    def on_restored(self, count):
+        self.student_count = count
+        self.counter.value = f"عدد المسجلين: {self.student_count}"
+        self.set_busy(self.backup_button, False)
+        show_snack_bar(self.page, f"تم استرجاع النسخة الاحتياطية ({count} سجل)")
+
+    def prompt_outbox_passwords(self):
+        # بعد الدخول: إرساليات معلقة من جلسة سابقة تنتظر كلمة مرور مرسلها (لا تحفظ في القاعدة)
+        senders = self.outbox.status()['waiting_password']
+        if not senders:
+            return
+        fields = {sender: ft.TextField(label=sender, password=True, text_align="right", width=300)
+                  for sender in senders}
+
+        def close(send):
+            self.page.close(dialog)
+            for sender, field in fields.items():
+                if send and field.value:
+                    self.outbox.unlock(sender, field.value)
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("إرساليات معلقة في صندوق الصادر", text_align="right"),
+            content=ft.Column(
+                [ft.Text("أدخل كلمة مرور البريد لإرسالها الآن", text_align="right"), *fields.values()],
+                tight=True, scroll=ft.ScrollMode.AUTO
+            ),
+            actions=[
+                ft.TextButton("إرسال", on_click=lambda _: close(True)),
+                ft.TextButton("لاحقا", on_click=lambda _: close(False)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
+
+    def open_archive(self, e):
+        # الحملات المنتهية الموجودة في الجدول الحي (الحملة الجارية لا تؤرشف)
+        counts = self.db.campaigns()
+        campaigns = [(campaign, count) for campaign, count in counts
+                     if campaign is not None and campaign < current_campaign()]
+        # سجلات دون حملة (مسجلة قبل إضافة الحملات): تعين لحملة يختارها المستخدم قبل الأرشفة
+        unassigned = dict(counts).get(None, 0)
+        year = ft.Dropdown(label="حملة السجلات دون حملة", width=300, value=str(current_campaign()), options=[
+            ft.dropdown.Option(str(campaign), f"حملة {campaign}/{campaign + 1}")
+            for campaign in range(current_campaign(), current_campaign() - 10, -1)
+        ])
+        choice = ft.RadioGroup(value=str(campaigns[0][0]) if campaigns else None, content=ft.Column([
+            ft.Radio(value=str(campaign), label=f"حملة {campaign}/{campaign + 1} ({count} سجل)")
+            for campaign, count in campaigns
+        ]))
+
+        def close(archive):
+            self.page.close(dialog)
+            if archive and choice.value:
+                self.archive_campaign(int(choice.value))
+
+        def assign(e):
+            count = self.db.assign_campaign(int(year.value))
+            self.page.close(dialog)
+            show_snack_bar(self.page, f"تم تعيين {count} سجل لحملة {year.value}")
+            self.open_archive(e)
+
+        legacy = [
+            ft.Divider(),
+            ft.Text(f"{unassigned} سجل دون حملة (مسجلة قبل تحديث التطبيق)", text_align="right"),
+            year,
+            ft.TextButton("تعيين الحملة", on_click=assign),
+        ] if unassigned else []
+
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("أرشفة حملة منتهية", text_align="right"),
+            content=ft.Column(
+                ([ft.Text("تنقل سجلات الحملة إلى ملفات الأرشيف وتحذف من قاعدة البيانات، "
+                          "وتبقى متاحة في الإحصائيات", text_align="right"), choice]
+                 if campaigns else [ft.Text("لا توجد حملات منتهية للأرشفة", text_align="right")]) + legacy,
+                tight=True, scroll=ft.ScrollMode.AUTO
+            ),
+            actions=[
+                ft.TextButton("أرشفة", on_click=lambda _: close(True), disabled=not campaigns),
+                ft.TextButton("إغلاق", on_click=lambda _: close(False)),
+            ],
+            actions_alignment=ft.MainAxisAlignment.END
         )
+        self.page.open(dialog)
 
-class StudentManagement:
-    def __init__(self, page: ft.Page, db):
-        self.page = page
-        self.db = db
-        self.student_count = 0
-        self.init_fields()
-        self.container = self.build()
-    
-    def init_fields(self):
-        # القوائم المنسدلة
-        self.districts = ["عين جاســر", "عين التوتـة", "آريــس", "بريكـة", "باتنـة", "بوزينـة", "الشمــرة", 
-                         "الجـزار", "المعــذر", "إشمـول", "منعـــة", "مروانـة", "نقـاوس", "أولاد سي سليمان", 
-                         "رأس العيـون", "سقـانــة", "سريانــة", "تازولــت", "ثنيـة العـابـد", "تيمقــاد", "تكـوت"]
-        self.chapters = ["حضري", "شبه حضري", "ريفي"]
-        self.groups = ["1", "2"]
-        self.levels = ["الأول", "الثاني", "الثالث"]
-        self.genders = ["ذكر", "أنثى"]
-        
-        # حقول الإدخال
-        self.coordinator = ft.TextField(label="المنسق", width=300)
-        self.teacher_name = ft.TextField(label="لقب المعلم", width=300)
-        self.teacher_first_name = ft.TextField(label="اسم المعلم", width=300)
-        self.district = ft.Dropdown(label="الدائرة", width=300, options=[ft.dropdown.Option(d) for d in self.districts])
-        self.municipality = ft.TextField(label="البلدية", width=300)
-        self.school = ft.TextField(label="مؤسسة التدريس", width=300)
-        self.chapter = ft.Dropdown(label="الفصل", width=300, options=[ft.dropdown.Option(c) for c in self.chapters])
-        self.group = ft.Dropdown(label="الفوج", width=300, options=[ft.dropdown.Option(g) for g in self.groups])
-        self.level = ft.Dropdown(label="المستوى", width=300, options=[ft.dropdown.Option(l) for l in self.levels])
-        self.last_name = ft.TextField(label="اللقب", width=300)
-        self.first_name = ft.TextField(label="الاسم", width=300)
-        self.birth_date = ft.TextField(label="تاريخ الميلاد", width=300)
-        self.birth_place = ft.TextField(label="مكان الميلاد", width=300)
-        self.contract_number = ft.TextField(label="رقم العقد", width=300)
-        self.father_name = ft.TextField(label="اسم الأب", width=300)
-        self.mother_last_name = ft.TextField(label="لقب الأم", width=300)
-        self.mother_first_name = ft.TextField(label="اسم الأم", width=300)
-        self.gender = ft.Dropdown(label="الجنس", width=300, options=[ft.dropdown.Option(g) for g in self.genders])
-        
-        # عداد الطلاب
-        self.counter = ft.Text(f"عدد المسجلين: {self.student_count}", size=20)
-    
-    def calculate_age(self, birth_date):
-        try:
-            if len(birth_date) == 4:  # سنة فقط
-                return datetime.now().year - int(birth_date)
-            else:  # تاريخ كامل
-                birth = datetime.strptime(birth_date, '%Y-%m-%d')
-                return (datetime.now() - birth).days // 365
-        except:
-            return 0
-    
-    def save_student(self, e):
-        try:
-            age = self.calculate_age(self.birth_date.value)
-            cursor = self.db.conn.cursor()
-            cursor.execute('''
-                INSERT INTO students (coordinator, teacher_name, teacher_first_name, district, municipality, school,
-                                    chapter, group_number, level, last_name, first_name,
-                                    birth_date, birth_place, contract_number, father_name,
-                                    mother_last_name, mother_first_name, gender, age)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                self.coordinator.value, self.teacher_name.value, self.teacher_first_name.value, self.district.value,
-                self.municipality.value, self.school.value, self.chapter.value,
-                self.group.value, self.level.value, self.last_name.value,
-                self.first_name.value, self.birth_date.value, self.birth_place.value,
-                self.contract_number.value, self.father_name.value,
-                self.mother_last_name.value, self.mother_first_name.value,
-                self.gender.value, age
-            ))
-            self.db.conn.commit()
-            self.student_count += 1
-            self.counter.value = f"عدد المسجلين: {self.student_count}"
-            self.page.snack_bar = ft.SnackBar(content=ft.Text("تم حفظ بيانات المتمدرس(ة) بنجاح"))
-            self.page.snack_bar.open = True
-            self.clear_fields()
-            self.page.update()
-        except Exception as ex:
-            self.page.snack_bar = ft.SnackBar(content=ft.Text(f"خطأ في حفظ البيانات: {str(ex)}"))
-            self.page.snack_bar.open = True
-            self.page.update()
-    
-    def clear_fields(self):
-        for field in [self.coordinator, self.teacher_name, self.teacher_first_name, self.municipality, self.school,
-                     self.last_name, self.first_name, self.birth_date, self.birth_place,
-                     self.contract_number, self.father_name, self.mother_last_name,
-                     self.mother_first_name]:
-            field.value = ""
-        self.district.value = None
-        self.chapter.value = None
-        self.group.value = None
-        self.level.value = None
-        self.gender.value = None
-    
-    def export_to_excel(self, e):
-        try:
-            # تعريف أسماء الأعمدة بالعربية
-            arabic_columns = {
-                'coordinator': 'المنسق',
-                'teacher_name': 'لقب المعلم',
-                'teacher_first_name': 'اسم المعلم',
-                'district': 'الدائرة',
-                'municipality': 'البلدية',
-                'school': 'مؤسسة التدريس',
-                'chapter': 'الفصل',
-                'group_number': 'الفوج',
-                'level': 'المستوى',
-                'last_name': 'اللقب',
-                'first_name': 'الاسم',
-                'birth_date': 'تاريخ الميلاد',
-                'birth_place': 'مكان الميلاد',
-                'contract_number': 'رقم العقد',
-                'father_name': 'اسم الأب',
-                'mother_last_name': 'لقب الأم',
-                'mother_first_name': 'اسم الأم',
-                'gender': 'الجنس',
-                'age': 'العمر'
-            }
-            
-            df = pd.read_sql_query("SELECT * FROM students", self.db.conn)
-            # تغيير أسماء الأعمدة إلى العربية
-            df = df.rename(columns=arabic_columns)
-            
-            # تصدير إلى Excel مع تعيين اتجاه الصفحة من اليمين إلى اليسار
-            with pd.ExcelWriter('bd_students.xlsx', engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='البيانات')
-                # تعيين اتجاه الورقة من اليمين إلى اليسار
-                writer.sheets['البيانات'].sheet_view.rightToLeft = True
-            
-            self.page.snack_bar = ft.SnackBar(content=ft.Text("تم تصدير البيانات إلى ملف Excel بنجاح"))
-            self.page.snack_bar.open = True
-            self.page.update()
-        except Exception as ex:
-            self.page.snack_bar = ft.SnackBar(content=ft.Text(f"خطأ في تصدير البيانات: {str(ex)}"))
-            self.page.snack_bar.open = True
-            self.page.update()
+    def archive_campaign(self, campaign):
+        if not self.jobs.submit('archive', lambda: self.db.archive_campaign(campaign, self.archive),
+                                on_done=lambda count: self.on_archived(campaign, count),
+                                on_error=self.on_archive_failed):
+            show_snack_bar(self.page, "عملية الأرشفة جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.archive_button, True, f"جاري أرشفة حملة {campaign}...")
+
+    def on_archived(self, campaign, count):
+        self.student_count -= count
+        self.counter.value = f"عدد المسجلين: {self.student_count}"
+        self.set_busy(self.archive_button, False)
+        show_snack_bar(self.page, f"تمت أرشفة {count} سجل من حملة {campaign}/{campaign + 1}")
+
+    def on_archive_failed(self, ex):
+        self.set_busy(self.archive_button, False)
+        show_snack_bar(self.page, f"خطأ في الأرشفة: {str(ex)}")
+
+    def merge_devices(self, e):
+        if self.jobs.is_running('merge'):
+            show_snack_bar(self.page, "عملية الدمج جارية، الرجاء الانتظار")
+            return
+        self.merge_picker.pick_files(
+            dialog_title="اختيار قواعد بيانات الأجهزة أو ملفات التغييرات",
+            allowed_extensions=['db', 'xlsx', 'csv', 'zip'],
+            allow_multiple=True
+        )
+
+    def on_merge_picked(self, e):
+        paths = [f.path for f in e.files or [] if f.path]
+        if not paths:
+            return
+        if not self.jobs.submit('merge', lambda: self.db.merge_files(paths),
+                                on_done=self.on_merged, on_error=self.on_merge_failed):
+            show_snack_bar(self.page, "عملية الدمج جارية، الرجاء الانتظار")
+            return
+        self.set_busy(self.merge_button, True, "جاري دمج بيانات الأجهزة...")
+
+    def on_merged(self, result):
+        merged, files = result
+        self.student_count = self.db.count_students()
+        self.counter.value = f"عدد المسجلين: {self.student_count}"
+        self.set_busy(self.merge_button, False)
+        show_snack_bar(self.page, f"تم دمج {merged} سجل(ا) من {files} ملف(ات)")
+
+    def on_merge_failed(self, ex):
+        self.set_busy(self.merge_button, False)
+        show_snack_bar(self.page, f"خطأ في دمج البيانات: {str(ex)}")
     
     def open_email_page(self, e):
-        email_page = EmailPage(self.page, self.db, lambda: self.show_main_page())
-        self.page.clean()
-        self.page.add(email_page.container)
-        self.page.update()
+        self.router.show('email', lambda: EmailPage(self.page, self.db, self.jobs, self.show_main_page, self.outbox))
+
+    def open_stats_page(self, e):
+        self.router.show('stats', lambda: StatsPage(self.page, self.db, self.jobs, self.show_main_page, self.archive))
+
+    def open_list_page(self, e):
+        self.router.show('list', lambda: StudentListPage(self.page, self.db, self.jobs, self.show_main_page))
+
+    def open_diagnostics_page(self, e):
+        self.router.show('diagnostics', lambda: DiagnosticsPage(self.page, self.show_main_page))
 
     def show_main_page(self):
-        self.page.clean()
-        self.page.add(self.container)
-        self.page.update()
+        self.router.show('main', lambda: self)
+
+    def logout(self, e):
+        self.save_draft()
+        self.db.end_session()
+        if self.on_logout:
+            self.on_logout()
+
+    def open_users(self, e):
+        user = self.db.user
+        is_admin = user is not None and user['role'] == 'admin'
+        current_password = ft.TextField(label="كلمة المرور الحالية", password=True, width=300)
+        new_password = ft.TextField(label="كلمة المرور الجديدة", password=True, width=300)
+        username = ft.TextField(label="اسم المستخدم الجديد", width=300)
+        password = ft.TextField(label="كلمة مروره", password=True, width=300)
+        role = ft.Dropdown(label="الصلاحية", width=300, value='operator', options=[
+            ft.dropdown.Option('operator', "مدخل بيانات"), ft.dropdown.Option('admin', "مسؤول"),
+        ])
+
+        def close(action):
+            if action == 'password':
+                if not (new_password.value or '').strip():
+                    show_snack_bar(self.page, "أدخل كلمة المرور الجديدة")
+                    return
+                if not self.db.check_password(user['id'], current_password.value):
+                    show_snack_bar(self.page, "كلمة المرور الحالية غير صحيحة")
+                    return
+                self.db.set_password(user['id'], new_password.value)
+                user['must_change_password'] = 0
+                show_snack_bar(self.page, "تم تغيير كلمة المرور")
+            elif action == 'add':
+                if not (username.value or '').strip() or not password.value:
+                    show_snack_bar(self.page, "أدخل اسم المستخدم وكلمة مروره")
+                    return
+                try:
+                    self.db.create_user(username.value, password.value, role.value)
+                except sqlite3.IntegrityError:
+                    show_snack_bar(self.page, "اسم المستخدم مسجل مسبقا")
+                    return
+                show_snack_bar(self.page, f"تمت إضافة المستخدم {username.value.strip()}")
+            self.page.close(dialog)
+
+        def toggle_active(e):
+            self.db.set_user_active(e.control.data, e.control.value)
+            show_snack_bar(self.page, "تم تفعيل المستخدم" if e.control.value else "تم تعطيل المستخدم")
+
+        controls = [ft.Text(f"المستخدم الحالي: {user['username'] if user else '-'}", text_align="right"),
+                    current_password, new_password]
+        actions = [ft.TextButton("تغيير كلمة المرور", on_click=lambda _: close('password'), disabled=user is None)]
+        if is_admin:
+            controls += [
+                ft.Divider(),
+                # المسؤول يعطل المستخدمين أو يعيد تفعيلهم، إلا نفسه
+                *[ft.Row([
+                    ft.Text(f"{name} ({'مسؤول' if user_role == 'admin' else 'مدخل بيانات'})", text_align="right",
+                            expand=True),
+                    ft.Switch(value=bool(active), data=user_id, disabled=user_id == user['id'],
+                              on_change=toggle_active),
+                ]) for user_id, name, user_role, active, _ in self.db.list_users()],
+                username, password, role,
+            ]
+            actions.append(ft.TextButton("إضافة مستخدم", on_click=lambda _: close('add')))
+        actions.append(ft.TextButton("إغلاق", on_click=lambda _: close(None)))
+        dialog = ft.AlertDialog(
+            modal=True,
+            title=ft.Text("المستخدمون", text_align="right"),
+            content=ft.Column(controls, tight=True, scroll=ft.ScrollMode.AUTO),
+            actions=actions,
+            actions_alignment=ft.MainAxisAlignment.END
+        )
+        self.page.open(dialog)
     
     def build(self):
         # تقسيم الحقول إلى أعمدة
         fields = [
             self.coordinator, self.teacher_name, self.teacher_first_name, 
-            self.district, self.municipality, self.school, 
+            self.district, self.municipality_picker, self.municipality, self.school_picker, self.school, 
             self.chapter, self.group, self.level, 
             self.last_name, self.first_name, self.birth_date, 
             self.birth_place, self.contract_number, 
@@ -364,9 +3667,16 @@ class StudentManagement:
                 field.focused_border_color = ft.Colors.GREEN_900
                 field.width = 350
         
+        # بدء فوج جديد: مسح حقول السياق الثابتة أيضا
+        new_group_button = ft.TextButton(
+            "فوج جديد (مسح بيانات المعلم والمؤسسة)",
+            icon=ft.Icons.GROUP_ADD,
+            on_click=self.clear_context
+        )
+        
         # تنظيم الحقول في عمود واحد
         fields_column = ft.Column(
-            controls=fields,
+            controls=[new_group_button] + fields,
             spacing=10,
             scroll=ft.ScrollMode.AUTO,
             horizontal_alignment=ft.CrossAxisAlignment.CENTER
@@ -377,7 +3687,7 @@ class StudentManagement:
         self.counter.weight = ft.FontWeight.BOLD
         
         # الأزرار
-        save_button = ft.ElevatedButton(
+        self.save_button = ft.ElevatedButton(
             "حفظ",
             on_click=self.save_student,
             style=ft.ButtonStyle(
@@ -390,7 +3700,7 @@ class StudentManagement:
             width=350
         )
         
-        export_button = ft.ElevatedButton(
+        self.export_button = ft.ElevatedButton(
             "تصدير إلى Excel",
             on_click=self.export_to_excel,
             style=ft.ButtonStyle(
@@ -403,6 +3713,88 @@ class StudentManagement:
             width=350
         )
         
+        csv_button = ft.ElevatedButton(
+            "تصدير إلى CSV",
+            on_click=self.export_to_csv,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.BLUE,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        split_button = ft.ElevatedButton(
+            "تصدير مقسم حسب الدائرة/المؤسسة",
+            on_click=self.open_split_export,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.BLUE,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        self.import_button = ft.ElevatedButton(
+            "استيراد من Excel/CSV",
+            on_click=self.import_roster,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.TEAL,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        self.merge_button = ft.ElevatedButton(
+            "دمج بيانات الأجهزة",
+            on_click=self.merge_devices,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.TEAL,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        self.backup_button = ft.ElevatedButton(
+            "النسخ الاحتياطية",
+            on_click=self.open_backups,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.BLUE_GREY,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        # الأرشفة تحتاج المكتبة الاختيارية pyarrow
+        archive_available = Archive.available()
+        self.archive_button = ft.ElevatedButton(
+            "أرشفة حملة",
+            on_click=self.open_archive,
+            disabled=not archive_available,
+            tooltip=None if archive_available else "الأرشفة تحتاج المكتبة pyarrow (pip install pyarrow)",
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.BROWN,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
         email_button = ft.ElevatedButton(
             "إرسال عبر البريد الإلكتروني",
             on_click=self.open_email_page,
@@ -416,9 +3808,76 @@ class StudentManagement:
             width=350
         )
         
+        stats_button = ft.ElevatedButton(
+            "الإحصائيات",
+            on_click=self.open_stats_page,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.PURPLE,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        list_button = ft.ElevatedButton(
+            "قائمة المتمدرسين",
+            on_click=self.open_list_page,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.INDIGO,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        diagnostics_button = ft.ElevatedButton(
+            "التشخيص",
+            on_click=self.open_diagnostics_page,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.GREY,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        users_button = ft.ElevatedButton(
+            "المستخدمون",
+            on_click=self.open_users,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.CYAN,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
+        logout_button = ft.ElevatedButton(
+            "تسجيل الخروج" + (f" ({self.db.user['username']})" if self.db.user else ""),
+            on_click=self.logout,
+            style=ft.ButtonStyle(
+                color=ft.Colors.WHITE,
+                bgcolor=ft.Colors.RED,
+                padding=15,
+                shape=ft.RoundedRectangleBorder(radius=10),
+                animation_duration=500
+            ),
+            width=350
+        )
+        
         # تنظيم الأزرار في عمود
         buttons_row = ft.Column(
-            controls=[save_button, export_button, email_button],
+            controls=[self.save_button, self.export_button, csv_button, split_button, self.import_button,
+                      self.merge_button, self.backup_button, self.archive_button, email_button, stats_button,
+                      list_button, diagnostics_button, users_button, logout_button],
             alignment=ft.MainAxisAlignment.CENTER,
             spacing=20
         )
@@ -435,6 +3894,8 @@ class StudentManagement:
                     ),
                     self.counter,
                     fields_column,
+                    self.progress,
+                    self.status,
                     buttons_row
                 ],
                 spacing=20,
@@ -453,8 +3914,9 @@ class StudentManagement:
         )
 
 class LoginPage:
-    def __init__(self, page: ft.Page, on_login_success):
+    def __init__(self, page: ft.Page, db, on_login_success):
         self.page = page
+        self.db = db
         self.on_login_success = on_login_success
         self.username = ft.TextField(
             label="اسم المستخدم",
@@ -482,7 +3944,7 @@ class LoginPage:
     def toggle_password_visibility(self, e):
         self.password.password = not self.password.password
         self.password.suffix_icon.icon = ft.Icons.VISIBILITY if self.password.password else ft.Icons.VISIBILITY_OFF
-        self.page.update()
+        self.page.update(self.password)
 
     def build(self):
         return ft.Container(
@@ -525,10 +3987,109 @@ class LoginPage:
         )
     
     def login_clicked(self, e):
-        if self.username.value == "admin" and self.password.value == "admin":
-            self.on_login_success()
-        else:
-            self.page.show_snack_bar(ft.SnackBar(content=ft.Text("خطأ في اسم المستخدم أو كلمة المرور")))
+        user = self.db.authenticate(self.username.value, self.password.value)
+        if user is None:
+            show_snack_bar(self.page, "خطأ في اسم المستخدم أو كلمة المرور")
+            return
+        self.db.start_session(user)
+        self.password.value = ""
+        self.on_login_success()
+
+class PasswordChangePage:
+    # تغيير إجباري لكلمة المرور (الحساب الافتراضي admin/admin) قبل عرض الشاشة الرئيسية
+    def __init__(self, page: ft.Page, db, on_changed, on_logout):
+        self.page = page
+        self.db = db
+        self.on_changed = on_changed
+        self.on_logout = on_logout
+        self.new_password = ft.TextField(
+            label="كلمة المرور الجديدة",
+            password=True,
+            text_align="right",
+            width=300,
+            border_color=ft.Colors.BLUE_400,
+            focused_border_color=ft.Colors.BLUE_600,
+            prefix_icon=ft.Icons.LOCK
+        )
+        self.confirm_password = ft.TextField(
+            label="تأكيد كلمة المرور",
+            password=True,
+            text_align="right",
+            width=300,
+            border_color=ft.Colors.BLUE_400,
+            focused_border_color=ft.Colors.BLUE_600,
+            prefix_icon=ft.Icons.LOCK,
+            on_submit=self.save_clicked
+        )
+        self.container = self.build()
+
+    def save_clicked(self, e):
+        user = self.db.user
+        if not (self.new_password.value or '').strip():
+            show_snack_bar(self.page, "أدخل كلمة المرور الجديدة")
+            return
+        if self.new_password.value != self.confirm_password.value:
+            show_snack_bar(self.page, "كلمتا المرور غير متطابقتين")
+            return
+        if self.db.check_password(user['id'], self.new_password.value):
+            show_snack_bar(self.page, "اختر كلمة مرور مختلفة عن الحالية")
+            return
+        self.db.set_password(user['id'], self.new_password.value)
+        user['must_change_password'] = 0
+        self.new_password.value = self.confirm_password.value = ""
+        show_snack_bar(self.page, "تم تغيير كلمة المرور")
+        self.on_changed()
+
+    def logout_clicked(self, e):
+        self.db.end_session()
+        self.on_logout()
+
+    def build(self):
+        return ft.Container(
+            content=ft.Column(
+                controls=[
+                    ft.Text(
+                        "تغيير كلمة المرور",
+                        size=30,
+                        text_align="right",
+                        weight=ft.FontWeight.BOLD,
+                        color=ft.Colors.BLUE_900
+                    ),
+                    ft.Text(
+                        "يجب تغيير كلمة المرور قبل المتابعة",
+                        size=16,
+                        color=ft.Colors.GREY_700,
+                        text_align="right"
+                    ),
+                    self.new_password,
+                    self.confirm_password,
+                    ft.ElevatedButton(
+                        "حفظ",
+                        on_click=self.save_clicked,
+                        style=ft.ButtonStyle(
+                            color=ft.Colors.WHITE,
+                            bgcolor=ft.Colors.BLUE_400,
+                            padding=15,
+                            shape=ft.RoundedRectangleBorder(radius=10)
+                        ),
+                        width=300
+                    ),
+                    ft.TextButton("تسجيل الخروج", on_click=self.logout_clicked)
+                ],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
+                spacing=20
+            ),
+            padding=30,
+            border_radius=10,
+            bgcolor=ft.Colors.WHITE,
+            shadow=ft.BoxShadow(
+                spread_radius=1,
+                blur_radius=15,
+                color=ft.Colors.BLUE_GREY_100,
+                offset=ft.Offset(0, 0)
+            ),
+            alignment=ft.alignment.center
+        )
 
 class IntroPage:
     def __init__(self, page: ft.Page, on_intro_complete):
@@ -538,7 +4099,6 @@ class IntroPage:
     
     def welcome_clicked(self, e):
         self.on_intro_complete()
-        self.page.update()
     
     def build(self):
         return ft.Container(
@@ -636,6 +4196,11 @@ class IntroPage:
         )
 
 def main(page: ft.Page):
+    startup = StartupTimer()
+    startup.mark('imports', IMPORTS_DONE)
+    # ONAEA_PROFILE=1: تحليل cProfile لكل الجلسة، يحفظ عند تعطيله من شاشة التشخيص
+    if os.environ.get('ONAEA_PROFILE'):
+        metrics.start_profile()
     page.title = 'الديوان الوطني لمحو الأمية و تعليم الكبار'
     page.scroll = 'auto'
     page.window.top = 1
@@ -647,20 +4212,59 @@ def main(page: ft.Page):
     page.window_bgcolor = ft.Colors.WHITE
     page.padding = 10
     
-    db = Database()
+    # فتح قاعدة البيانات في الخلفية أثناء عرض صفحة Intro
+    jobs = BackgroundJobs()
+
+    def open_database():
+        db = Database()
+        db.bootstrap_admin()
+        return db
+
+    database = jobs.executor.submit(open_database)
+    database.add_done_callback(lambda _: startup.mark('database_ready'))
+    
+    # كل شاشة تبنى مرة واحدة، والتنقل يبدل ظهورها فقط
+    router = ViewRouter(page)
+    
+    services = {}
     
     def on_login_success():
-        page.clean()
-        student_management = StudentManagement(page, db)
-        page.add(student_management.container)
+        # كلمة مرور افتراضية: تغييرها إجباري قبل الشاشة الرئيسية (عند الدخول وعند استئناف الجلسة)
+        if database.result().user['must_change_password']:
+            router.show('password', lambda: PasswordChangePage(page, database.result(), on_login_success, on_logout))
+            router.drop('intro', 'login')
+            return
+        if not services:
+            # نسخ احتياطي دوري في الخلفية طوال تشغيل التطبيق
+            BackupScheduler(database.result(), jobs).start()
+            # صندوق الصادر مشترك حتى تستمر الإرساليات بعد مغادرة صفحة البريد
+            services['outbox'] = Outbox(database.result(), jobs)
+        view = router.show('main', lambda: StudentManagement(page, database.result(), jobs, router, services['outbox'],
+                                                             on_logout=on_logout))
+        # المقدمة وتسجيل الدخول وتغيير كلمة المرور لا يعاد عرضها
+        router.drop('intro', 'login', 'password')
+        startup.mark('main_page_shown')
+        startup.report()
+        view.prompt_outbox_passwords()
+    
+    def on_logout():
+        # شاشات المستخدم السابق تبنى من جديد للمستخدم التالي
+        if services:
+            services['outbox'].forget()
+        router.show('login', lambda: LoginPage(page, database.result(), on_login_success))
+        router.drop(*[name for name in router.views if name != 'login'])
     
     def show_login_page():
-        page.clean()
-        login_page = LoginPage(page, on_login_success)
-        page.add(login_page.container)
+        # جلسة سارية على الجهاز: الدخول مباشرة دون إعادة التحقق من كلمة المرور
+        if database.result().resume_session():
+            on_login_success()
+            return
+        router.show('login', lambda: LoginPage(page, database.result(), on_login_success))
+        startup.mark('login_shown')
     
     # عرض صفحة Intro أولاً
-    intro_page = IntroPage(page, show_login_page)
-    page.add(intro_page.container)
+    router.show('intro', lambda: IntroPage(page, show_login_page))
+    startup.mark('intro_shown')
 
-ft.app(target=main)
\ No newline at end of file
+if __name__ == '__main__':
+    ft.app(target=main)
\ No newline at end of file
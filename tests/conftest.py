@@ -0,0 +1,73 @@
+import os
+import socketserver
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+def student(**values):
+    # صف بترتيب STUDENT_COLUMNS، الحقول غير المذكورة فارغة
+    defaults = {'last_name': 'بن علي', 'first_name': 'أحمد', 'birth_date': '1980-01-01', 'district': 'باتنة'}
+    defaults.update(values)
+    return tuple(defaults.get(column, '') for column in main.STUDENT_COLUMNS)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # قاعدة جديدة في مجلد مؤقت (النسخ الاحتياطية وسجل التشخيص تكتب فيه أيضا)
+    monkeypatch.chdir(tmp_path)
+    database = main.Database(str(tmp_path / 'eleves.db'))
+    yield database
+    database.conn.close()
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    # خادم SMTP محلي بسيط: يقبل كل شيء إلا الردود المبرمجة في server.replies (الأمر -> قائمة ردود)
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply("220 localhost")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line.decode('ascii').split(' ', 1)[0].strip().upper()
+            replies = self.server.replies.get(verb)
+            if replies:
+                self.reply(replies.pop(0))
+            elif verb == 'EHLO':
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN")
+            elif verb == 'AUTH':
+                self.reply("235 2.7.0 accepted")
+            elif verb == 'DATA':
+                self.reply("354 end with <CRLF>.<CRLF>")
+                lines = []
+                while (line := self.rfile.readline()) != b'.\r\n':
+                    lines.append(line)
+                self.server.messages.append(b''.join(lines))
+                self.reply("250 2.0.0 queued")
+            elif verb == 'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeSMTPHandler)
+    server.daemon_threads = True
+    server.replies = {}
+    server.messages = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
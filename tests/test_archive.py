@@ -0,0 +1,82 @@
+import importlib.util
+
+import pytest
+
+import main
+from conftest import student
+
+
+def legacy_database(path, *rows):
+    # قاعدة بالمخطط الأول (دون أعمدة الحملة والمزامنة)
+    legacy = main.sqlite3.connect(str(path))
+    legacy.execute(f"CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(main.STUDENT_COLUMNS)})")
+    legacy.executemany(f"INSERT INTO students ({', '.join(main.STUDENT_COLUMNS)}) "
+                       f"VALUES ({', '.join('?' * len(main.STUDENT_COLUMNS))})", rows)
+    legacy.commit()
+    legacy.close()
+
+
+def test_legacy_records_have_no_campaign_until_assigned(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    legacy_database(tmp_path / 'eleves.db', student(contract_number='1'), student(contract_number='2'))
+    db = main.Database(str(tmp_path / 'eleves.db'))
+    db.insert_student(student(contract_number='3'))
+
+    assert db.campaigns() == [(None, 2), (main.current_campaign(), 1)]
+    assert db.assign_campaign(main.current_campaign() - 3) == 2
+    assert db.campaigns() == [(main.current_campaign() - 3, 2), (main.current_campaign(), 1)]
+    assert db.assign_campaign(main.current_campaign() - 3) == 0
+    db.conn.close()
+
+
+def test_assigned_legacy_records_can_be_archived(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    monkeypatch.chdir(tmp_path)
+    legacy_database(tmp_path / 'eleves.db', student(contract_number='1'), student(contract_number='2'))
+    db = main.Database(str(tmp_path / 'eleves.db'))
+    campaign = main.current_campaign() - 1
+    db.assign_campaign(campaign)
+    archive = main.Archive(str(tmp_path / 'archive'))
+
+    assert db.archive_campaign(campaign, archive) == 2
+    assert db.count_students() == 0
+    assert archive.statistics(campaign)['total'] == 2
+    db.conn.close()
+
+
+def test_archive_availability_follows_pyarrow():
+    assert main.Archive.available() == (importlib.util.find_spec('pyarrow') is not None)
+
+
+def test_change_numbers_keep_growing_after_archive(db, tmp_path):
+    # أرشفة الحملة السابقة تحذف السجلات ذات أكبر أرقام التغيير؛ السجلات الجديدة ترسل رغم ذلك
+    pytest.importorskip('pyarrow')
+    campaign = main.current_campaign() - 1
+    for number in range(5):
+        db.insert_student(student(contract_number=str(number)))
+    db.conn.execute("UPDATE students SET campaign = ?", (campaign,))
+    db.conn.commit()
+    db.set_state('email_sequence:b@x', str(db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]))
+    outbox = main.Outbox(db, None)
+    watermark = outbox.watermark('b@x')
+
+    assert db.archive_campaign(campaign, main.Archive(str(tmp_path / 'archive'))) == 5
+    db.insert_student(student(contract_number='10'))
+
+    until = db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+    assert until > watermark
+    attachment, filename, count = main.build_attachment(db.conn, True, watermark, until)
+    attachment.close()
+    assert count == 1
+
+
+def test_change_counter_survives_reopen(db):
+    db.insert_student(student(contract_number='1'))
+    db.insert_student(student(contract_number='2'))
+    last = db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+    db.conn.execute("DELETE FROM students")
+    db.conn.commit()
+    reopened = main.Database(db.path)
+    reopened.insert_student(student(contract_number='3'))
+    assert reopened.conn.execute("SELECT change_seq FROM students").fetchone()[0] > last
+    reopened.conn.close()
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+import main
+from conftest import student
+
+
+def test_restore_brings_back_snapshot(db, tmp_path):
+    db.insert_student(student(contract_number='1'))
+    snapshot = db.backup(str(tmp_path / 'backups'))
+    db.insert_student(student(first_name='محمد', contract_number='2'))
+    assert db.count_students() == 2
+
+    assert db.restore(snapshot) == 1
+    assert db.get_by_contract('1') is not None
+    assert db.get_by_contract('2') is None
+
+
+def test_restore_oldest_of_kept_snapshots(db, tmp_path):
+    directory = str(tmp_path / 'backups')
+    db.insert_student(student(contract_number='1'))
+    first = db.backup(directory)
+    # BACKUP_KEEP نسخة، أقدمها هي المختارة للاسترجاع
+    names = [os.path.join(directory, f"{main.BACKUP_PREFIX}202601{day:02d}-000000.db.gz")
+             for day in range(1, main.BACKUP_KEEP + 1)]
+    for name in names:
+        shutil.copy(first, name)
+    os.remove(first)
+    oldest = names[0]
+    db.insert_student(student(first_name='محمد', contract_number='2'))
+
+    # نفس خطوات StudentManagement.restore_backup: نسخة من الحالة الحالية ثم الاسترجاع
+    db.backup(directory, protect=[oldest])
+    assert os.path.exists(oldest)
+    assert db.restore(oldest) == 1
+    assert len(db.list_backups(directory)) == main.BACKUP_KEEP + 1
+
+    # التدوير التالي يعود إلى حذف الأقدم
+    db.backup(directory)
+    assert not os.path.exists(oldest)
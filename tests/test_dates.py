@@ -0,0 +1,70 @@
+import csv
+from datetime import datetime
+
+import main
+from conftest import student
+
+
+def test_parse_birth_date_formats():
+    assert main.parse_birth_date('1990-03-15') == '1990-03-15'
+    assert main.parse_birth_date('15/03/1990') == '1990-03-15'
+    assert main.parse_birth_date('15-03-1990') == '1990-03-15'
+    assert main.parse_birth_date('1990/03/15') == '1990-03-15'
+    assert main.parse_birth_date(' 1990-03-15 00:00:00 ') == '1990-03-15'
+    assert main.parse_birth_date('1990') == '1990'
+    for invalid in (None, '', 'غير معروف', '31/02/1990', '1850', '1850-01-01'):
+        assert main.parse_birth_date(invalid) is None
+
+
+def test_future_dates_follow_the_current_day(monkeypatch):
+    # الجزء المخزن مؤقتا لا يقارن بتاريخ اليوم: تاريخ رفض أمس يقبل بعد حلوله
+    class Today(datetime):
+        now_value = datetime(2030, 6, 1)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.now_value
+    monkeypatch.setattr(main, 'datetime', Today)
+
+    assert main.parse_birth_date('2030-06-02') is None
+    assert main.parse_birth_date('2031') is None
+    Today.now_value = datetime(2031, 1, 1)
+    assert main.parse_birth_date('2030-06-02') == '2030-06-02'
+    assert main.parse_birth_date('2031') == '2031'
+
+
+def test_age_sql(db):
+    today = datetime.now()
+    db.insert_students([
+        student(contract_number='1', birth_date=f'{today.year - 30}-01-01', age=99),
+        student(contract_number='2', birth_date=str(today.year - 40)),
+        student(contract_number='3', birth_date='غير معروف', age=25),
+        student(contract_number='4', birth_date='غير معروف', age=''),
+    ])
+    ages = dict(db.conn.execute(f"SELECT contract_number, {main.AGE_SQL} FROM students"))
+
+    # العمر من تاريخ الميلاد الموحد، والعمر المخزن احتياط للتواريخ غير الصالحة فقط
+    assert ages == {'1': 30, '2': 40, '3': 25, '4': None}
+
+
+def test_import_normalizes_birth_dates(db, tmp_path):
+    path = str(tmp_path / 'roster.csv')
+    with open(path, 'w', encoding='utf-8-sig', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow([main.COLUMN_TITLES[column] for column in ('last_name', 'first_name', 'birth_date', 'contract_number')])
+        writer.writerow(['بن علي', 'أحمد', '15/03/1990', '1'])
+        writer.writerow(['بن علي', 'محمد', 'غير معروف', '2'])
+
+    assert db.import_roster(path) == 2
+    assert db.get_by_contract('1')['birth_date'] == '1990-03-15'
+    assert db.get_by_contract('2')['birth_date'] == 'غير معروف'
+
+
+def test_merge_normalizes_birth_dates(db, tmp_path):
+    other = main.Database(str(tmp_path / 'other.db'))
+    other.insert_student(student(contract_number='1', birth_date='15/03/1990'))
+    other.conn.close()
+
+    assert db.merge_database(str(tmp_path / 'other.db')) == 1
+    assert db.get_by_contract('1')['birth_date'] == '1990-03-15'
+    assert db.conn.execute("SELECT birth_iso FROM students").fetchone()[0] == '1990-03-15'
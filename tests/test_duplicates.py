@@ -0,0 +1,25 @@
+from conftest import student
+
+
+def test_record_without_names_is_computed_once(db):
+    # مفتاح مفقود يخزن '' فلا يعاد حساب السجل عند كل إدراج مجمع لاحق
+    db.insert_students([student(last_name='', first_name='', contract_number='10')])
+    assert db.conn.execute("SELECT name_key FROM students").fetchone()[0] == ''
+
+    with db.transaction() as conn:
+        conn.execute("DROP TRIGGER IF EXISTS temp.trg_test_name_key")
+        conn.execute("CREATE TEMP TABLE computed (id)")
+        conn.execute("CREATE TEMP TRIGGER trg_test_name_key AFTER UPDATE OF name_key ON main.students "
+                     "BEGIN INSERT INTO computed VALUES (NEW.id); END")
+    db.insert_students([student(contract_number='11')])
+    assert [row[0] for row in db.conn.execute("SELECT id FROM computed")] == [2]
+
+
+def test_duplicates_ignore_records_without_names(db):
+    db.insert_student(student(last_name='', first_name='', contract_number='10'))
+    db.insert_student(student(last_name='', first_name='', contract_number='11'))
+    db.insert_student(student(contract_number='12'))
+    db.insert_student(student(first_name='أحمـد', contract_number='13'))
+
+    assert [row[0] for row in db.find_duplicates('بن علي', 'احمد', '', '1980')] == [3, 4]
+    assert db.find_duplicates('', '', '', '') == []
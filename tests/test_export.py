@@ -0,0 +1,54 @@
+import csv
+import zipfile
+
+import pytest
+
+import main
+from conftest import student
+
+
+@pytest.fixture
+def exported(db):
+    db.insert_students([student(contract_number=str(number), school='مدرسة الأمل') for number in range(1, 4)])
+    return db
+
+
+def test_xlsx_export_writes_titles_and_rows_to_an_rtl_sheet(exported, tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    path = str(tmp_path / 'students.xlsx')
+    progress = []
+
+    assert main.stream_export_xlsx(exported.conn, path, chunk_size=2, progress=progress.append) == 3
+    assert progress == [2, 3]
+
+    workbook = openpyxl.load_workbook(path)
+    assert workbook.sheetnames == ['البيانات']
+    sheet = workbook['البيانات']
+    assert sheet.sheet_view.rightToLeft
+    rows = list(sheet.iter_rows(values_only=True))
+    assert list(rows[0]) == [main.COLUMN_TITLES.get(column, column) for column in main.EXPORT_COLUMNS]
+    contract = main.EXPORT_COLUMNS.index('contract_number')
+    assert [row[contract] for row in rows[1:]] == ['1', '2', '3']
+
+
+def test_csv_export_starts_with_a_bom_and_titles(exported, tmp_path):
+    path = str(tmp_path / 'students.csv')
+
+    assert main.stream_export_csv(exported.conn, path, chunk_size=2) == 3
+    with open(path, 'rb') as handle:
+        assert handle.read(3) == b'\xef\xbb\xbf'
+    with open(path, encoding='utf-8-sig', newline='') as handle:
+        rows = list(csv.reader(handle))
+    assert rows[0] == [main.COLUMN_TITLES.get(column, column) for column in main.EXPORT_COLUMNS]
+    contract = main.EXPORT_COLUMNS.index('contract_number')
+    assert [row[contract] for row in rows[1:]] == ['1', '2', '3']
+
+
+def test_zipped_csv_export_matches_the_plain_one(exported, tmp_path):
+    plain = str(tmp_path / 'students.csv')
+    zipped = str(tmp_path / 'students.zip')
+    main.stream_export_csv(exported.conn, plain)
+
+    assert main.stream_export_csv_zip(exported.conn, zipped, 'students.csv') == 3
+    with zipfile.ZipFile(zipped) as archive, open(plain, 'rb') as handle:
+        assert archive.read('students.csv') == handle.read()
@@ -0,0 +1,19 @@
+import threading
+
+import main
+
+
+def test_save_does_not_wait_behind_long_jobs():
+    jobs = main.BackgroundJobs()
+    release = threading.Event()
+    saved = threading.Event()
+    try:
+        # مجمع العمليات الطويلة ممتلئ (تصدير وإرسال)
+        assert jobs.submit('export', release.wait)
+        assert jobs.submit('email', release.wait)
+        assert jobs.submit('save', lambda: 'saved', on_done=lambda _: saved.set())
+        assert saved.wait(5)
+        assert not jobs.submit('export', release.wait)
+    finally:
+        release.set()
+        jobs.shutdown()
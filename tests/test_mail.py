@@ -0,0 +1,76 @@
+import email
+import io
+import smtplib
+import socket
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+import main
+
+
+def service(smtp_server, sleeps, **options):
+    host, port = smtp_server.server_address
+    return main.MailService('a@x', 'secret', host, port, use_tls=False, sleep=sleeps.append, **options)
+
+
+def received(data):
+    # إزالة مضاعفة النقطة كما يفعل الخادم (RFC 5321) ثم تحليل الرسالة
+    return email.message_from_bytes(b''.join(line[1:] if line.startswith(b'..') else line
+                                             for line in data.splitlines(keepends=True)))
+
+
+def test_transient_reply_is_retried(smtp_server):
+    sleeps = []
+    smtp_server.replies['MAIL'] = ["451 4.3.0 try again later"]
+    with service(smtp_server, sleeps, retries=2, backoff=2.0) as mail:
+        mail.send(MIMEText("body"), ['b@x'])
+    assert sleeps == [2.0]
+    assert len(smtp_server.messages) == 1
+
+
+def test_refused_connection_is_transient():
+    sleeps = []
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    mail = main.MailService('a@x', 'secret', '127.0.0.1', port, use_tls=False, retries=2, backoff=1.0,
+                            sleep=sleeps.append)
+    with pytest.raises(OSError):
+        mail.send(MIMEText("body"), ['b@x'])
+    assert sleeps == [1.0, 2.0]
+
+
+@pytest.mark.parametrize('verb, reply, error', [
+    ('MAIL', "550 5.1.0 sender rejected", smtplib.SMTPSenderRefused),
+    ('AUTH', "535 5.7.8 bad credentials", smtplib.SMTPAuthenticationError),
+])
+def test_permanent_reply_is_not_retried(smtp_server, verb, reply, error):
+    sleeps = []
+    smtp_server.replies[verb] = [reply]
+    with service(smtp_server, sleeps, retries=3) as mail:
+        with pytest.raises(error):
+            mail.send(MIMEText("body"), ['b@x'])
+    assert sleeps == []
+    assert smtp_server.messages == []
+
+
+def test_streamed_message_round_trips_leading_dots(smtp_server):
+    # أسطر تبدأ بنقطة قبل المرفق وبعده، ومرفق أكبر من دفعة واحدة
+    payload = bytes(range(256)) * 600
+    msg = MIMEMultipart()
+    msg.attach(MIMEText(".first\n..second\n.\nlast", 'plain'))
+    part = MIMEBase('application', 'octet-stream')
+    part.add_header('Content-Disposition', 'attachment; filename=data.bin')
+    msg.attach(part)
+    msg.attach(MIMEText(".after the attachment", 'plain'))
+
+    with service(smtp_server, []) as mail:
+        mail.send(main.StreamedMessage(msg, part, io.BytesIO(payload)), ['b@x'])
+
+    body, attachment, after = received(smtp_server.messages[0]).get_payload()
+    assert body.get_payload() == ".first\n..second\n.\nlast".replace('\n', '\r\n')
+    assert attachment.get_payload(decode=True) == payload
+    assert after.get_payload().rstrip('\r\n') == ".after the attachment"
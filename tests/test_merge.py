@@ -0,0 +1,84 @@
+import os
+
+import main
+from conftest import student
+
+
+def other_device(tmp_path, *rows):
+    # قاعدة جهاز آخر بصفوفه الخاصة
+    other = main.Database(str(tmp_path / 'other.db'))
+    for row in rows:
+        other.insert_student(row)
+    return other
+
+
+def test_new_records_keep_their_sync_ids(db, tmp_path):
+    other = other_device(tmp_path, student(contract_number='10'))
+    uuid, device_id = other.conn.execute("SELECT uuid, device_id FROM students").fetchone()
+    other.conn.close()
+
+    assert db.merge_database(str(tmp_path / 'other.db')) == 1
+    assert db.conn.execute("SELECT uuid, device_id, operator_id FROM students").fetchone() == (uuid, device_id, 0)
+
+
+def test_known_record_takes_the_newer_version(db, tmp_path):
+    db.insert_student(student(contract_number='10', birth_place='باتنة'))
+    uuid = db.conn.execute("SELECT uuid FROM students").fetchone()[0]
+    other = other_device(tmp_path)
+    other.conn.execute("INSERT INTO students (uuid, last_name, first_name, contract_number, birth_place, updated_at) "
+                       "VALUES (?, 'بن علي', 'أحمد', '10', 'أريس', '2000-01-01 00:00:00.000')", (uuid,))
+    other.conn.commit()
+
+    # نسخة المصدر أقدم: لا تغيير
+    assert db.merge_database(str(tmp_path / 'other.db')) == 0
+    assert db.get_by_contract('10')['birth_place'] == 'باتنة'
+
+    other.conn.execute("UPDATE students SET birth_place = 'أريس', updated_at = '2999-01-01 00:00:00.000'")
+    other.conn.commit()
+    assert db.merge_database(str(tmp_path / 'other.db')) == 1
+    assert db.get_by_contract('10')['birth_place'] == 'أريس'
+    assert db.count_students() == 1
+
+
+def test_contract_number_taken_by_another_record_is_skipped(db, tmp_path):
+    db.insert_student(student(contract_number='10'))
+    other = other_device(tmp_path, student(first_name='محمد', contract_number='10'),
+                         student(first_name='علي', contract_number='11'))
+    other.conn.close()
+
+    assert db.merge_database(str(tmp_path / 'other.db')) == 1
+    assert db.get_by_contract('10')['first_name'] == 'أحمد'
+    assert db.get_by_contract('11') is not None
+
+
+def test_merged_records_get_a_local_change_number(db, tmp_path):
+    # سجل قديم من جهاز آخر يصل بعد آخر إرسال: رقم تغييره المحلي بعد العلامة فيرسل في الدفعة التالية
+    other = other_device(tmp_path, student(contract_number='20'))
+    other.conn.execute("UPDATE students SET updated_at = '2000-01-01 00:00:00.000'")
+    other.conn.commit()
+    other.conn.close()
+    db.insert_student(student(contract_number='10'))
+    watermark = db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+
+    db.merge_database(str(tmp_path / 'other.db'))
+    row = db.conn.execute("SELECT updated_at, change_seq FROM students WHERE contract_number = '20'").fetchone()
+    assert row[0] == '2000-01-01 00:00:00.000'
+    assert row[1] > watermark
+
+
+def test_source_database_is_not_modified(db, tmp_path):
+    # قاعدة بالمخطط القديم (دون أعمدة المزامنة): الدمج يرحّل نسخة مؤقتة لا الملف المختار
+    path = tmp_path / 'legacy.db'
+    legacy = main.sqlite3.connect(str(path))
+    legacy.execute(f"CREATE TABLE students (id INTEGER PRIMARY KEY, {', '.join(main.STUDENT_COLUMNS)})")
+    legacy.execute(f"INSERT INTO students ({', '.join(main.STUDENT_COLUMNS)}) "
+                   f"VALUES ({', '.join('?' * len(main.STUDENT_COLUMNS))})", student(contract_number='30'))
+    legacy.commit()
+    legacy.close()
+    content = path.read_bytes()
+    files = sorted(os.listdir(tmp_path))
+
+    assert db.merge_database(str(path)) == 1
+    assert db.get_by_contract('30') is not None
+    assert path.read_bytes() == content
+    assert sorted(os.listdir(tmp_path)) == files
@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+import main
+from conftest import student
+
+
+@pytest.fixture
+def outbox(db, smtp_server):
+    jobs = main.BackgroundJobs()
+    host, port = smtp_server.server_address
+    box = main.Outbox(db, jobs, backoff=30, max_delay=100,
+                      mail_factory=lambda sender, password: main.MailService(sender, password, host, port,
+                                                                            use_tls=False, retries=0))
+    yield box
+    box.forget()
+    jobs.executor.shutdown(wait=True)
+
+
+def outbox_row(db):
+    return db.conn.execute('''
+    SELECT id, sender, recipients, delta, attempts, status,
+           CAST(ROUND((julianday(next_attempt_at) - julianday('now')) * 86400) AS INTEGER)
+    FROM outbox''').fetchone()
+
+
+def test_queue_outbox_is_idempotent(db):
+    assert db.queue_outbox('a@x', ['c@x', 'b@x'], True)
+    assert not db.queue_outbox('a@x', ['b@x', 'c@x'], True)
+    assert db.queue_outbox('a@x', ['b@x', 'c@x'], False)
+    assert db.outbox_status()['pending'] == 2
+
+
+def test_transient_failure_backs_off_then_delivers(db, outbox, smtp_server):
+    db.insert_student(student(contract_number='1'))
+    db.queue_outbox('a@x', ['b@x'], True)
+    outbox.passwords['a@x'] = 'secret'
+    smtp_server.replies['MAIL'] = ["421 4.7.0 try again later"] * 3
+
+    # تأخير مضاعف عند كل فشل مؤقت، في حدود max_delay
+    for delay in (30, 60, 100):
+        assert outbox.deliver(*outbox_row(db)[:5]) == 0
+        assert outbox_row(db)[5:] == ('pending', delay)
+    assert db.due_outbox() == []
+
+    assert outbox.deliver(*outbox_row(db)[:5]) == 1
+    assert outbox_row(db)[4:6] == (4, 'sent')
+    assert len(smtp_server.messages) == 1
+    assert outbox.watermark('b@x') == db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+
+
+def test_permanent_failure_asks_for_the_password_again(db, outbox, smtp_server):
+    db.insert_student(student(contract_number='1'))
+    db.queue_outbox('a@x', ['b@x'], True)
+    outbox.passwords['a@x'] = 'secret'
+    smtp_server.replies['AUTH'] = ["535 5.7.8 bad credentials"]
+
+    assert outbox.deliver(*outbox_row(db)[:5]) == 0
+    assert outbox_row(db)[5] == 'failed'
+    assert 'a@x' not in outbox.passwords
+    assert outbox.watermark('b@x') == 0
+
+
+def test_unlock_drains_items_from_a_previous_session(db, outbox, smtp_server):
+    # إرسالية بقيت في الصندوق بعد إغلاق التطبيق: كلمة المرور غير معروفة حتى تدخل من جديد
+    db.insert_student(student(contract_number='1'))
+    db.queue_outbox('a@x', ['b@x'], False)
+    assert outbox.status()['waiting_password'] == ['a@x']
+
+    outbox.unlock('a@x', 'secret')
+    for _ in range(100):
+        if outbox.status()['sent']:
+            break
+        time.sleep(0.05)
+    assert outbox.status()['sent'] == 1
+    assert len(smtp_server.messages) == 1
+
+
+def test_refused_recipient_keeps_its_watermark(db, outbox, smtp_server):
+    db.insert_student(student(contract_number='1'))
+    db.queue_outbox('a@x', ['b@x', 'c@x'], True)
+    outbox.passwords['a@x'] = 'secret'
+    smtp_server.replies['RCPT'] = ["250 ok", "550 5.1.1 no such user"]
+
+    assert outbox.deliver(*outbox_row(db)[:5]) == 1
+    assert outbox_row(db)[5] == 'sent'
+    assert outbox.watermark('b@x') == db.conn.execute("SELECT MAX(change_seq) FROM students").fetchone()[0]
+    # السجلات تعاد إلى المستلم المرفوض في الإرسال التالي
+    assert outbox.watermark('c@x') == 0
+    assert 'c@x: 550' in db.conn.execute("SELECT last_error FROM outbox").fetchone()[0]
+
+
+def test_forget_drops_passwords_and_connections(db, outbox, smtp_server):
+    db.insert_student(student(contract_number='1'))
+    db.queue_outbox('a@x', ['b@x'], True)
+    outbox.passwords['a@x'] = 'secret'
+    assert outbox.deliver(*outbox_row(db)[:5]) == 1
+    assert outbox.services['a@x'].server is not None
+    service = outbox.services['a@x']
+    outbox.listeners.append(lambda: None)
+
+    outbox.forget()
+    assert outbox.passwords == {} and outbox.services == {} and outbox.listeners == []
+    assert service.server is None
+
+    # إرسالية جديدة بعد الخروج تنتظر كلمة المرور بدل أن ترسل بكلمة المستخدم السابق
+    db.insert_student(student(contract_number='2'))
+    db.queue_outbox('a@x', ['b@x'], True)
+    assert outbox.status()['waiting_password'] == ['a@x']
+    assert outbox.drain() == 0
@@ -0,0 +1,61 @@
+from conftest import student
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_pages_follow_the_last_id(db):
+    db.insert_students([student(contract_number=str(number)) for number in range(1, 8)])
+
+    first = db.page_students(0, limit=3)
+    second = db.page_students(first[-1][0], limit=3)
+    last = db.page_students(second[-1][0], limit=3)
+    assert ids(first + second + last) == list(range(1, 8))
+    assert db.page_students(last[-1][0], limit=3) == []
+
+
+def test_search_matches_each_field_by_prefix(db):
+    db.insert_students([
+        student(contract_number='100', last_name='بوزيد', first_name='علي', school='مدرسة الأمل'),
+        student(contract_number='200', last_name='علوي', first_name='سعيد', school='مدرسة النور'),
+        student(contract_number='101', last_name='سعدي', first_name='مراد', school='مدرسة النور'),
+        student(contract_number='', last_name='مرابط', first_name='يوسف', school='مدرسة الأمل'),
+    ])
+
+    assert ids(db.page_students(0, 'عل')) == [1, 2]
+    assert ids(db.page_students(0, 'سع')) == [2, 3]
+    assert ids(db.page_students(0, '10')) == [1, 3]
+    assert ids(db.page_students(0, 'مدرسة الأ')) == [1, 4]
+    assert ids(db.page_students(0, 'مر')) == [3, 4]
+    assert db.page_students(0, 'غير') == []
+
+
+def test_search_pages_and_filters_by_operator(db):
+    db.insert_students([student(contract_number=str(number), last_name='بوزيد') for number in range(1, 6)])
+    db.insert_student(student(contract_number='9', last_name='سعدي'))
+    db.conn.execute("UPDATE students SET operator_id = 7 WHERE id IN (2, 4, 6)")
+    db.conn.commit()
+
+    first = db.page_students(0, 'بو', limit=2)
+    assert ids(first) == [1, 2]
+    assert ids(db.page_students(first[-1][0], 'بو', limit=2)) == [3, 4]
+    assert ids(db.page_students(4, 'بو', limit=2)) == [5]
+    assert ids(db.page_students(0, 'بو', operator_id=7)) == [2, 4]
+    assert ids(db.page_students(0, None, operator_id=7)) == [2, 4, 6]
+
+
+def test_search_uses_the_field_indexes(db):
+    # مع إحصائيات ANALYZE يفضل المخطط مسح الجدول بترتيب id لو لم تفرض الفهارس
+    db.insert_students([student(contract_number=str(number), last_name=f'بن {number}') for number in range(200)])
+    db.conn.execute("ANALYZE")
+    sql = []
+    db.conn.set_trace_callback(sql.append)
+    db.page_students(0, 'بو')
+    db.conn.set_trace_callback(None)
+
+    plan = ' '.join(row[3] for row in db.conn.execute("EXPLAIN QUERY PLAN " + sql[-1]))
+    for index in ('idx_students_last_name', 'idx_students_first_name', 'uq_students_contract_number',
+                  'idx_students_school_id'):
+        assert index in plan
+    assert 'SCAN students' not in plan
@@ -0,0 +1,65 @@
+import main
+from conftest import student
+
+
+def reference_ids(db, contract_number):
+    columns = ', '.join(f"{kind}_id" for kind, column, parent in main.REFERENCE_KINDS)
+    return db.conn.execute(f"SELECT {columns} FROM students WHERE contract_number = ?", (contract_number,)).fetchone()
+
+
+def test_single_save_resolves_references_without_pending_pass(db, monkeypatch):
+    row = dict(district='باتنة', municipality='أريس', school='مدرسة الأمل', level='المستوى الأول', gender='ذكر')
+    db.insert_students([student(contract_number='1', **row)])
+
+    def fill_references(cursor):
+        raise AssertionError("fill_references called for a single save")
+    monkeypatch.setattr(db, 'fill_references', fill_references)
+
+    db.insert_student(student(contract_number='2', **row))
+    assert reference_ids(db, '2') == reference_ids(db, '1')
+
+
+def test_single_save_adds_new_values_under_their_parent(db):
+    db.insert_student(student(contract_number='1', district='باتنة', municipality=' تيمقاد ', school='مدرسة النور'))
+    references = db.references()
+    district_id = references.id('district', 'باتنة')
+    municipality_id = references.id('municipality', 'تيمقاد', district_id)
+
+    assert municipality_id and references.names('school', municipality_id) == ['مدرسة النور']
+    assert reference_ids(db, '1')[:3] == (district_id, municipality_id, references.id('school', 'مدرسة النور',
+                                                                                       municipality_id))
+    assert reference_ids(db, '1')[3:] == (0, 0, 0, 0)
+
+
+def test_filters_use_reference_ids(db):
+    db.insert_student(student(contract_number='1', district='باتنة', school='مدرسة الأمل'))
+    db.insert_student(student(contract_number='2', district='باتنة', school='مدرسة النور'))
+    db.insert_students([student(contract_number='3', district='أريس', school='مدرسة الأمل')])
+
+    assert db.count_students(district='باتنة') == 2
+    assert [row['contract_number'] for row in db.find_students(school='مدرسة الأمل')] == ['1', '3']
+    assert db.count_students(district='باتنة', school='مدرسة الأمل') == 1
+    assert db.count_students(district='غير موجودة') == 0
+
+
+def test_municipality_filter_uses_its_index(db):
+    db.insert_student(student(contract_number='1', district='باتنة', municipality='باتنة'))
+    db.insert_student(student(contract_number='2', district='أريس', municipality='أريس'))
+    where, params = db._where({'municipality': 'أريس'})
+
+    plan = ' '.join(row[3] for row in db.conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM students{where}", params))
+    assert 'idx_students_municipality_id' in plan
+    assert db.count_students(municipality='أريس') == 1
+
+
+def test_split_export_groups_by_reference(db, tmp_path):
+    from openpyxl import load_workbook
+    db.insert_student(student(contract_number='1', district='باتنة'))
+    db.insert_student(student(contract_number='2', district='أريس'))
+    db.insert_student(student(contract_number='3', district='باتنة '))
+
+    path = str(tmp_path / 'split.xlsx')
+    assert main.split_export(db.conn, path, mode='sheets') == 2
+    workbook = load_workbook(path)
+    sizes = {sheet.title: sheet.max_row - 1 for sheet in workbook.worksheets}
+    assert sizes == {'باتنة': 2, 'أريس': 1}
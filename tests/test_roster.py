@@ -0,0 +1,78 @@
+import csv
+from datetime import datetime
+
+import pytest
+
+import main
+
+COLUMNS = ('last_name', 'first_name', 'birth_date', 'contract_number')
+
+
+def roster_record(**values):
+    # صف كما يعيده read_roster: الحقول غير الموجودة في الملف None
+    return tuple(values.get(column) for column in main.STUDENT_COLUMNS)
+
+
+def write_csv(path, header, rows, delimiter=','):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as handle:
+        writer = csv.writer(handle, delimiter=delimiter)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_headers_map_by_arabic_title_or_column_name(tmp_path):
+    # عنوان عربي أو اسم العمود نفسه، بأي ترتيب، والأعمدة غير المعروفة تتجاهل
+    path = write_csv(tmp_path / 'roster.csv',
+                     ['ملاحظات', 'contract_number', main.COLUMN_TITLES['first_name'], ' اللقب '],
+                     [['-', '7', 'أحمد', 'بن علي']], delimiter=';')
+
+    assert list(main.read_roster(path)) == [
+        roster_record(last_name='بن علي', first_name='أحمد', contract_number='7', notes=None)
+    ]
+
+
+def test_unknown_headers_are_rejected(tmp_path):
+    path = write_csv(tmp_path / 'roster.csv', ['a', 'b'], [['1', '2']])
+    with pytest.raises(ValueError):
+        list(main.read_roster(path))
+
+
+def test_blank_rows_are_skipped(tmp_path):
+    path = write_csv(tmp_path / 'roster.csv', [main.COLUMN_TITLES[column] for column in COLUMNS],
+                     [['بن علي', 'أحمد', '', '1'], ['', '', '', ''], ['  ', '', '', ''], ['سعدي', 'مراد', '', '2']])
+
+    assert [row[main.STUDENT_COLUMNS.index('contract_number')] for row in main.read_roster(path)] == ['1', '2']
+
+
+def test_xlsx_and_csv_give_the_same_rows(tmp_path):
+    openpyxl = pytest.importorskip('openpyxl')
+    header = [main.COLUMN_TITLES[column] for column in COLUMNS]
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'ملخص'
+    sheet = workbook.create_sheet('البيانات')
+    sheet.append(header)
+    # خلايا Excel: تاريخ ورقم عشري بدل النصوص
+    sheet.append(['بن علي', 'أحمد', datetime(1990, 3, 15), 12.0])
+    sheet.append([None, None, None, None])
+    workbook.save(tmp_path / 'roster.xlsx')
+    csv_path = write_csv(tmp_path / 'roster.csv', header, [['بن علي', 'أحمد', '15/03/1990', '12']])
+
+    rows = list(main.read_roster(str(tmp_path / 'roster.xlsx')))
+    assert rows == list(main.read_roster(csv_path))
+    assert rows[0][main.STUDENT_COLUMNS.index('birth_date')] == '1990-03-15'
+    assert rows[0][main.STUDENT_COLUMNS.index('contract_number')] == '12'
+
+
+def test_reimport_skips_rows_without_contract_number(db, tmp_path):
+    path = write_csv(tmp_path / 'roster.csv', [main.COLUMN_TITLES[column] for column in COLUMNS], [
+        ['بن علي', 'أحمد', '1990-03-15', ''],
+        ['بن على', 'أحمد', '1990-03-15', ''],
+        ['بن علي', 'أحمد', '1991-01-01', ''],
+        ['سعدي', 'مراد', '1985-01-01', '5'],
+    ])
+
+    # الصف الثاني نفس الأول بعد توحيد الأسماء
+    assert db.import_roster(path) == 3
+    assert db.import_roster(path) == 0
+    assert db.count_students() == 3
@@ -0,0 +1,79 @@
+import pytest
+
+import main
+from conftest import student
+
+
+@pytest.fixture
+def users(db):
+    # أدنى كلفة scrypt حتى لا تعاير الاختبارات الجهاز
+    db.set_state('scrypt_n', str(main.SCRYPT_MIN_N))
+    return db
+
+
+def test_unknown_username_is_verified_against_a_dummy_hash(users, monkeypatch):
+    users.create_user('operator', 'secret')
+    checked = []
+    verify = main.verify_password
+
+    def verify_password(password, stored):
+        checked.append(stored)
+        return verify(password, stored)
+    monkeypatch.setattr(main, 'verify_password', verify_password)
+
+    assert users.authenticate('nobody', 'secret') is None
+    assert users.authenticate('operator', 'wrong') is None
+    assert users.authenticate('operator', 'secret')['username'] == 'operator'
+    # نفس كلفة scrypt في الحالات الثلاث
+    assert [stored.split('$')[1] for stored in checked] == [str(main.SCRYPT_MIN_N)] * 3
+    assert checked[0] == main.dummy_password_hash(main.SCRYPT_MIN_N)
+
+
+def test_check_password(users):
+    user_id = users.create_user('operator', 'secret')
+
+    assert users.check_password(user_id, 'secret')
+    assert not users.check_password(user_id, 'wrong')
+    assert not users.check_password(user_id + 1, 'secret')
+
+
+def test_deactivated_user_cannot_log_in_or_resume(users):
+    user_id = users.create_user('operator', 'secret')
+    users.start_session(users.authenticate('operator', 'secret'))
+
+    users.set_user_active(user_id, False)
+    assert users.authenticate('operator', 'secret') is None
+    assert users.resume_session() is None
+    assert not users.check_password(user_id, 'secret')
+
+    users.set_user_active(user_id, True)
+    assert users.authenticate('operator', 'secret')['id'] == user_id
+
+
+def test_default_admin_must_change_password_until_changed(users):
+    assert users.bootstrap_admin()
+    admin = users.authenticate('admin', 'admin')
+    users.start_session(admin)
+    assert admin['must_change_password']
+    assert users.resume_session()['must_change_password']
+
+    users.set_password(admin['id'], 'n3w')
+    assert not users.resume_session()['must_change_password']
+    assert users.authenticate('admin', 'admin') is None
+    assert not users.bootstrap_admin()
+
+
+def test_restore_keeps_current_users_and_session(users, tmp_path):
+    first = users.create_user('first', 'secret')
+    users.start_session(users.authenticate('first', 'secret'))
+    snapshot = users.backup(str(tmp_path / 'backups'))
+
+    second = users.create_user('second', 'secret')
+    users.set_user_active(first, False)
+    users.start_session(users.authenticate('second', 'secret'))
+    users.restore(snapshot)
+
+    assert users.authenticate('first', 'secret') is None
+    assert users.resume_session()['id'] == second
+    users.insert_student(student(contract_number='1'))
+    assert users.conn.execute("SELECT operator_id FROM students").fetchone()[0] == second
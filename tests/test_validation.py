@@ -0,0 +1,27 @@
+import pytest
+
+import main
+from conftest import student
+
+# قيم حدية لكل نوع قاعدة: مسافات وعلامات جدولة، أرقام عربية، تواريخ غير موجودة أو في المستقبل
+VALUES = {
+    'required': [None, '', ' ', '\t', ' \n', 'باتنة', ' باتنة '],
+    'name': ['', 'أحمد', 'أحمد2', 'أحمد ٣', ' أحمد '],
+    'digits': ['', ' ', '123', ' 123 ', '\t123', '12a', '١٢٣', '12 3'],
+    'date': ['', ' ', '\t', '1990', ' 1990 ', '15/03/1990', '31/02/1990', '2999-01-01', '1850', 'غير معروف'],
+}
+
+
+@pytest.mark.parametrize('rule', main.VALIDATION_RULES, ids=lambda rule: f"{rule[0]}-{rule[1]}")
+def test_field_check_matches_sql_report(db, rule):
+    # التحقق الفوري (حقل بحقل) والتقرير الدفعي (SQL) يخالفان نفس الصفوف لكل قاعدة
+    column, kind, message = rule
+    values = VALUES[kind]
+    db.insert_students([student(**{column: value}) for value in values])
+    single = main.Validator([rule])
+
+    expected = [number for number, value in enumerate(values, 1) if single.check(column, value) == message]
+    flagged = [row[0] for row in single.errors(db.conn)]
+    assert flagged == expected
+    report = single.report(db.conn, samples=len(values))
+    assert [(row[2], row[3]) for row in report] == ([(len(expected), expected)] if expected else [])